@@ -46,11 +46,11 @@ from nova.api.ec2 import ec2utils
 from nova.compute import instance_types
 from nova.compute import vm_states
 from nova.image import s3
+from nova.servicegroup import api as servicegroup
 
 
 FLAGS = flags.FLAGS
 flags.DECLARE('dhcp_domain', 'nova.network.manager')
-flags.DECLARE('service_down_time', 'nova.scheduler.driver')
 
 LOG = logging.getLogger("nova.api.ec2.cloud")
 
@@ -271,19 +271,19 @@ class CloudController(object):
                                         'zoneState': 'available'}]}
 
         services = db.service_get_all(context, False)
-        now = utils.utcnow()
         hosts = []
         for host in [service['host'] for service in services]:
             if not host in hosts:
                 hosts.append(host)
+        alive_services = dict(zip([service['id'] for service in services],
+                                  servicegroup.are_up(context, services)))
         for host in hosts:
             rv['availabilityZoneInfo'].append({'zoneName': '|- %s' % host,
                                                'zoneState': ''})
             hsvcs = [service for service in services \
                      if service['host'] == host]
             for svc in hsvcs:
-                delta = now - (svc['updated_at'] or svc['created_at'])
-                alive = (delta.seconds <= FLAGS.service_down_time)
+                alive = alive_services[svc['id']]
                 art = (alive and ":-)") or "XXX"
                 active = 'enabled'
                 if svc['disabled']:
@@ -943,18 +943,20 @@ class CloudController(object):
                 'status': volume['attach_status'],
                 'volumeId': ec2utils.id_to_ec2_vol_id(volume_id)}
 
-    def _format_kernel_id(self, context, instance_ref, result, key):
+    def _format_kernel_id(self, context, instance_ref, result, key,
+                          image_ids=None):
         kernel_uuid = instance_ref['kernel_id']
         if kernel_uuid is None or kernel_uuid == '':
             return
-        kernel_id = self._get_image_id(context, kernel_uuid)
+        kernel_id = self._get_image_id(context, kernel_uuid, image_ids)
         result[key] = ec2utils.image_ec2_id(kernel_id, 'aki')
 
-    def _format_ramdisk_id(self, context, instance_ref, result, key):
+    def _format_ramdisk_id(self, context, instance_ref, result, key,
+                           image_ids=None):
         ramdisk_uuid = instance_ref['ramdisk_id']
         if ramdisk_uuid is None or ramdisk_uuid == '':
             return
-        ramdisk_id = self._get_image_id(context, ramdisk_uuid)
+        ramdisk_id = self._get_image_id(context, ramdisk_uuid, image_ids)
         result[key] = ec2utils.image_ec2_id(ramdisk_id, 'ari')
 
     def describe_instance_attribute(self, context, instance_id, attribute,
@@ -1051,12 +1053,18 @@ class CloudController(object):
         return i[0]
 
     def _format_instance_bdm(self, context, instance_id, root_device_name,
-                             result):
-        """Format InstanceBlockDeviceMappingResponseItemType"""
+                             result, bdms=None, volumes=None):
+        """Format InstanceBlockDeviceMappingResponseItemType
+
+        bdms and volumes (a dict of volumes by id) may be prefetched by
+        the caller; otherwise they are looked up here.
+        """
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_id):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_id)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1066,7 +1074,10 @@ class CloudController(object):
                 assert not bdm['virtual_name']
                 root_device_type = 'ebs'
 
-            vol = self.volume_api.get(context, volume_id=volume_id)
+            if volumes and volume_id in volumes:
+                vol = volumes[volume_id]
+            else:
+                vol = self.volume_api.get(context, volume_id=volume_id)
             LOG.debug(_("vol = %s\n"), vol)
             # TODO(yamahata): volume attach time
             ebs = {'volumeId': volume_id,
@@ -1127,19 +1138,30 @@ class CloudController(object):
                                                      search_opts=search_opts)
             except exception.NotFound:
                 instances = []
+        if not context.is_admin:
+            vpn_image_id = str(FLAGS.vpn_image_id)
+            instances = [instance for instance in instances
+                         if instance['image_ref'] != vpn_image_id]
+
+        # Look up everything the instances refer to up front, so the
+        # number of queries doesn't grow with the number of instances.
+        image_ids = self._get_instance_image_ids(context, instances)
+        instance_bdms = self._get_instance_bdms(context, instances)
+        volumes = self._get_bdm_volumes(context, instance_bdms)
+        host_services = self._get_host_services(context, instances)
+
         for instance in instances:
-            if not context.is_admin:
-                if instance['image_ref'] == str(FLAGS.vpn_image_id):
-                    continue
             i = {}
             instance_id = instance['id']
             ec2_id = ec2utils.id_to_ec2_id(instance_id)
             i['instanceId'] = ec2_id
             image_uuid = instance['image_ref']
-            image_id = self._get_image_id(context, image_uuid)
+            image_id = self._get_image_id(context, image_uuid, image_ids)
             i['imageId'] = ec2utils.image_ec2_id(image_id)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            self._format_kernel_id(context, instance, i, 'kernelId',
+                                   image_ids)
+            self._format_ramdisk_id(context, instance, i, 'ramdiskId',
+                                    image_ids)
             i['instanceState'] = {
                 'code': instance['power_state'],
                 'name': state_description_from_vm_state(instance['vm_state'])}
@@ -1173,9 +1195,11 @@ class CloudController(object):
             i['displayDescription'] = instance['display_description']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance_id,
-                                      i['rootDeviceName'], i)
+                                      i['rootDeviceName'], i,
+                                      bdms=instance_bdms.get(instance_id, []),
+                                      volumes=volumes)
             host = instance['host']
-            services = db.service_get_all_by_host(context.elevated(), host)
+            services = host_services.get(host, [])
             zone = ec2utils.get_availability_zone_by_host(services, host)
             i['placement'] = {'availabilityZone': zone}
             if instance['reservation_id'] not in reservations:
@@ -1189,6 +1213,55 @@ class CloudController(object):
 
         return list(reservations.values())
 
+    def _get_instance_image_ids(self, context, instances):
+        """Map the image, kernel and ramdisk uuids of instances to ids."""
+        image_uuids = set()
+        for instance in instances:
+            for key in ('image_ref', 'kernel_id', 'ramdisk_id'):
+                if instance[key]:
+                    image_uuids.add(instance[key])
+        if not image_uuids:
+            return {}
+        return self.image_service.get_image_ids(context, image_uuids)
+
+    @staticmethod
+    def _get_instance_bdms(context, instances):
+        """Return block device mappings of instances, by instance id."""
+        instance_bdms = dict((instance['id'], []) for instance in instances)
+        if instance_bdms:
+            bdms = db.block_device_mapping_get_all_by_instances(context,
+                    instance_bdms.keys())
+            for bdm in bdms:
+                instance_bdms[bdm['instance_id']].append(bdm)
+        return instance_bdms
+
+    @staticmethod
+    def _get_bdm_volumes(context, instance_bdms):
+        """Return the volumes attached through block device mappings."""
+        volume_ids = set()
+        for bdms in instance_bdms.itervalues():
+            for bdm in bdms:
+                if bdm['volume_id'] is not None and not bdm['no_device']:
+                    volume_ids.add(bdm['volume_id'])
+        if not volume_ids:
+            return {}
+        volumes = db.volume_get_all_by_ids(context, list(volume_ids))
+        return dict((volume['id'], dict(volume.iteritems()))
+                    for volume in volumes)
+
+    @staticmethod
+    def _get_host_services(context, instances):
+        """Return the services on the hosts of instances, by host."""
+        hosts = set(instance['host'] for instance in instances)
+        hosts.discard(None)
+        if not hosts:
+            return {}
+        services = {}
+        for service in db.service_get_all(context.elevated()):
+            if service['host'] in hosts:
+                services.setdefault(service['host'], []).append(service)
+        return services
+
     def describe_addresses(self, context, **kwargs):
         return self.format_addresses(context)
 
@@ -1378,7 +1451,9 @@ class CloudController(object):
         return self.image_service.get_image_uuid(context, internal_id)
 
     # NOTE(bcwaldon): We also need to be able to map image uuids to integers
-    def _get_image_id(self, context, image_uuid):
+    def _get_image_id(self, context, image_uuid, image_ids=None):
+        if image_ids and image_uuid in image_ids:
+            return image_ids[image_uuid]
         return self.image_service.get_image_id(context, image_uuid)
 
     def _format_image(self, image):
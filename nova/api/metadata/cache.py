@@ -0,0 +1,210 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process cache of the data served by the metadata service.
+
+Instance metadata is cached by fixed ip and the MPI section by project.
+Entries expire after metadata_cache_ttl seconds, and a cache hit needs no
+database query at all.
+
+Entries are dropped early when this module is one of the
+list_notifier_drivers of the services sending compute.instance.*
+notifications (nova-api and nova-compute): notify() fans the instances the
+notifications name out on metadata_cache_topic to every process serving
+metadata, including a fixed ip freed by compute.instance.delete.  Without
+the driver the TTL bounds how stale the cache can be.
+"""
+
+import datetime
+
+from nova import context
+from nova import flags
+from nova import rpc
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('metadata_cache_ttl', 15,
+                     'Seconds the metadata service caches the metadata of '
+                     'an instance, 0 to disable caching')
+flags.DEFINE_integer('metadata_cache_size', 4096,
+                     'Number of fixed ips the metadata service caches '
+                     'metadata for')
+flags.DEFINE_string('metadata_cache_topic', 'metadata_cache',
+                    'Fanout topic metadata cache invalidations are sent on')
+
+
+class MetadataCache(object):
+    """Metadata by fixed ip and MPI data by project, with a TTL."""
+
+    def __init__(self, ttl=None, size=None):
+        self._ttl = ttl
+        if size is None:
+            size = FLAGS.metadata_cache_size
+        # address -> (expires, instance_id, project_id, data)
+        self._metadata = utils.LRUCache(size, on_evict=self._unindex)
+        # instance_id or project_id -> set of cached addresses
+        self._by_instance = {}
+        self._by_project = {}
+        # project_id -> (expires, data)
+        self._mpi = {}
+
+    @property
+    def ttl(self):
+        if self._ttl is None:
+            return FLAGS.metadata_cache_ttl
+        return self._ttl
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _expires(self):
+        return utils.utcnow() + datetime.timedelta(seconds=self.ttl)
+
+    def _fresh(self, entry):
+        return entry is not None and entry[0] > utils.utcnow()
+
+    def _unindex(self, address, entry):
+        for index, key in ((self._by_instance, entry[1]),
+                           (self._by_project, entry[2])):
+            addresses = index.get(key)
+            if addresses is not None:
+                addresses.discard(address)
+                if not addresses:
+                    del index[key]
+
+    def _drop(self, address):
+        entry = self._metadata.pop(address, None)
+        if entry is not None:
+            self._unindex(address, entry)
+        return entry
+
+    def get_metadata(self, address):
+        """Return cached metadata for a fixed ip, or None."""
+        entry = self._metadata.get(address)
+        if not self._fresh(entry):
+            return None
+        return entry[3]
+
+    def set_metadata(self, address, instance_id, project_id, data):
+        if self.enabled:
+            self._drop(address)
+            self._metadata[address] = (self._expires(), instance_id,
+                                       project_id, data)
+            self._by_instance.setdefault(instance_id, set()).add(address)
+            self._by_project.setdefault(project_id, set()).add(address)
+
+    def get_mpi(self, project_id):
+        """Return the cached MPI data of a project, or None."""
+        entry = self._mpi.get(project_id)
+        if not self._fresh(entry):
+            return None
+        return entry[1]
+
+    def set_mpi(self, project_id, data):
+        if self.enabled:
+            self._mpi[project_id] = (self._expires(), data)
+
+    def invalidate(self, address=None, instance_id=None, project_id=None):
+        """Drop cached data for a fixed ip, an instance or a project.
+
+        Dropping an instance or a project also drops the MPI data of the
+        project, and with it the metadata of every instance of the project
+        since it embeds the MPI data.  With no arguments everything is
+        dropped.
+        """
+        if address is None and instance_id is None and project_id is None:
+            self._metadata.clear()
+            self._by_instance.clear()
+            self._by_project.clear()
+            self._mpi.clear()
+            return
+
+        if address is not None:
+            self._drop(address)
+
+        projects = set()
+        if project_id is not None:
+            projects.add(project_id)
+        if instance_id is not None:
+            for address in list(self._by_instance.get(instance_id, ())):
+                projects.add(self._metadata.peek(address)[2])
+                self._drop(address)
+        for project_id in projects:
+            for address in list(self._by_project.get(project_id, ())):
+                self._drop(address)
+            self._mpi.pop(project_id, None)
+
+
+_CACHE = None
+
+
+def get_cache():
+    """Return the metadata cache of this process."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = MetadataCache()
+    return _CACHE
+
+
+def invalidate(address=None, instance_id=None, project_id=None):
+    """Drop cached metadata, see MetadataCache.invalidate()."""
+    if _CACHE is not None:
+        _CACHE.invalidate(address=address, instance_id=instance_id,
+                          project_id=project_id)
+
+
+class CacheInvalidator(object):
+    """RPC endpoint applying the invalidations fanned out by notify()."""
+
+    def invalidate(self, context, address=None, instance_id=None,
+                   project_id=None):
+        invalidate(address=address, instance_id=instance_id,
+                   project_id=project_id)
+
+
+_CONNECTION = None
+
+
+def consume_invalidations():
+    """Apply invalidations sent by other processes to this cache."""
+    global _CONNECTION
+    if _CONNECTION is None:
+        _CONNECTION = rpc.create_connection(new=True)
+        _CONNECTION.create_consumer(FLAGS.metadata_cache_topic,
+                                    CacheInvalidator(), fanout=True)
+        _CONNECTION.consume_in_thread()
+
+
+def notify(message):
+    """Notification driver dropping the metadata of changed instances.
+
+    compute.instance.* payloads carry the uuid of the instance as
+    instance_id and its project as tenant_id.  The invalidation applies
+    to this process at once and is fanned out to the others.
+    """
+    if not message['event_type'].startswith('compute.instance.'):
+        return
+    payload = message['payload']
+    args = {'instance_id': payload.get('instance_id'),
+            'project_id': payload.get('tenant_id')}
+    if args['instance_id'] is None and args['project_id'] is None:
+        return
+    invalidate(**args)
+    rpc.fanout_cast(context.get_admin_context(), FLAGS.metadata_cache_topic,
+                    {'method': 'invalidate', 'args': args})
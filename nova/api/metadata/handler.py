@@ -34,6 +34,7 @@ from nova import network
 from nova import volume
 from nova import wsgi
 from nova.api.ec2 import ec2utils
+from nova.api.metadata import cache
 
 
 LOG = logging.getLogger('nova.api.metadata')
@@ -73,8 +74,16 @@ class MetadataRequestHandler(wsgi.Application):
         self.compute_api = compute.API(
                 network_api=network.API(),
                 volume_api=volume.API())
+        self.cache = cache.get_cache()
+        if self.cache.enabled:
+            cache.consume_invalidations()
 
     def _get_mpi_data(self, context, project_id):
+        """Return the MPI section for a project, computed once per project
+        until the cached copy expires or is invalidated."""
+        result = self.cache.get_mpi(project_id)
+        if result is not None:
+            return result
         result = {}
         search_opts = {'project_id': project_id, 'deleted': False}
         for instance in self.compute_api.get_all(context,
@@ -89,6 +98,7 @@ class MetadataRequestHandler(wsgi.Application):
                     result[key].append(line)
                 else:
                     result[key] = [line]
+        self.cache.set_mpi(project_id, result)
         return result
 
     def _format_instance_mapping(self, ctxt, instance_ref):
@@ -138,6 +148,14 @@ class MetadataRequestHandler(wsgi.Application):
         return mappings
 
     def get_metadata(self, address):
+        """Return the metadata of the instance with a fixed ip, from the
+        cache when there is a fresh copy."""
+        data = self.cache.get_metadata(address)
+        if data is None:
+            data = self._get_metadata(address)
+        return data
+
+    def _get_metadata(self, address):
         ctxt = context.get_admin_context()
         search_opts = {'fixed_ip': address, 'deleted': False}
         try:
@@ -206,6 +224,9 @@ class MetadataRequestHandler(wsgi.Application):
             data['ancestor-ami-ids'] = []
         if False:  # TODO(vish): store product codes
             data['product-codes'] = []
+
+        self.cache.set_metadata(address, instance_ref['uuid'],
+                                instance_ref['project_id'], data)
         return data
 
     def print_data(self, data):
@@ -23,6 +23,10 @@ from nova.api.openstack import wsgi
 class ViewBuilder(views.servers.ViewBuilder):
     """Adds security group output when viewing server details."""
 
+    detail_joins = views.servers.ViewBuilder.detail_joins + (
+        "security_groups",
+    )
+
     def show(self, request, instance):
         """Detailed view of a single instance."""
         server = super(ViewBuilder, self).show(request, instance)
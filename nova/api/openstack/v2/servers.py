@@ -137,14 +137,26 @@ class Controller(wsgi.Controller):
                 # No 'changes-since', so we only want non-deleted servers
                 search_opts['deleted'] = False
 
-        instance_list = self.compute_api.get_all(context,
-                                                 search_opts=search_opts)
+        # Paging and the relationships the view renders are handled by
+        # the database rather than by slicing the full instance list.
+        limit, marker = common.get_limit_and_marker(req)
+        if is_detail:
+            columns_to_join = self._view_builder.detail_joins
+        else:
+            columns_to_join = self._view_builder.index_joins
+
+        try:
+            instance_list = self.compute_api.get_all(context,
+                    search_opts=search_opts, limit=limit, marker=marker,
+                    columns_to_join=columns_to_join)
+        except exception.MarkerNotFound:
+            msg = _('marker [%s] not found') % marker
+            raise exc.HTTPBadRequest(explanation=msg)
 
-        limited_list = self._limit_items(instance_list, req)
         if is_detail:
-            return self._view_builder.detail(req, limited_list)
+            return self._view_builder.detail(req, instance_list)
         else:
-            return self._view_builder.index(req, limited_list)
+            return self._view_builder.index(req, instance_list)
 
     def _get_server(self, context, instance_uuid):
         """Utility function for looking up an instance by uuid"""
@@ -42,6 +42,17 @@ class ViewBuilder(common.ViewBuilder):
         "VERIFY_RESIZE",
     )
 
+    # Instance relationships rendered by the index and detail views, so
+    # listings only load what they show.
+    index_joins = ()
+    detail_joins = (
+        "fixed_ips.floating_ips",
+        "fixed_ips.network",
+        "fixed_ips.virtual_interface",
+        "metadata",
+        "instance_type",
+    )
+
     def __init__(self):
         """Initialize view builder."""
         super(ViewBuilder, self).__init__()
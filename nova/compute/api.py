@@ -39,6 +39,7 @@ from nova.compute import task_states
 from nova.compute import vm_states
 from nova.scheduler import api as scheduler_api
 from nova.db import base
+from nova.notifier import api as notifier
 
 
 LOG = logging.getLogger('nova.compute.api')
@@ -717,12 +718,25 @@ class API(base.Base):
         self.db.instance_add_security_group(context.elevated(),
                                             instance_id,
                                             security_group['id'])
+        self._notify_security_group_change(context, instance,
+                                           security_group_name, 'add')
         host = instance['host']
         rpc.cast(context,
              self.db.queue_get_for(context, FLAGS.compute_topic, host),
              {"method": "refresh_security_group_rules",
               "args": {"security_group_id": security_group['id']}})
 
+    def _notify_security_group_change(self, context, instance,
+                                      security_group_name, action):
+        """Tell listeners, such as the metadata cache, that the security
+        groups of an instance changed."""
+        payload = {'instance_id': instance['uuid'],
+                   'tenant_id': instance['project_id'],
+                   'security_group': security_group_name}
+        notifier.notify(notifier.publisher_id('api'),
+                        'compute.instance.security_group.%s' % action,
+                        notifier.INFO, payload)
+
     def remove_security_group(self, context, instance, security_group_name):
         """Remove the security group associated with the instance"""
         security_group = self.db.security_group_get_by_name(context,
@@ -745,6 +759,8 @@ class API(base.Base):
         self.db.instance_remove_security_group(context.elevated(),
                                                instance_id,
                                                security_group['id'])
+        self._notify_security_group_change(context, instance,
+                                           security_group_name, 'remove')
         host = instance['host']
         rpc.cast(context,
              self.db.queue_get_for(context, FLAGS.compute_topic, host),
@@ -931,7 +947,8 @@ class API(base.Base):
         """
         return self.get(context, instance_id)
 
-    def get_all(self, context, search_opts=None):
+    def get_all(self, context, search_opts=None, limit=None, marker=None,
+                columns_to_join=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retreive
@@ -939,6 +956,11 @@ class API(base.Base):
 
         Deleted instances will be returned by default, unless there is a
         search option that says otherwise.
+
+        limit and marker (the uuid or id of the last instance seen) page
+        through the local instances followed by those of the child zones.
+        columns_to_join restricts the relationships loaded for each
+        instance.
         """
 
         if search_opts is None:
@@ -988,7 +1010,18 @@ class API(base.Base):
 
         local_zone_only = search_opts.get('local_zone_only', False)
 
-        inst_models = self._get_instances_by_filters(context, filters)
+        # A marker that isn't a local instance may belong to a child zone,
+        # whose instances are listed after all of the local ones.
+        zone_marker = None
+        try:
+            inst_models = self._get_instances_by_filters(context, filters,
+                    limit=limit, marker=marker,
+                    columns_to_join=columns_to_join)
+        except exception.MarkerNotFound:
+            if local_zone_only:
+                raise
+            inst_models = []
+            zone_marker = marker
 
         # Convert the models to dictionaries
         instances = []
@@ -1001,13 +1034,68 @@ class API(base.Base):
         if local_zone_only:
             return instances
 
-        # Recurse zones. Send along the un-modified search options we received.
+        # Child zones only fill what is left of the page
+        zone_limit = None
+        if limit is not None:
+            if len(instances) >= limit:
+                return instances[:limit]
+            zone_limit = limit - len(instances)
+
+        instances.extend(self._get_instances_from_zones(context,
+                search_opts, limit=zone_limit, marker=zone_marker))
+        if limit is not None:
+            instances = instances[:limit]
+        return instances
+
+    def _get_instances_from_zones(self, context, search_opts, limit=None,
+                                  marker=None):
+        """List instances from the child zones, in zone order.
+
+        Each zone is asked for at most limit instances.  marker names an
+        instance in one of the zones; zones that don't know it reject it,
+        and those listed after the zone that has it are asked again without
+        a marker.  Raises MarkerNotFound if no zone has the marker.
+        """
+        # Recurse zones. Send along the search options we received, with
+        # the paging parameters for this request.
+        search_opts = search_opts.copy()
+        search_opts.pop('limit', None)
+        search_opts.pop('marker', None)
+        if limit is not None:
+            search_opts['limit'] = limit
+
+        errors_to_ignore = [novaclient.exceptions.NotFound]
+        zones = None
+        if marker is not None:
+            errors_to_ignore.append(novaclient.exceptions.BadRequest)
+            zones = self.db.zone_get_all(context.elevated())
+            search_opts['marker'] = marker
+
         children = scheduler_api.call_zone_method(context,
                 "list",
-                errors_to_ignore=[novaclient.exceptions.NotFound],
+                errors_to_ignore=errors_to_ignore,
                 novaclient_collection_name="servers",
+                zones=zones,
                 search_opts=search_opts)
 
+        if marker is not None:
+            # 'servers' is None for the zones that rejected the marker
+            found = [i for i, (zone, servers) in enumerate(children)
+                     if servers is not None]
+            if not found:
+                raise exception.MarkerNotFound(marker=marker)
+            after = set(zone for zone, servers in children[found[0] + 1:])
+            children = children[:found[0] + 1]
+            if after:
+                del search_opts['marker']
+                children.extend(scheduler_api.call_zone_method(context,
+                        "list",
+                        errors_to_ignore=[novaclient.exceptions.NotFound],
+                        novaclient_collection_name="servers",
+                        zones=[zone for zone in zones if zone.id in after],
+                        search_opts=search_opts))
+
+        instances = []
         for zone, servers in children:
             # 'servers' can be None if a 404 was returned by a zone
             if servers is None:
@@ -1016,10 +1104,10 @@ class API(base.Base):
                 # Results are ready to send to user. No need to scrub.
                 server._info['_is_precooked'] = True
                 instances.append(server._info)
-
         return instances
 
-    def _get_instances_by_filters(self, context, filters):
+    def _get_instances_by_filters(self, context, filters, limit=None,
+                                  marker=None, columns_to_join=None):
         ids = None
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
@@ -1029,7 +1117,8 @@ class API(base.Base):
             uuids = set([r['instance_uuid'] for r in res])
             filters['uuid'] = uuids
 
-        return self.db.instance_get_all_by_filters(context, filters)
+        return self.db.instance_get_all_by_filters(context, filters,
+                limit=limit, marker=marker, columns_to_join=columns_to_join)
 
     def _cast_compute_message(self, method, context, instance_id, host=None,
                               params=None):
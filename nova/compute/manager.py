@@ -59,6 +59,7 @@ from nova import manager
 from nova import network
 from nova.notifier import api as notifier
 from nova import rpc
+from nova.scheduler import api as scheduler_api
 from nova import utils
 from nova.virt import driver
 from nova import volume
@@ -87,6 +88,15 @@ flags.DEFINE_integer("resize_confirm_window", 0,
                      " Set to 0 to disable.")
 flags.DEFINE_integer('host_state_interval', 120,
                      'Interval in seconds for querying the host status')
+flags.DEFINE_integer('sync_power_state_interval', 600,
+                     'Interval in seconds between full power state syncs '
+                     'when the driver reports power state changes')
+flags.DEFINE_integer('image_cache_manager_interval', 600,
+                     'Interval in seconds between runs of the image cache '
+                     'manager')
+flags.DEFINE_boolean('prefetch_image_on_spawn', True,
+                     'Fetch the image of a new instance while its network '
+                     'and block devices are being set up')
 
 LOG = logging.getLogger('nova.compute.manager')
 
@@ -125,6 +135,16 @@ def _get_image_meta(context, image_ref):
     return image_service.show(context, image_id)
 
 
+@contextlib.contextmanager
+def _timed_phase(timings, phase):
+    """Records the seconds taken by the block in timings[phase]."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[phase] = round(time.time() - start, 3)
+
+
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
 
@@ -147,6 +167,10 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_manager = utils.import_object(FLAGS.network_manager)
         self._last_host_check = 0
         self._last_bw_usage_poll = 0
+        self._last_image_cache_pass = 0
+        self._last_power_state_sync = 0
+        self._driver_events = False
+        self._instance_ids_by_name = {}
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
 
@@ -157,8 +181,11 @@ class ComputeManager(manager.SchedulerDependentManager):
     def init_host(self):
         """Initialization for a standalone compute service."""
         self.driver.init_host(host=self.host)
+        self._driver_events = self.driver.register_event_listener(
+                self._handle_power_state_change)
         context = nova.context.get_admin_context()
         instances = self.db.instance_get_all_by_host(context, self.host)
+        self._remember_instance_names(instances)
         for instance in instances:
             inst_name = instance['name']
             db_state = instance['power_state']
@@ -417,18 +444,37 @@ class ComputeManager(manager.SchedulerDependentManager):
                 self.network_api.deallocate_for_instance(context,
                                     instance)
 
+        def _prefetch_image():
+            try:
+                with _timed_phase(timings, 'prefetch'):
+                    self.driver.prefetch_image(context, instance, image_meta)
+            except Exception:
+                # NOTE: spawn fetches whatever the prefetch did not.
+                LOG.exception(_("instance %s: failed to prefetch image"),
+                              instance_id)
+
         def _cleanup():
             with utils.save_and_reraise_exception():
+                if prefetch is not None:
+                    prefetch.kill()
                 self._instance_update(context,
                                       instance_id,
                                       vm_state=vm_states.ERROR)
                 if network_info is not None:
                     _deallocate_network()
+                # NOTE: the scheduler counted the instance against this
+                #       host when it picked it.
+                scheduler_api.delete_instance_resources(context, instance)
+                timings['total'] = round(time.time() - start, 3)
+                self._record_spawn_timings(context, instance_id, timings,
+                                           error=sys.exc_info()[1])
 
         def _error_message(instance_id, message):
             return _("Instance '%(instance_id)s' "
                      "failed %(message)s.") % locals()
 
+        start = time.time()
+        timings = {}
         context = context.elevated()
         instance = self.db.instance_get(context, instance_id)
 
@@ -437,7 +483,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         if instance['name'] in self.driver.list_instances():
             raise exception.Error(_("Instance has already been created"))
 
-        image_meta = _get_image_meta(context, instance['image_ref'])
+        with _timed_phase(timings, 'image_meta'):
+            image_meta = _get_image_meta(context, instance['image_ref'])
 
         _check_image_size(image_meta)
 
@@ -453,11 +500,18 @@ class ComputeManager(manager.SchedulerDependentManager):
         instance['admin_pass'] = kwargs.get('admin_password', None)
 
         is_vpn = instance['image_ref'] == str(FLAGS.vpn_image_id)
+        # NOTE: the image is downloaded while the network and block devices
+        #       are set up, so spawn finds it in the driver's cache.
+        prefetch = None
+        if (FLAGS.prefetch_image_on_spawn and
+            not self._is_volume_backed(context, instance)):
+            prefetch = greenthread.spawn(_prefetch_image)
         try:
             network_info = None
             with utils.logging_error(_error_message(instance_id,
                                                     "network setup")):
-                network_info = _make_network_info()
+                with _timed_phase(timings, 'network'):
+                    network_info = _make_network_info()
 
             self._instance_update(context,
                                   instance_id,
@@ -465,18 +519,25 @@ class ComputeManager(manager.SchedulerDependentManager):
                                   task_state=task_states.BLOCK_DEVICE_MAPPING)
             with utils.logging_error(_error_message(instance_id,
                                                     "block device setup")):
-                block_device_info = _make_block_device_info()
+                with _timed_phase(timings, 'block_device'):
+                    block_device_info = _make_block_device_info()
 
             self._instance_update(context,
                                   instance_id,
                                   vm_state=vm_states.BUILDING,
                                   task_state=task_states.SPAWNING)
 
+            if prefetch is not None:
+                with _timed_phase(timings, 'prefetch_wait'):
+                    prefetch.wait()
+
+            self._instance_ids_by_name[instance['name']] = instance_id
             # TODO(vish) check to make sure the availability zone matches
             with utils.logging_error(_error_message(instance_id,
                                                     "failed to spawn")):
-                self.driver.spawn(context, instance, image_meta,
-                                  network_info, block_device_info)
+                with _timed_phase(timings, 'spawn'):
+                    self.driver.spawn(context, instance, image_meta,
+                                      network_info, block_device_info)
 
             current_power_state = self._get_power_state(context, instance)
             instance = self._instance_update(context,
@@ -485,8 +546,14 @@ class ComputeManager(manager.SchedulerDependentManager):
                                              vm_state=vm_states.ACTIVE,
                                              task_state=None,
                                              launched_at=utils.utcnow())
+            scheduler_api.update_instance_resources(context, self.host,
+                                                    instance)
+
+            timings['total'] = round(time.time() - start, 3)
+            self._record_spawn_timings(context, instance_id, timings)
 
-            usage_info = utils.usage_from_instance(instance)
+            usage_info = utils.usage_from_instance(instance,
+                                                   timings=timings)
             notifier.notify('compute.%s' % self.host,
                             'compute.instance.create',
                             notifier.INFO, usage_info)
@@ -496,10 +563,41 @@ class ComputeManager(manager.SchedulerDependentManager):
             # exceptions here in case the instance was immediately
             # deleted before it actually got created.  This should
             # be fixed once we have no-db-messaging
-            pass
+            if prefetch is not None:
+                prefetch.kill()
         except Exception:
             _cleanup()
 
+    def _is_volume_backed(self, context, instance):
+        """Whether the root disk of an instance comes from a volume."""
+        if not instance['root_device_name']:
+            return False
+        root_device = block_device.strip_dev(instance['root_device_name'])
+        for bdm in self.db.block_device_mapping_get_all_by_instance(
+                context, instance['id']):
+            if (not bdm['no_device'] and not bdm['virtual_name'] and
+                (bdm['volume_id'] or bdm['snapshot_id']) and
+                block_device.strip_dev(bdm['device_name']) == root_device):
+                return True
+        return False
+
+    def _record_spawn_timings(self, context, instance_id, timings,
+                              error=None):
+        """Logs the seconds each phase of a spawn took as an action."""
+        phases = ', '.join('%s=%.2fs' % (phase, timings[phase])
+                           for phase in sorted(timings))
+        LOG.info(_("instance %(instance_id)s: spawn timings: %(phases)s")
+                 % locals())
+        action = {'instance_id': instance_id,
+                  'action': 'run_instance: %s' % phases}
+        if error is not None:
+            action['error'] = str(error)
+        try:
+            self.db.instance_action_create(context, action)
+        except Exception:
+            LOG.exception(_("instance %s: failed to record spawn timings"),
+                          instance_id)
+
     def _get_instance_volume_bdms(self, context, instance_id):
         bdms = self.db.block_device_mapping_get_all_by_instance(context,
                                                                 instance_id)
@@ -581,6 +679,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                               terminated_at=utils.utcnow())
 
         self.db.instance_destroy(context, instance_id)
+        scheduler_api.delete_instance_resources(context, instance)
 
         usage_info = utils.usage_from_instance(instance)
         notifier.notify('compute.%s' % self.host,
@@ -1027,12 +1126,14 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         # Just roll back the record. There's no need to resize down since
         # the 'old' VM already has the preferred attributes
-        self._instance_update(context,
+        reverted_ref = self._instance_update(context,
                               instance_ref["uuid"],
                               memory_mb=instance_type['memory_mb'],
                               vcpus=instance_type['vcpus'],
                               local_gb=instance_type['local_gb'],
                               instance_type_id=instance_type['id'])
+        scheduler_api.update_instance_resources(context, self.host,
+                                                reverted_ref)
 
         self.driver.finish_revert_migration(instance_ref)
         self.db.migration_update(context, migration_id,
@@ -1177,6 +1278,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                               vm_state=vm_states.ACTIVE,
                               host=migration_ref['dest_compute'],
                               task_state=task_states.RESIZE_VERIFY)
+        scheduler_api.update_instance_resources(context,
+                migration_ref['dest_compute'], instance_ref)
 
         self.db.migration_update(context, migration_id,
                 {'status': 'finished', })
@@ -1869,7 +1972,12 @@ class ComputeManager(manager.SchedulerDependentManager):
             error_list.append(ex)
 
         try:
-            self._sync_power_states(context)
+            curr_time = time.time()
+            if (not self._driver_events or
+                curr_time - self._last_power_state_sync >
+                FLAGS.sync_power_state_interval):
+                self._last_power_state_sync = curr_time
+                self._sync_power_states(context)
         except Exception as ex:
             LOG.warning(_("Error during power_state sync: %s"), unicode(ex))
             error_list.append(ex)
@@ -1880,6 +1988,13 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.warning(_("Error during reclamation of queued deletes: %s"),
                         unicode(ex))
             error_list.append(ex)
+        try:
+            self._manage_image_cache(context)
+        except Exception as ex:
+            LOG.warning(_("Error managing the image cache: %s"),
+                        unicode(ex))
+            error_list.append(ex)
+
         try:
             start = utils.current_audit_period()[1]
             self._update_bandwidth_usage(context, start)
@@ -1909,6 +2024,13 @@ class ComputeManager(manager.SchedulerDependentManager):
                                         start_time,
                                         usage['bw_in'], usage['bw_out'])
 
+    def _manage_image_cache(self, context):
+        curr_time = time.time()
+        if (curr_time - self._last_image_cache_pass >
+                FLAGS.image_cache_manager_interval):
+            self._last_image_cache_pass = curr_time
+            self.driver.manage_image_cache(context)
+
     def _report_driver_status(self):
         curr_time = time.time()
         if curr_time - self._last_host_check > FLAGS.host_state_interval:
@@ -1932,6 +2054,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         vm_instances = self.driver.list_instances_detail()
         vm_instances = dict((vm.name, vm) for vm in vm_instances)
         db_instances = self.db.instance_get_all_by_host(context, self.host)
+        self._remember_instance_names(db_instances)
 
         num_vm_instances = len(vm_instances)
         num_db_instances = len(db_instances)
@@ -1957,6 +2080,35 @@ class ComputeManager(manager.SchedulerDependentManager):
                                   db_instance["id"],
                                   power_state=vm_power_state)
 
+    def _handle_power_state_change(self, instance_name, vm_power_state):
+        """Record a power state change reported by the driver."""
+        context = nova.context.get_admin_context()
+        instance_id = self._instance_ids_by_name.get(instance_name)
+        if instance_id is None:
+            # Not seen since the instances of the host were last listed
+            self._remember_instance_names(
+                    self.db.instance_get_all_by_host(context, self.host))
+            instance_id = self._instance_ids_by_name.get(instance_name)
+            if instance_id is None:
+                return
+        try:
+            db_instance = self.db.instance_get(context, instance_id)
+        except exception.NotFound:
+            db_instance = None
+        if (db_instance is None or db_instance['name'] != instance_name or
+            db_instance['host'] != self.host):
+            self._instance_ids_by_name.pop(instance_name, None)
+            return
+        if db_instance['power_state'] != vm_power_state:
+            self._instance_update(context,
+                                  instance_id,
+                                  power_state=vm_power_state)
+
+    def _remember_instance_names(self, instances):
+        """Map the driver's names of instances to their ids."""
+        self._instance_ids_by_name = dict((instance['name'], instance['id'])
+                                          for instance in instances)
+
     def _reclaim_queued_deletes(self, context):
         """Reclaim instances that are queued for deletion."""
 
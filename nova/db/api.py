@@ -159,6 +159,15 @@ def service_update(context, service_id, values):
     return IMPL.service_update(context, service_id, values)
 
 
+def service_heartbeat(context, service_id):
+    """Count a heartbeat of a service and set its updated_at.
+
+    Raises NotFound if service does not exist.
+
+    """
+    return IMPL.service_heartbeat(context, service_id)
+
+
 ###################
 
 
@@ -426,6 +435,12 @@ def fixed_ip_get_network(context, address):
     return IMPL.fixed_ip_get_network(context, address)
 
 
+def fixed_ip_get_instance_ips_by_regexp(context, pattern):
+    """Get instance_id/ip dicts for instance fixed and floating ips
+    whose address matches a regexp."""
+    return IMPL.fixed_ip_get_instance_ips_by_regexp(context, pattern)
+
+
 def fixed_ip_update(context, address, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_update(context, address, values)
@@ -534,9 +549,15 @@ def instance_get_all(context):
     return IMPL.instance_get_all(context)
 
 
-def instance_get_all_by_filters(context, filters):
+def instance_get_all_by_filters(context, filters, sort_key='created_at',
+                                sort_dir='desc', limit=None, marker=None,
+                                columns_to_join=None):
     """Get all instances that match all filters."""
-    return IMPL.instance_get_all_by_filters(context, filters)
+    return IMPL.instance_get_all_by_filters(context, filters,
+                                            sort_key=sort_key,
+                                            sort_dir=sort_dir,
+                                            limit=limit, marker=marker,
+                                            columns_to_join=columns_to_join)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None):
@@ -944,6 +965,11 @@ def volume_get_all(context):
     return IMPL.volume_get_all(context)
 
 
+def volume_get_all_by_ids(context, volume_ids):
+    """Get all volumes with the given ids."""
+    return IMPL.volume_get_all_by_ids(context, volume_ids)
+
+
 def volume_get_all_by_host(context, host):
     """Get all volumes belonging to a host."""
     return IMPL.volume_get_all_by_host(context, host)
@@ -1044,6 +1070,12 @@ def block_device_mapping_get_all_by_instance(context, instance_id):
     return IMPL.block_device_mapping_get_all_by_instance(context, instance_id)
 
 
+def block_device_mapping_get_all_by_instances(context, instance_ids):
+    """Get all block device mapping belonging to a list of instances"""
+    return IMPL.block_device_mapping_get_all_by_instances(context,
+                                                          instance_ids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1622,6 +1654,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find all local s3 images represented by the provided uuids"""
+    return IMPL.s3_image_get_all_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     return IMPL.s3_image_create(context, image_uuid)
@@ -32,12 +32,15 @@ from nova import log as logging
 from nova.compute import vm_states
 from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy.session import get_session
+from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy import String
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import desc
+from sqlalchemy.sql.expression import exists
 from sqlalchemy.sql.expression import literal_column
 
 FLAGS = flags.FLAGS
@@ -347,6 +350,21 @@ def service_update(context, service_id, values):
         service_ref.save(session=session)
 
 
+@require_admin_context
+def service_heartbeat(context, service_id):
+    session = get_session()
+    with session.begin():
+        count = session.query(models.Service).\
+                        filter_by(id=service_id).\
+                        filter_by(deleted=False).\
+                        update({'report_count':
+                                    models.Service.report_count + 1,
+                                'updated_at': utils.utcnow()},
+                               synchronize_session=False)
+    if not count:
+        raise exception.ServiceNotFound(service_id=service_id)
+
+
 ###################
 
 
@@ -879,7 +897,8 @@ def fixed_ip_get_by_address(context, address, session=None):
     if not result:
         raise exception.FixedIpNotFoundForAddress(address=address)
 
-    if is_user_context(context):
+    # an unassociated fixed ip has no project to authorize against
+    if is_user_context(context) and result.instance is not None:
         authorize_project_context(context, result.instance.project_id)
 
     return result
@@ -931,6 +950,56 @@ def fixed_ip_get_network(context, address):
     return fixed_ip_ref.network
 
 
+@require_context
+def fixed_ip_get_instance_ips_by_regexp(context, pattern):
+    """Get the fixed and floating ips of instances matching a regexp.
+
+    Exact addresses and prefixes are looked up through the indexed address
+    columns; other regexps are matched in python against every address
+    associated with an instance.
+    """
+    ip_re = re.compile(str(pattern))
+    like = _regexp_to_like(ip_re.pattern)
+
+    def _filter_address(query, column):
+        if like is None or not like.strip('%'):
+            return query
+        if not [c for c in like if c in '%_!']:
+            return query.filter(column == like)
+        return query.filter(column.like(like, escape='!'))
+
+    session = get_session()
+    fixed_query = session.query(models.FixedIp.instance_id,
+                                models.FixedIp.address).\
+                          filter(models.FixedIp.instance_id != None).\
+                          filter_by(deleted=False)
+    fixed_query = _filter_address(fixed_query, models.FixedIp.address)
+
+    floating_query = session.query(models.FixedIp.instance_id,
+                                   models.FixedIp.address,
+                                   models.FloatingIp.address).\
+                        filter(models.FloatingIp.fixed_ip_id ==
+                               models.FixedIp.id).\
+                        filter(models.FixedIp.instance_id != None).\
+                        filter(models.FixedIp.deleted == False).\
+                        filter(models.FloatingIp.deleted == False)
+    floating_query = _filter_address(floating_query,
+                                     models.FloatingIp.address)
+
+    # LIKE is case insensitive on some backends, so check the regexp too
+    results = []
+    for instance_id, address in fixed_query.all():
+        if address and ip_re.match(address):
+            results.append({'instance_id': instance_id, 'ip': address})
+    for instance_id, fixed_address, address in floating_query.all():
+        # A fixed ip that matched already stands for its floating ips
+        if fixed_address and ip_re.match(fixed_address):
+            continue
+        if address and ip_re.match(address):
+            results.append({'instance_id': instance_id, 'ip': address})
+    return results
+
+
 @require_context
 def fixed_ip_update(context, address, values):
     session = get_session()
@@ -1266,62 +1335,209 @@ def instance_get_all(context):
                    all()
 
 
+_INSTANCE_FILTER_JOINS = ('fixed_ips.floating_ips', 'fixed_ips.network',
+                          'fixed_ips.virtual_interface', 'security_groups',
+                          'metadata', 'instance_type')
+
+# Filters for exact matches that we can do along with the SQL query.
+_INSTANCE_EXACT_MATCH_FILTERS = ('project_id', 'user_id', 'image_ref',
+                                 'vm_state', 'instance_type_id', 'uuid')
+
+# Characters that are literal when escaped with a backslash in a regexp.
+_REGEXP_ESCAPABLE = re.compile(r'[^A-Za-z0-9]')
+
+
+def _regexp_to_like(pattern):
+    """Translate a search regexp into an equivalent SQL LIKE pattern.
+
+    Search filters are applied with re.match(), so they're implicitly
+    anchored at the start of the value.  Only literal characters, escaped
+    punctuation, '.', '.*' and the '^'/'$' anchors can be expressed with
+    LIKE; anything else returns None and is left to be matched in python.
+    The returned pattern uses '!' as its escape character.
+    """
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    anchored = pattern.endswith('$') and not pattern.endswith('\\$')
+    if anchored:
+        pattern = pattern[:-1]
+
+    like = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if not escaped or not _REGEXP_ESCAPABLE.match(escaped):
+                return None
+            char = escaped
+            i += 1
+        elif char == '.':
+            if pattern[i + 1:i + 2] == '*':
+                i += 2
+                if not like or like[-1] != '%':
+                    like.append('%')
+                continue
+            char = None
+        elif char in '^$*+?{}[]()|':
+            return None
+        if char is None:
+            like.append('_')
+        elif char in '!%_':
+            like.append('!' + char)
+        else:
+            like.append(char)
+        i += 1
+
+    if not anchored and (not like or like[-1] != '%'):
+        like.append('%')
+    return ''.join(like)
+
+
+def _instance_filter_plan(filters):
+    """Split instance search filters into SQL criteria and python filters.
+
+    Returns a (criteria, python_filters) tuple.  criteria is a list of
+    SQL expressions against models.Instance; python_filters is a list of
+    functions taking an instance and returning whether it matches.  Every
+    regexp filter is in python_filters, including those also narrowed down
+    with LIKE, since LIKE is case insensitive on some backends.
+    """
+    criteria = []
+    python_filters = []
+
+    for filter_name, value in filters.iteritems():
+        if filter_name in _INSTANCE_EXACT_MATCH_FILTERS:
+            column_attr = getattr(models.Instance, filter_name)
+            if isinstance(value, (list, set)):
+                criteria.append(column_attr.in_(value))
+            else:
+                criteria.append(column_attr == value)
+            continue
+
+        if filter_name == 'metadata':
+            if isinstance(value, dict):
+                value = [value]
+            if not isinstance(value, list):
+                continue
+            meta = models.InstanceMetadata
+            for node in value:
+                for k, v in node.iteritems():
+                    criteria.append(exists().where(
+                            and_(meta.instance_id == models.Instance.id,
+                                 meta.deleted == False,
+                                 meta.key == k,
+                                 meta.value == v)))
+            continue
+
+        if not hasattr(models.Instance, filter_name):
+            # Unknown filters have always matched everything
+            continue
+
+        filter_re = re.compile(str(value))
+
+        def _regexp_filter_by_column(instance, filter_name=filter_name,
+                                     filter_re=filter_re):
+            v = getattr(instance, filter_name, None)
+            return bool(v and filter_re.match(str(v)))
+
+        column = models.Instance.__table__.columns.get(filter_name)
+        if column is not None and isinstance(column.type, String):
+            like = _regexp_to_like(filter_re.pattern)
+            if like is not None and like.strip('%'):
+                column_attr = getattr(models.Instance, filter_name)
+                criteria.append(column_attr.like(like, escape='!'))
+
+        python_filters.append(_regexp_filter_by_column)
+
+    return criteria, python_filters
+
+
+def _instance_get_marker(context, session, marker):
+    """Return the instance named by a marker uuid or id.
+
+    Non-admin contexts can only page from one of their own instances.
+    Raises MarkerNotFound if there is no such instance.
+    """
+    query = session.query(models.Instance)
+    if utils.is_uuid_like(marker):
+        query = query.filter_by(uuid=marker)
+    else:
+        try:
+            query = query.filter_by(id=int(marker))
+        except (TypeError, ValueError):
+            raise exception.MarkerNotFound(marker=marker)
+
+    if not context.is_admin:
+        if context.project_id:
+            query = query.filter_by(project_id=context.project_id)
+        else:
+            query = query.filter_by(user_id=context.user_id)
+
+    marker_ref = query.first()
+    if not marker_ref:
+        raise exception.MarkerNotFound(marker=marker)
+    return marker_ref
+
+
+def _paginate_query(query, model, limit, sort_key, marker=None,
+                    sort_dir='desc'):
+    """Return a query ordered by sort_key with marker and limit applied.
+
+    The model's id is used as a tie breaker so the ordering is stable, and
+    rows are returned starting after the marker row.  The sort_key column
+    must not contain NULLs.
+    """
+    sort_attr = getattr(model, sort_key)
+    if sort_dir == 'desc':
+        query = query.order_by(desc(sort_attr), desc(model.id))
+    else:
+        query = query.order_by(sort_attr, model.id)
+
+    if marker is not None:
+        marker_value = getattr(marker, sort_key)
+        if sort_dir == 'desc':
+            query = query.filter(or_(sort_attr < marker_value,
+                                     and_(sort_attr == marker_value,
+                                          model.id < marker.id)))
+        else:
+            query = query.filter(or_(sort_attr > marker_value,
+                                     and_(sort_attr == marker_value,
+                                          model.id > marker.id)))
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 @require_context
-def instance_get_all_by_filters(context, filters):
+def instance_get_all_by_filters(context, filters, sort_key='created_at',
+                                sort_dir='desc', limit=None, marker=None,
+                                columns_to_join=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
-    otherwise"""
-
-    def _regexp_filter_by_metadata(instance, meta):
-        inst_metadata = [{node['key']: node['value']} \
-                         for node in instance['metadata']]
-        if isinstance(meta, list):
-            for node in meta:
-                if node not in inst_metadata:
-                    return False
-        elif isinstance(meta, dict):
-            for k, v in meta.iteritems():
-                if {k: v} not in inst_metadata:
-                    return False
-        return True
-
-    def _regexp_filter_by_column(instance, filter_name, filter_re):
-        try:
-            v = getattr(instance, filter_name)
-        except AttributeError:
-            return True
-        if v and filter_re.match(str(v)):
-            return True
-        return False
+    otherwise.
 
-    def _exact_match_filter(query, column, value):
-        """Do exact match against a column.  value to match can be a list
-        so you can match any value in the list.
-        """
-        if isinstance(value, list) or isinstance(value, set):
-            column_attr = getattr(models.Instance, column)
-            return query.filter(column_attr.in_(value))
-        else:
-            filter_dict = {}
-            filter_dict[column] = value
-            return query.filter_by(**filter_dict)
+    Exact, metadata and LIKE-compatible regexp filters are turned into SQL
+    criteria.  Rows are read from the database in pages of at most limit
+    rows, continuing from the last one read, until limit instances have
+    passed the filters that are checked in python.  marker is the uuid or
+    id of the last instance seen by the caller; columns_to_join limits the
+    relationships that are eagerly loaded and defaults to all of them."""
 
     session = get_session()
-    query_prefix = session.query(models.Instance).\
-            options(joinedload_all('fixed_ips.floating_ips')).\
-            options(joinedload_all('fixed_ips.network')).\
-            options(joinedload_all('fixed_ips.virtual_interface')).\
-            options(joinedload('security_groups')).\
-            options(joinedload('metadata')).\
-            options(joinedload('instance_type')).\
-            order_by(desc(models.Instance.created_at))
+    if columns_to_join is None:
+        columns_to_join = _INSTANCE_FILTER_JOINS
+    query_prefix = session.query(models.Instance)
+    for column in columns_to_join:
+        query_prefix = query_prefix.options(joinedload_all(column))
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
 
     if 'changes-since' in filters:
-        changes_since = filters['changes-since']
+        changes_since = filters.pop('changes-since')
         query_prefix = query_prefix.\
                             filter(models.Instance.updated_at > changes_since)
 
@@ -1344,45 +1560,38 @@ def instance_get_all_by_filters(context, filters):
         else:
             filters['user_id'] = context.user_id
 
-    # Filters for exact matches that we can do along with the SQL query...
-    # For other filters that don't match this, we will do regexp matching
-    exact_match_filter_names = ['project_id', 'user_id', 'image_ref',
-            'vm_state', 'instance_type_id', 'uuid']
-
-    query_filters = [key for key in filters.iterkeys()
-            if key in exact_match_filter_names]
-
-    for filter_name in query_filters:
-        # Do the matching and remove the filter from the dictionary
-        # so we don't try it again below..
-        query_prefix = _exact_match_filter(query_prefix, filter_name,
-                filters.pop(filter_name))
-
-    instances = query_prefix.all()
-    if not instances:
-        return []
-
-    # Now filter on everything else for regexp matching..
-    # For filters not in the list, we'll attempt to use the filter_name
-    # as a column name in Instance..
-    regexp_filter_funcs = {}
-
-    for filter_name in filters.iterkeys():
-        filter_func = regexp_filter_funcs.get(filter_name, None)
-        filter_re = re.compile(str(filters[filter_name]))
-        if filter_func:
-            filter_l = lambda instance: filter_func(instance, filter_re)
-        elif filter_name == 'metadata':
-            filter_l = lambda instance: _regexp_filter_by_metadata(instance,
-                    filters[filter_name])
-        else:
-            filter_l = lambda instance: _regexp_filter_by_column(instance,
-                    filter_name, filter_re)
-        instances = filter(filter_l, instances)
-        if not instances:
+    criteria, python_filters = _instance_filter_plan(filters)
+    for criterion in criteria:
+        query_prefix = query_prefix.filter(criterion)
+
+    marker_ref = None
+    if marker is not None:
+        marker_ref = _instance_get_marker(context, session, marker)
+
+    # Without a limit every matching row is needed anyway.  Otherwise
+    # read pages until enough rows have passed the regexp filters.
+    if limit is None or not python_filters:
+        instances = _paginate_query(query_prefix, models.Instance, limit,
+                                    sort_key, marker=marker_ref,
+                                    sort_dir=sort_dir).all()
+        for filter_func in python_filters:
+            if not instances:
+                break
+            instances = filter(filter_func, instances)
+        return instances
+
+    instances = []
+    while len(instances) < limit:
+        rows = _paginate_query(query_prefix, models.Instance, limit,
+                               sort_key, marker=marker_ref,
+                               sort_dir=sort_dir).all()
+        for row in rows:
+            if all(filter_func(row) for filter_func in python_filters):
+                instances.append(row)
+        if len(rows) < limit:
             break
-
-    return instances
+        marker_ref = rows[-1]
+    return instances[:limit]
 
 
 @require_context
@@ -2310,6 +2519,26 @@ def volume_get_all(context):
                    all()
 
 
+@require_context
+def volume_get_all_by_ids(context, volume_ids):
+    if not volume_ids:
+        return []
+    session = get_session()
+    query = session.query(models.Volume).\
+                    options(joinedload('instance')).\
+                    options(joinedload('volume_metadata')).\
+                    options(joinedload('volume_type')).\
+                    filter(models.Volume.id.in_(volume_ids))
+
+    if is_admin_context(context):
+        return query.filter_by(deleted=can_read_deleted(context)).all()
+    elif is_user_context(context):
+        return query.filter_by(project_id=context.project_id).\
+                     filter_by(deleted=False).\
+                     all()
+    return []
+
+
 @require_admin_context
 def volume_get_all_by_host(context, host):
     session = get_session()
@@ -2633,6 +2862,18 @@ def block_device_mapping_get_all_by_instance(context, instance_id):
     return result
 
 
+@require_context
+def block_device_mapping_get_all_by_instances(context, instance_ids):
+    if not instance_ids:
+        return []
+    session = get_session()
+    return session.query(models.BlockDeviceMapping).\
+                   filter(models.BlockDeviceMapping.instance_id.in_(
+                           instance_ids)).\
+                   filter_by(deleted=False).\
+                   all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     session = get_session()
@@ -4057,6 +4298,16 @@ def s3_image_get_by_uuid(context, image_uuid):
     return res
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find all local s3 images represented by the provided uuids"""
+    if not image_uuids:
+        return []
+    session = get_session()
+    return session.query(models.S3Image).\
+                   filter(models.S3Image.uuid.in_(image_uuids)).\
+                   all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     try:
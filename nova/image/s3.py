@@ -61,6 +61,13 @@ class S3ImageService(object):
     def get_image_id(self, context, image_uuid):
         return nova.db.api.s3_image_get_by_uuid(context, image_uuid)['id']
 
+    def get_image_ids(self, context, image_uuids):
+        """Return a dict mapping each known image uuid to its id."""
+        s3_images = nova.db.api.s3_image_get_all_by_uuids(context,
+                                                          list(image_uuids))
+        return dict((s3_image['uuid'], s3_image['id'])
+                    for s3_image in s3_images)
+
     def _create_image_id(self, context, image_uuid):
         return nova.db.api.s3_image_create(context, image_uuid)['id']
 
@@ -22,6 +22,7 @@ import calendar
 import inspect
 import netaddr
 import os
+import re
 
 from nova import db
 from nova import exception
@@ -105,12 +106,18 @@ class IptablesRule(object):
 
 
 class IptablesTable(object):
-    """An iptables table."""
+    """An iptables table.
+
+    dirty is set whenever the chains or rules might have changed, so
+    IptablesManager only checks those tables against iptables-save.
+
+    """
 
     def __init__(self):
         self.rules = []
         self.chains = set()
         self.unwrapped_chains = set()
+        self.dirty = True
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -125,9 +132,13 @@ class IptablesTable(object):
 
         """
         if wrap:
-            self.chains.add(name)
+            chain_set = self.chains
         else:
-            self.unwrapped_chains.add(name)
+            chain_set = self.unwrapped_chains
+
+        if name not in chain_set:
+            chain_set.add(name)
+            self.dirty = True
 
     def remove_chain(self, name, wrap=True):
         """Remove named chain.
@@ -149,14 +160,15 @@ class IptablesTable(object):
             return
 
         chain_set.remove(name)
-        self.rules = filter(lambda r: r.chain != name, self.rules)
 
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
         else:
             jump_snippet = '-j %s' % (name,)
 
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+        self.rules = [r for r in self.rules
+                      if r.chain != name and jump_snippet not in r.rule]
+        self.dirty = True
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -176,6 +188,7 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         self.rules.append(IptablesRule(chain, rule, wrap, top))
+        self.dirty = True
 
     def _wrap_target_chain(self, s):
         if s.startswith('$'):
@@ -192,6 +205,7 @@ class IptablesTable(object):
         """
         try:
             self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self.dirty = True
         except ValueError:
             LOG.debug(_('Tried to remove rule that was not there:'
                         ' %(chain)r %(rule)r %(wrap)r %(top)r'),
@@ -200,10 +214,11 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        rules = [rule for rule in self.rules
+                      if rule.chain != chain or rule.wrap != wrap]
+        if len(rules) != len(self.rules):
+            self.rules = rules
+            self.dirty = True
 
 
 class IptablesManager(object):
@@ -239,6 +254,11 @@ class IptablesManager(object):
                      'nat': IptablesTable()}
         self.ipv6 = {'filter': IptablesTable()}
 
+        # (command, table) -> (lines saved after our last restore or None
+        #                      until the table is next saved, lines we
+        #                      restored)
+        self._applied = {}
+
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
         # of FORWARD and OUTPUT.
@@ -296,6 +316,13 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        Only tables whose rules might have changed are saved, and they are
+        only restored when the rendered rules differ from what was last
+        applied or iptables-save shows the table was changed behind our
+        back.  Callers waiting on the lock while another apply runs
+        usually find their changes already applied, so concurrent
+        refreshes are batched into a single restore per table.
+
         """
         s = [('iptables', self.ipv4)]
         if FLAGS.use_ipv6:
@@ -303,16 +330,47 @@ class IptablesManager(object):
 
         for cmd, tables in s:
             for table in tables:
-                current_table, _ = self.execute('%s-save' % (cmd,),
-                                                '-t', '%s' % (table,),
-                                                run_as_root=True,
-                                                attempts=5)
-                current_lines = current_table.split('\n')
-                new_filter = self._modify_rules(current_lines,
-                                                tables[table])
-                self.execute('%s-restore' % (cmd,), run_as_root=True,
-                             process_input='\n'.join(new_filter),
-                             attempts=5)
+                if not tables[table].dirty:
+                    continue
+                # Clear the flag before reading the rules, so changes made
+                # while we save and restore mark the table again.
+                tables[table].dirty = False
+                try:
+                    self._apply_table(cmd, table, tables[table])
+                except Exception:
+                    with utils.save_and_reraise_exception():
+                        tables[table].dirty = True
+
+    def _save_table(self, cmd, table):
+        current_table, _ = self.execute('%s-save' % (cmd,),
+                                        '-t', '%s' % (table,),
+                                        run_as_root=True,
+                                        attempts=5)
+        return current_table.split('\n')
+
+    def _apply_table(self, cmd, name, table):
+        current_lines = self._save_table(cmd, name)
+        new_filter = self._modify_rules(current_lines, table)
+
+        current = _comparable_lines(current_lines)
+        rendered = _comparable_lines(new_filter)
+        last_saved, last_rendered = self._applied.get((cmd, name),
+                                                      (None, None))
+        if rendered == last_rendered:
+            if current == last_saved:
+                return
+            if last_saved is None and _chains_in(rendered, current):
+                # iptables-save doesn't print rules the way we write them,
+                # so the first save after our restore shows how it prints
+                # them.  Later saves are compared to it to spot changes
+                # made behind our back.
+                self._applied[(cmd, name)] = (current, rendered)
+                return
+
+        self.execute('%s-restore' % (cmd,), run_as_root=True,
+                     process_input='\n'.join(new_filter),
+                     attempts=5)
+        self._applied[(cmd, name)] = (None, rendered)
 
     def _modify_rules(self, current_lines, table, binary=None):
         unwrapped_chains = table.unwrapped_chains
@@ -334,16 +392,20 @@ class IptablesManager(object):
                     break
 
         our_rules = []
+        top_rules = set()
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
-                # rule.top == True means we want this rule to be at the top.
-                # Further down, we weed out duplicates from the bottom of the
-                # list, so here we remove the dupes ahead of time.
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
+                top_rules.add(rule_str.strip())
             our_rules += [rule_str]
 
+        if top_rules:
+            # rule.top == True means we want this rule to be at the top.
+            # Further down, we weed out duplicates from the bottom of the
+            # list, so here we remove the dupes ahead of time.
+            new_filter = [line for line in new_filter
+                          if line.strip() not in top_rules]
+
         new_filter[rules_index:rules_index] = our_rules
 
         new_filter[rules_index:rules_index] = [':%s - [0:0]' % \
@@ -371,6 +433,21 @@ class IptablesManager(object):
         return new_filter
 
 
+_CHAIN_COUNTERS = re.compile(r'\s*\[\d+:\d+\]$')
+
+
+def _comparable_lines(lines):
+    """Return iptables-save lines without comments and packet counters."""
+    return [_CHAIN_COUNTERS.sub('', line.strip()) for line in lines
+            if line.strip() and not line.startswith('#')]
+
+
+def _chains_in(rendered, current):
+    """Check that the chains of the rendered lines exist in current."""
+    current = set(current)
+    return all(line in current for line in rendered if line.startswith(':'))
+
+
 def metadata_forward():
     """Create forwarding rule for metadata."""
     iptables_manager.ipv4['nat'].add_rule('PREROUTING',
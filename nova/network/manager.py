@@ -542,45 +542,39 @@ class NetworkManager(manager.SchedulerDependentManager):
         return []
 
     def get_instance_uuids_by_ip_filter(self, context, filters):
+        results = []
+
         fixed_ip_filter = filters.get('fixed_ip')
-        ip_filter = re.compile(str(filters.get('ip')))
-        ipv6_filter = re.compile(str(filters.get('ip6')))
+        if fixed_ip_filter:
+            try:
+                fixed_ip = self.db.fixed_ip_get_by_address(context,
+                                                           fixed_ip_filter)
+            except exception.FixedIpNotFoundForAddress:
+                fixed_ip = None
+            if fixed_ip and fixed_ip['instance_id'] is not None:
+                results.append({'instance_id': fixed_ip['instance_id'],
+                                'ip': fixed_ip['address']})
+
+        # NOTE(jkoelker) Will need to update for the UUID flip
+        if filters.get('ip') is not None:
+            results.extend(self.db.fixed_ip_get_instance_ips_by_regexp(
+                    context, filters['ip']))
 
         # NOTE(jkoelker) Should probably figure out a better way to do
         #                this. But for now it "works", this could suck on
         #                large installs.
-
-        vifs = self.db.virtual_interface_get_all(context)
-        results = []
-
-        for vif in vifs:
-            if vif['instance_id'] is None:
-                continue
-
-            fixed_ipv6 = vif.get('fixed_ipv6')
-            if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
-                # NOTE(jkoelker) Will need to update for the UUID flip
-                results.append({'instance_id': vif['instance_id'],
-                                'ip': fixed_ipv6})
-
-            for fixed_ip in vif['fixed_ips']:
-                if not fixed_ip or not fixed_ip['address']:
+        # fixed_ipv6 is derived from the mac and the network, so unlike the
+        # ipv4 addresses above it can't be searched in the database.
+        if filters.get('ip6') is not None:
+            ipv6_filter = re.compile(str(filters['ip6']))
+            vifs = self.db.virtual_interface_get_all(context)
+            for vif in vifs:
+                if vif['instance_id'] is None:
                     continue
-                if fixed_ip['address'] == fixed_ip_filter:
+                fixed_ipv6 = vif.get('fixed_ipv6')
+                if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
                     results.append({'instance_id': vif['instance_id'],
-                                    'ip': fixed_ip['address']})
-                    continue
-                if ip_filter.match(fixed_ip['address']):
-                    results.append({'instance_id': vif['instance_id'],
-                                    'ip': fixed_ip['address']})
-                    continue
-                for floating_ip in fixed_ip.get('floating_ips', []):
-                    if not floating_ip or not floating_ip['address']:
-                        continue
-                    if ip_filter.match(floating_ip['address']):
-                        results.append({'instance_id': vif['instance_id'],
-                                        'ip': floating_ip['address']})
-                        continue
+                                    'ip': fixed_ipv6})
 
         # NOTE(jkoelker) Until we switch over to instance_uuid ;)
         ids = [res['instance_id'] for res in results]
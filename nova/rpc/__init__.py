@@ -18,7 +18,7 @@
 
 
 from nova.utils import import_object
-from nova.rpc.common import RemoteError, LOG
+from nova.rpc.common import RemoteError, Timeout, LOG
 from nova import flags
 
 FLAGS = flags.FLAGS
@@ -41,8 +41,8 @@ def create_connection(new=True):
     return get_impl().create_connection(new=new)
 
 
-def call(context, topic, msg):
-    return get_impl().call(context, topic, msg)
+def call(context, topic, msg, timeout=None):
+    return get_impl().call(context, topic, msg, timeout)
 
 
 def cast(context, topic, msg):
@@ -53,5 +53,13 @@ def fanout_cast(context, topic, msg):
     return get_impl().fanout_cast(context, topic, msg)
 
 
-def multicall(context, topic, msg):
-    return get_impl().multicall(context, topic, msg)
+def multicall(context, topic, msg, timeout=None):
+    return get_impl().multicall(context, topic, msg, timeout)
+
+
+def flush(timeout=None):
+    return get_impl().flush(timeout)
+
+
+def cleanup():
+    return get_impl().cleanup()
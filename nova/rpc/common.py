@@ -26,3 +26,13 @@ class RemoteError(exception.NovaException):
         self.value = value
         self.traceback = traceback
         super(RemoteError, self).__init__(**self.__dict__)
+
+
+class Timeout(exception.NovaException):
+    """Signifies that a timeout has occurred.
+
+    This exception is raised if no response to an rpc.call or
+    rpc.multicall arrived within the timeout given for the call.
+
+    """
+    message = _("Timeout while waiting on RPC response.")
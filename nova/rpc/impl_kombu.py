@@ -18,7 +18,12 @@ import kombu
 import kombu.entity
 import kombu.messaging
 import kombu.connection
+import kombu.serialization
+import atexit
+import bisect
+import collections
 import itertools
+import os
 import sys
 import time
 import traceback
@@ -26,19 +31,82 @@ import types
 import uuid
 
 import eventlet
+from eventlet import event
 from eventlet import greenpool
 from eventlet import pools
+from eventlet import queue
+from eventlet import semaphore
 import greenlet
 
 from nova import context
 from nova import exception
 from nova import flags
-from nova.rpc.common import RemoteError, LOG
+from nova.rpc.common import RemoteError, Timeout, LOG
 
 # Needed for tests
 eventlet.monkey_patch()
 
 FLAGS = flags.FLAGS
+flags.DEFINE_boolean('rpc_shared_reply_queue', False,
+                     'Receive the replies to rpc.call and rpc.multicall on '
+                     'one queue per process instead of declaring a queue '
+                     'per call. Only enable once every service is upgraded, '
+                     'older ones reply on the per call queue')
+flags.DEFINE_boolean('rpc_async_publish', False,
+                     'Publish casts, notifications and call requests from '
+                     'a queue drained by one greenthread per process')
+flags.DEFINE_integer('rpc_publish_attempts', 3,
+                     'Number of times the publish queue tries to publish a '
+                     'message that fails for reasons other than a lost '
+                     'connection')
+flags.DEFINE_integer('rpc_publish_queue_size', 1024,
+                     'Number of messages waiting to be published before '
+                     'casts block')
+flags.DEFINE_integer('rpc_publish_batch_size', 64,
+                     'Largest number of queued messages published at once')
+flags.DEFINE_string('rpc_serializer', 'json',
+                    'Codec used to encode RPC messages, json or msgpack. '
+                    'Only switch away from json once every node can decode '
+                    'the new codec')
+flags.DEFINE_integer('rpc_prefetch_count', None,
+                     'Number of messages the broker sends to a consumer '
+                     'while they wait for a free RPC worker, 0 for no '
+                     'limit.  Defaults to the size of the smallest worker '
+                     'pool.  The limit is shared by the worker pools, so '
+                     'a full long running pool backlog also holds up '
+                     'quick methods')
+flags.DEFINE_list('rpc_long_running_methods',
+                  ['run_instance', 'terminate_instance', 'rebuild_instance',
+                   'reboot_instance', 'snapshot_instance', 'resize_instance',
+                   'prep_resize', 'finish_resize', 'revert_resize',
+                   'live_migration', 'pre_live_migration', 'rescue_instance',
+                   'create_volume', 'delete_volume', 'attach_volume',
+                   'detach_volume'],
+                  'RPC methods run on the long running worker pool')
+flags.DEFINE_integer('rpc_long_running_pool_size', 64,
+                     'Size of the worker pool for long running RPC methods')
+
+
+def _register_msgpack():
+    """Register msgpack with kombu if it is installed.
+
+    Consumers decode a message with the codec named by its content type,
+    so nodes with msgpack installed can read both formats.
+
+    """
+    try:
+        import msgpack
+    except ImportError:
+        return
+
+    def _loads(data):
+        return msgpack.unpackb(data, encoding='utf-8')
+
+    kombu.serialization.registry.register('msgpack', msgpack.packb, _loads,
+            content_type='application/x-msgpack',
+            content_encoding='binary')
+
+_register_msgpack()
 
 
 class ConsumerBase(object):
@@ -80,7 +148,9 @@ class ConsumerBase(object):
         a message is read.
 
         Messages will automatically be acked if the callback doesn't
-        raise an exception
+        raise an exception.  Callbacks with a true 'acks_messages'
+        attribute are passed the ack function instead, and call it
+        themselves once they start working on the message.
         """
 
         options = {'consumer_tag': self.tag}
@@ -91,6 +161,9 @@ class ConsumerBase(object):
 
         def _callback(raw_message):
             message = self.channel.message_to_python(raw_message)
+            if getattr(callback, 'acks_messages', False):
+                callback(message.payload, message.ack)
+                return
             callback(message.payload)
             message.ack()
 
@@ -231,7 +304,7 @@ class Publisher(object):
 
     def send(self, msg):
         """Send a message"""
-        self.producer.publish(msg)
+        self.producer.publish(msg, serializer=FLAGS.rpc_serializer)
 
 
 class DirectPublisher(Publisher):
@@ -352,6 +425,7 @@ class Connection(object):
         # work around 'memory' transport bug in 1.1.3
         if self.memory_transport:
             self.channel._new_queue('ae.undeliver')
+        self._set_qos()
         for consumer in self.consumers:
             consumer.reconnect(self.channel)
         if self.consumers:
@@ -384,8 +458,27 @@ class Connection(object):
         # work around 'memory' transport bug in 1.1.3
         if self.memory_transport:
             self.channel._new_queue('ae.undeliver')
+        self._set_qos()
         self.consumers = []
 
+    def _set_qos(self):
+        """Limit the messages the broker sends ahead of our acks.
+
+        RPC messages are acked when a worker starts on them, so the broker
+        keeps delivering while the worker pools have headroom and stops
+        once the prefetch count of messages is waiting for a worker.  The
+        rest of the queue is left to other consumers.
+
+        The prefetch count applies to the channel, which every worker lane
+        shares: a lane is picked by method after delivery, so lanes can't
+        have channels of their own.  A long running lane with a backlog
+        as big as the prefetch count therefore holds up quick methods
+        queued behind it on the broker, until one of its workers frees up.
+        """
+        prefetch_count = _prefetch_count()
+        if prefetch_count and not self.memory_transport:
+            self.channel.basic_qos(0, prefetch_count, False)
+
     def declare_consumer(self, consumer_cls, topic, callback):
         """Create a Consumer using the class that was passed in and
         add it to our list of consumers
@@ -577,18 +670,156 @@ class ConnectionContext(object):
             raise exception.InvalidRPCConnectionReuse()
 
 
+class MethodStats(object):
+    """Counters and latency histograms of one RPC method."""
+
+    buckets = (0.01, 0.1, 1, 10, 60, 600)
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.queued = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.queue_wait = [0] * (len(self.buckets) + 1)
+        self.run_time = [0] * (len(self.buckets) + 1)
+
+    def _observe(self, histogram, seconds):
+        histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def received(self):
+        self.queued += 1
+
+    def started(self, received_at):
+        """Record a message leaving the backlog, returns the start time."""
+        now = time.time()
+        self.queued -= 1
+        self.in_flight += 1
+        self._observe(self.queue_wait, now - received_at)
+        return now
+
+    def finished(self, started_at):
+        self.in_flight -= 1
+        self.calls += 1
+        self._observe(self.run_time, time.time() - started_at)
+
+    def to_dict(self):
+        labels = ['<=%s' % bucket for bucket in self.buckets]
+        labels.append('>%s' % self.buckets[-1])
+        return {'lane': self.lane,
+                'queued': self.queued,
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'queue_wait': dict(zip(labels, self.queue_wait)),
+                'run_time': dict(zip(labels, self.run_time))}
+
+
+_METHOD_STATS = {}
+
+
+def _method_stats(method, lane):
+    stats = _METHOD_STATS.get(method)
+    if stats is None:
+        stats = _METHOD_STATS[method] = MethodStats(lane)
+    return stats
+
+
+def method_stats():
+    """Return the counters of every RPC method this process has received.
+
+    Histograms count the seconds messages waited for a worker and the
+    seconds the method ran, keyed by bucket upper bound.
+
+    """
+    return dict((method, stats.to_dict())
+                for method, stats in _METHOD_STATS.iteritems())
+
+
+def _prefetch_count():
+    """Number of messages a consumer may hold waiting for a worker."""
+    if FLAGS.rpc_prefetch_count is not None:
+        return FLAGS.rpc_prefetch_count
+    return min(FLAGS.rpc_thread_pool_size, FLAGS.rpc_long_running_pool_size)
+
+
+class WorkerLane(object):
+    """Runs RPC methods on a bounded pool of greenthreads.
+
+    Methods are split over lanes with pools of their own, so a burst of
+    long running methods can't hold up quick ones.  Messages arriving
+    while every worker of a lane is busy wait in its backlog.  spawn()
+    never blocks, so one busy lane doesn't hold up the consumer feeding
+    the others.  A message is only acked when a worker starts on it, so
+    the broker stops delivering once rpc_prefetch_count messages wait in
+    the backlogs of all lanes together, see Connection._set_qos().
+
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.pool = greenpool.GreenPool(size)
+        self.backlog = collections.deque()
+
+    def spawn(self, method, func, *args, **kwargs):
+        """Run func(*args) on a free worker or queue it for the next one.
+
+        If an 'ack' function is given it is called when a worker picks
+        the message up.  When the ack fails the message isn't run, as the
+        broker delivers it again.
+
+        """
+        stats = _method_stats(method, self.name)
+        stats.received()
+        item = (stats, time.time(), kwargs.get('ack'), func, args)
+        if self.backlog or not self.pool.free():
+            self.backlog.append(item)
+            return
+        self.pool.spawn_n(self._worker, item)
+
+    def _worker(self, item):
+        while True:
+            stats, received_at, ack, func, args = item
+            started_at = stats.started(received_at)
+            try:
+                if ack is not None:
+                    ack()
+                func(*args)
+            except Exception:
+                LOG.exception(_('Exception in RPC worker'))
+            finally:
+                stats.finished(started_at)
+            try:
+                item = self.backlog.popleft()
+            except IndexError:
+                return
+
+    def stats(self):
+        return {'size': self.pool.size,
+                'running': self.pool.running(),
+                'backlog': len(self.backlog)}
+
+
 class ProxyCallback(object):
     """Calls methods on a proxy object based on method and args."""
 
+    acks_messages = True
+
     def __init__(self, proxy):
         self.proxy = proxy
-        self.pool = greenpool.GreenPool(FLAGS.rpc_thread_pool_size)
+        self.pool = WorkerLane('default', FLAGS.rpc_thread_pool_size)
+        self.long_running_pool = WorkerLane('long_running',
+                                            FLAGS.rpc_long_running_pool_size)
 
-    def __call__(self, message_data):
+    def _get_lane(self, method):
+        if method in FLAGS.rpc_long_running_methods:
+            return self.long_running_pool
+        return self.pool
+
+    def __call__(self, message_data, ack=None):
         """Consumer callback to call a method on a proxy object.
 
         Parses the message for validity and fires off a thread to call the
-        proxy object method.
+        proxy object method.  'ack' acknowledges the message, and is
+        called once a worker starts on it.
 
         Message data should be a dictionary with two keys:
             method: string representing the method to call
@@ -597,15 +828,18 @@ class ProxyCallback(object):
         Example: {'method': 'echo', 'args': {'value': 42}}
 
         """
-        LOG.debug(_('received %s') % message_data)
+        LOG.debug(_('received %s'), message_data)
         ctxt = _unpack_context(message_data)
         method = message_data.get('method')
         args = message_data.get('args', {})
         if not method:
+            if ack is not None:
+                ack()
             LOG.warn(_('no method for message: %s') % message_data)
             ctxt.reply(_('No method for message: %s') % message_data)
             return
-        self.pool.spawn_n(self._process_data, ctxt, method, args)
+        self._get_lane(method).spawn(method, self._process_data,
+                                     ctxt, method, args, ack=ack)
 
     @exception.wrap_exception()
     def _process_data(self, ctxt, method, args):
@@ -634,7 +868,8 @@ class ProxyCallback(object):
 
 def _unpack_context(msg):
     """Unpack context from msg."""
-    context_dict = {}
+    context_dict = dict((str(key), value)
+                        for key, value in msg.pop('_context', {}).iteritems())
     for key in list(msg.keys()):
         # NOTE(vish): Some versions of python don't like unicode keys
         #             in kwargs.
@@ -643,6 +878,7 @@ def _unpack_context(msg):
             value = msg.pop(key)
             context_dict[key[9:]] = value
     context_dict['msg_id'] = msg.pop('_msg_id', None)
+    context_dict['reply_q'] = msg.pop('_reply_q', None)
     LOG.debug(_('unpacked context: %s'), context_dict)
     return RpcContext.from_dict(context_dict)
 
@@ -655,7 +891,13 @@ def _pack_context(msg, context):
     more arguments in rabbit messages, we may want to do the same
     for args at some point.
 
+    Nodes that use another codec than json were all upgraded to read it,
+    so they send the context as a single nested '_context' dict.
+
     """
+    if FLAGS.rpc_serializer != 'json':
+        msg['_context'] = context.to_dict()
+        return
     context_d = dict([('_context_%s' % key, value)
                       for (key, value) in context.to_dict().iteritems()])
     msg.update(context_d)
@@ -666,19 +908,24 @@ class RpcContext(context.RequestContext):
     def __init__(self, *args, **kwargs):
         msg_id = kwargs.pop('msg_id', None)
         self.msg_id = msg_id
+        self.reply_q = kwargs.pop('reply_q', None)
         super(RpcContext, self).__init__(*args, **kwargs)
 
     def reply(self, *args, **kwargs):
         if self.msg_id:
+            kwargs.setdefault('reply_q', self.reply_q)
             msg_reply(self.msg_id, *args, **kwargs)
 
 
 class MulticallWaiter(object):
-    def __init__(self, connection):
+    def __init__(self, connection, timeout=None):
         self._connection = connection
         self._iterator = connection.iterconsume()
         self._result = None
         self._done = False
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = time.time() + timeout
 
     def done(self):
         self._done = True
@@ -698,7 +945,15 @@ class MulticallWaiter(object):
         if self._done:
             raise StopIteration
         while True:
-            self._iterator.next()
+            timeout = None
+            if self._deadline is not None:
+                timeout = max(self._deadline - time.time(), 0)
+            try:
+                with eventlet.Timeout(timeout, Timeout()):
+                    self._iterator.next()
+            except Timeout:
+                self.done()
+                raise
             result = self._result
             if isinstance(result, Exception):
                 self.done()
@@ -709,33 +964,323 @@ class MulticallWaiter(object):
             yield result
 
 
+class ReplyProxy(object):
+    """Receives the replies to all calls made by this process.
+
+    Replies arrive on one long lived direct queue and are handed to the
+    waiting callers by msg_id, so a call doesn't declare and delete a
+    queue of its own or hold a pooled connection while it waits.
+
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.reply_q = 'reply_%s' % uuid.uuid4().hex
+        self._waiters = {}
+        self.connection = Connection()
+        self.connection.declare_direct_consumer(self.reply_q,
+                                                self._process_data)
+        self.connection.consume_in_thread()
+
+    def _process_data(self, message_data):
+        """The consume() callback, queue the reply for its caller."""
+        msg_id = message_data.pop('_msg_id', None)
+        waiter = self._waiters.get(msg_id)
+        if waiter is None:
+            LOG.warn(_('No caller waiting for reply to msg_id %s'), msg_id)
+            return
+        waiter.put(message_data)
+
+    def register(self, msg_id):
+        """Return the queue the replies to msg_id will be put on."""
+        waiter = queue.LightQueue()
+        self._waiters[msg_id] = waiter
+        return waiter
+
+    def unregister(self, msg_id):
+        self._waiters.pop(msg_id, None)
+
+    def close(self):
+        self.connection.close()
+        self._waiters = {}
+
+
+_REPLY_PROXY = None
+_REPLY_PROXY_LOCK = semaphore.Semaphore()
+
+
+def _get_reply_proxy():
+    """Return the ReplyProxy of this process, creating it if needed."""
+    global _REPLY_PROXY
+    with _REPLY_PROXY_LOCK:
+        # A forked child can't share its parent's consumer
+        if _REPLY_PROXY is None or _REPLY_PROXY.pid != os.getpid():
+            _REPLY_PROXY = ReplyProxy()
+        return _REPLY_PROXY
+
+
+class ReplyWaiter(object):
+    """Iterates over the replies to one call received by a ReplyProxy."""
+
+    def __init__(self, proxy, msg_id, timeout=None):
+        self._proxy = proxy
+        self._msg_id = msg_id
+        self._queue = proxy.register(msg_id)
+        self._done = False
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = time.time() + timeout
+
+    def done(self):
+        if not self._done:
+            self._done = True
+            self._proxy.unregister(self._msg_id)
+
+    def __iter__(self):
+        """Return a result until we get a 'None' response."""
+        if self._done:
+            raise StopIteration
+        while True:
+            timeout = None
+            if self._deadline is not None:
+                timeout = max(self._deadline - time.time(), 0)
+            try:
+                data = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self.done()
+                raise Timeout()
+            if data['failure']:
+                self.done()
+                raise RemoteError(*data['failure'])
+            result = data['result']
+            if result == None:
+                self.done()
+                raise StopIteration
+            yield result
+
+
+class PublishQueue(object):
+    """Publishes the messages sent by this process from a greenthread.
+
+    Senders put messages on a bounded queue, so they block once the
+    broker falls behind by rpc_publish_queue_size messages.  The
+    greenthread takes whatever is queued, up to rpc_publish_batch_size
+    messages, groups it by publisher and topic and publishes each group
+    in turn over one channel, reusing the publisher of the topic.
+    Messages to the same topic keep the order they were sent in.
+    A message that fails for a reason other than a lost connection is
+    tried again on a new publisher up to rpc_publish_attempts times.
+
+    """
+
+    def __init__(self, maxsize=None, batch_size=None):
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize or FLAGS.rpc_publish_queue_size)
+        self.batch_size = batch_size or FLAGS.rpc_publish_batch_size
+        self.connection = Connection()
+        self.publishers = {}
+        self.published = 0
+        self.batches = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.thread = eventlet.spawn(self._publish_thread)
+
+    def send(self, publisher_cls, topic, msg):
+        """Queue a message, waiting while the queue is full."""
+        self.queue.put((publisher_cls, topic, msg, time.time()))
+
+    def flush(self, timeout=None):
+        """Wait until the messages queued so far are published."""
+        done = event.Event()
+        self.queue.put((None, None, done, time.time()))
+        with eventlet.Timeout(timeout, Timeout()):
+            done.wait()
+
+    def stats(self):
+        """Return the queue depth and publish counters."""
+        avg_latency = 0.0
+        if self.published:
+            avg_latency = self.total_latency / self.published
+        return {'depth': self.queue.qsize(),
+                'published': self.published,
+                'batches': self.batches,
+                'avg_latency': avg_latency,
+                'max_latency': self.max_latency}
+
+    def close(self, timeout=None):
+        """Publish what is queued, then stop the greenthread."""
+        try:
+            if self.pid == os.getpid():
+                self.flush(timeout)
+        except Timeout:
+            LOG.error(_('Closing the publish queue with %d unpublished '
+                        'messages'), self.queue.qsize())
+        self.thread.kill()
+        self.connection.close()
+
+    def _publish_thread(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._publish_batch(batch)
+            except Exception:
+                LOG.exception(_('Failed to publish messages'))
+
+    def _publish_batch(self, batch):
+        self.batches += 1
+        groups = {}
+        keys = []
+        for publisher_cls, topic, msg, queued_at in batch:
+            if publisher_cls is None:
+                # A flush() marker, publish everything queued before it
+                self._publish_groups(keys, groups)
+                groups = {}
+                keys = []
+                msg.send()
+                continue
+            key = (publisher_cls, topic)
+            if key not in groups:
+                groups[key] = []
+                keys.append(key)
+            groups[key].append((msg, queued_at))
+        self._publish_groups(keys, groups)
+
+    def _publish_groups(self, keys, groups):
+        for key in keys:
+            self._publish_group(key, groups[key])
+
+    def _publish_group(self, key, messages):
+        publisher_cls, topic = key
+        while messages:
+            connection_errors = self.connection.connection.connection_errors
+            try:
+                publisher = self.publishers.get(key)
+                if publisher is None:
+                    publisher = publisher_cls(self.connection.channel, topic)
+                    self.publishers[key] = publisher
+                attempts = 0
+                while messages:
+                    msg, queued_at = messages[0]
+                    try:
+                        publisher.send(msg)
+                    except connection_errors:
+                        raise
+                    except Exception:
+                        attempts += 1
+                        if attempts < FLAGS.rpc_publish_attempts:
+                            LOG.exception(_('Failed to publish message to '
+                                            '%s, retrying'), topic)
+                            publisher = publisher_cls(
+                                    self.connection.channel, topic)
+                            self.publishers[key] = publisher
+                            continue
+                        LOG.exception(_('Dropping message to %(topic)s '
+                                        'after %(attempts)d attempts: '
+                                        '%(msg)s') % locals())
+                    attempts = 0
+                    messages.pop(0)
+                    latency = time.time() - queued_at
+                    self.published += 1
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+            except connection_errors, e:
+                LOG.exception(_('Failed to publish message %s') % e)
+                self.publishers = {}
+                try:
+                    self.connection.reconnect()
+                except connection_errors:
+                    pass
+
+
+_PUBLISH_QUEUE = None
+_PUBLISH_QUEUE_LOCK = semaphore.Semaphore()
+
+
+_FLUSH_AT_EXIT = []
+
+
+def _get_publish_queue():
+    """Return the PublishQueue of this process, creating it if needed."""
+    global _PUBLISH_QUEUE
+    with _PUBLISH_QUEUE_LOCK:
+        if _PUBLISH_QUEUE is None or _PUBLISH_QUEUE.pid != os.getpid():
+            _PUBLISH_QUEUE = PublishQueue()
+            if not _FLUSH_AT_EXIT:
+                atexit.register(_flush_at_exit)
+                _FLUSH_AT_EXIT.append(True)
+        return _PUBLISH_QUEUE
+
+
+def _publish(publisher_cls, topic, msg):
+    """Publish a message, through the PublishQueue if it's enabled."""
+    if FLAGS.rpc_async_publish:
+        _get_publish_queue().send(publisher_cls, topic, msg)
+    else:
+        with ConnectionContext() as conn:
+            conn.publisher_send(publisher_cls, topic, msg)
+
+
+def flush(timeout=None):
+    """Wait until the messages this process sent so far are published."""
+    if _PUBLISH_QUEUE is not None and _PUBLISH_QUEUE.pid == os.getpid():
+        _PUBLISH_QUEUE.flush(timeout)
+
+
+def publish_stats():
+    """Return the counters of the PublishQueue, see PublishQueue.stats()."""
+    if _PUBLISH_QUEUE is None:
+        return {}
+    return _PUBLISH_QUEUE.stats()
+
+
+def _flush_at_exit():
+    # Short lived commands like nova-dhcpbridge cast and exit right away
+    try:
+        flush(timeout=FLAGS.rabbit_retry_interval * 10)
+    except Timeout:
+        LOG.error(_('Exiting with unpublished messages'))
+
+
 def create_connection(new=True):
     """Create a connection"""
     return ConnectionContext(pooled=not new)
 
 
-def multicall(context, topic, msg):
+def multicall(context, topic, msg, timeout=None):
     """Make a call that returns multiple times."""
-    # Can't use 'with' for multicall, as it returns an iterator
-    # that will continue to use the connection.  When it's done,
-    # connection.close() will get called which will put it back into
-    # the pool
     LOG.debug(_('Making asynchronous call on %s ...'), topic)
     msg_id = uuid.uuid4().hex
     msg.update({'_msg_id': msg_id})
     LOG.debug(_('MSG_ID is %s') % (msg_id))
     _pack_context(msg, context)
 
+    if FLAGS.rpc_shared_reply_queue:
+        proxy = _get_reply_proxy()
+        msg['_reply_q'] = proxy.reply_q
+        # Register before sending so a fast reply isn't dropped
+        wait_msg = ReplyWaiter(proxy, msg_id, timeout)
+        _publish(TopicPublisher, topic, msg)
+        return wait_msg
+
+    # Can't use 'with' for multicall, as it returns an iterator
+    # that will continue to use the connection.  When it's done,
+    # connection.close() will get called which will put it back into
+    # the pool
     conn = ConnectionContext()
-    wait_msg = MulticallWaiter(conn)
+    wait_msg = MulticallWaiter(conn, timeout)
     conn.declare_direct_consumer(msg_id, wait_msg)
-    conn.topic_send(topic, msg)
+    _publish(TopicPublisher, topic, msg)
     return wait_msg
 
 
-def call(context, topic, msg):
+def call(context, topic, msg, timeout=None):
     """Sends a message on a topic and wait for a response."""
-    rv = multicall(context, topic, msg)
+    rv = multicall(context, topic, msg, timeout)
     # NOTE(vish): return the last result from the multicall
     rv = list(rv)
     if not rv:
@@ -747,22 +1292,36 @@ def cast(context, topic, msg):
     """Sends a message on a topic without waiting for a response."""
     LOG.debug(_('Making asynchronous cast on %s...'), topic)
     _pack_context(msg, context)
-    with ConnectionContext() as conn:
-        conn.topic_send(topic, msg)
+    _publish(TopicPublisher, topic, msg)
 
 
 def fanout_cast(context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
     _pack_context(msg, context)
-    with ConnectionContext() as conn:
-        conn.fanout_send(topic, msg)
+    _publish(FanoutPublisher, topic, msg)
+
 
+def cleanup():
+    """Stop receiving replies on the shared reply queue and stop
+    publishing from the publish queue."""
+    global _REPLY_PROXY
+    global _PUBLISH_QUEUE
+    with _REPLY_PROXY_LOCK:
+        if _REPLY_PROXY is not None:
+            _REPLY_PROXY.close()
+            _REPLY_PROXY = None
+    with _PUBLISH_QUEUE_LOCK:
+        if _PUBLISH_QUEUE is not None:
+            _PUBLISH_QUEUE.close(timeout=FLAGS.rabbit_retry_interval * 10)
+            _PUBLISH_QUEUE = None
 
-def msg_reply(msg_id, reply=None, failure=None):
+
+def msg_reply(msg_id, reply=None, failure=None, reply_q=None):
     """Sends a reply or an error on the channel signified by msg_id.
 
-    Failure should be a sys.exc_info() tuple.
+    Failure should be a sys.exc_info() tuple.  If the caller named a
+    shared reply queue, the reply is sent there tagged with msg_id.
 
     """
     with ConnectionContext() as conn:
@@ -779,4 +1338,8 @@ def msg_reply(msg_id, reply=None, failure=None):
             msg = {'result': dict((k, repr(v))
                             for k, v in reply.__dict__.iteritems()),
                     'failure': failure}
-        conn.direct_send(msg_id, msg)
+        if reply_q:
+            msg['_msg_id'] = msg_id
+            conn.direct_send(reply_q, msg)
+        else:
+            conn.direct_send(msg_id, msg)
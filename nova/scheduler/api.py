@@ -105,6 +105,24 @@ def update_service_capabilities(context, service_name, host, capabilities):
     return rpc.fanout_cast(context, 'scheduler', kwargs)
 
 
+def update_instance_resources(context, host, instance):
+    """Send an update to all the scheduler services informing them
+       of the resources an instance now consumes on a host."""
+    kwargs = dict(method='update_instance_resources',
+                  args=dict(host=host, instance_uuid=instance['uuid'],
+                            local_gb=instance['local_gb'],
+                            memory_mb=instance['memory_mb']))
+    return rpc.fanout_cast(context, 'scheduler', kwargs)
+
+
+def delete_instance_resources(context, instance):
+    """Send an update to all the scheduler services informing them
+       that an instance no longer consumes any resources."""
+    kwargs = dict(method='delete_instance_resources',
+                  args=dict(instance_uuid=instance['uuid']))
+    return rpc.fanout_cast(context, 'scheduler', kwargs)
+
+
 def call_zone_method(context, method_name, errors_to_ignore=None,
                      novaclient_collection_name='zones', zones=None,
                      *args, **kwargs):
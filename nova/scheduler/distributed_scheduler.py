@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import json
 import operator
 import types
@@ -37,6 +38,7 @@ from nova import rpc
 from nova.scheduler import api
 from nova.scheduler import driver
 from nova.scheduler import filters
+from nova.scheduler.filters import filter_chain
 from nova.scheduler import least_cost
 from nova.scheduler import scheduler_options
 from nova import utils
@@ -62,6 +64,7 @@ class DistributedScheduler(driver.Scheduler):
     def __init__(self, *args, **kwargs):
         super(DistributedScheduler, self).__init__(*args, **kwargs)
         self.cost_function_cache = {}
+        self.filter_chain_cache = {}
         self.options = scheduler_options.SchedulerOptions()
 
     def schedule(self, context, topic, method, *args, **kwargs):
@@ -171,6 +174,10 @@ class DistributedScheduler(driver.Scheduler):
                                     kwargs):
         """Create the requested resource in this Zone."""
         instance = self.create_instance_db_entry(context, request_spec)
+        # Account for the instance right away so the next request
+        # doesn't have to wait for the compute node to report it.
+        self.zone_manager.update_instance_resources(weighted_host.host,
+                instance['uuid'], instance['local_gb'], instance['memory_mb'])
         driver.cast_to_compute_host(context, weighted_host.host,
                 'run_instance', instance_id=instance['id'], **kwargs)
         return driver.encode_instance(instance, local=True)
@@ -300,10 +307,15 @@ class DistributedScheduler(driver.Scheduler):
 
         options = self._get_configuration_options()
 
-        # Find our local list of acceptable hosts by repeatedly
-        # filtering and weighing our options. Each time we choose a
-        # host, we virtually consume resources on it so subsequent
-        # selections can adjust accordingly.
+        # Find our local list of acceptable hosts by filtering and
+        # weighing our options once, then placing instances off a heap
+        # ordered by weight. Each time we choose a host, we virtually
+        # consume resources on it so subsequent selections can adjust
+        # accordingly. Only that host changed, so it's the only one
+        # that needs to be filtered and weighed again. The hosts no
+        # instance landed on keep their weights, so the n-th instance
+        # goes to a host we already chose or to one of the n best hosts
+        # of the first pass; only those start on the heap.
 
         # unfiltered_hosts_dict is {host : ZoneManager.HostInfo()}
         unfiltered_hosts_dict = self.zone_manager.get_all_host_data(elevated)
@@ -311,28 +323,42 @@ class DistributedScheduler(driver.Scheduler):
 
         num_instances = request_spec.get('num_instances', 1)
         selected_hosts = []
-        for num in xrange(num_instances):
-            # Filter local hosts based on requirements ...
-            filtered_hosts = self._filter_hosts(topic, request_spec,
-                    unfiltered_hosts, options)
 
-            if not filtered_hosts:
+        # Filter local hosts based on requirements ...
+        filtered_hosts = self._filter_hosts(topic, request_spec,
+                unfiltered_hosts, options)
+        LOG.debug(_("Filtered %(filtered_hosts)s") % locals())
+
+        # Ties are broken by host name, as a full sort would.
+        weighted_heap = [(weighted_host.weight, weighted_host.host,
+                          weighted_host) for weighted_host in
+                         least_cost.best_hosts(cost_functions,
+                                               filtered_hosts, options,
+                                               count=num_instances)]
+        heapq.heapify(weighted_heap)
+
+        for num in xrange(num_instances):
+            if not weighted_heap:
                 # Can't get any more locally.
                 break
 
-            LOG.debug(_("Filtered %(filtered_hosts)s") % locals())
-
             # weighted_host = WeightedHost() ... the best
             # host for the job.
-            weighted_host = least_cost.weighted_sum(cost_functions,
-                                                filtered_hosts, options)
+            weight, host, weighted_host = heapq.heappop(weighted_heap)
             LOG.debug(_("Weighted %(weighted_host)s") % locals())
             selected_hosts.append(weighted_host)
 
             # Now consume the resources so the filter/weights
             # will change for the next instance.
-            weighted_host.hostinfo.consume_resources(disk_requirement_bg,
-                                        ram_requirement_mb)
+            hostinfo = weighted_host.hostinfo
+            hostinfo.consume_resources(disk_requirement_bg,
+                                       ram_requirement_mb)
+            refiltered_hosts = self._filter_hosts(topic, request_spec,
+                    [(host, hostinfo)], options)
+            for reweighted_host in least_cost.weigh_hosts(cost_functions,
+                    refiltered_hosts, options):
+                heapq.heappush(weighted_heap, (reweighted_host.weight,
+                        reweighted_host.host, reweighted_host))
 
         # Next, tack on the host weights from the child zones
         if not request_spec.get('local_zone', False):
@@ -384,10 +410,25 @@ class DistributedScheduler(driver.Scheduler):
             raise exception.SchedulerHostFilterNotFound(filter_name=msg)
         return good_filters
 
+    def _get_filter_chain(self):
+        """Returns the FilterChain for the configured host filters,
+        building it the first time a configuration is seen."""
+        key = tuple(FLAGS.default_host_filters)
+        chain = self.filter_chain_cache.get(key)
+        if chain is None:
+            chain = filter_chain.FilterChain(self._choose_host_filters())
+            self.filter_chain_cache[key] = chain
+        return chain
+
+    def get_filter_stats(self):
+        """Returns per-filter call, host, rejection and timing totals
+        for the configured host filters."""
+        return self._get_filter_chain().get_stats()
+
     def _filter_hosts(self, topic, request_spec, hosts, options):
         """Filter the full host list. hosts = [(host, HostInfo()), ...].
         This method returns a subset of hosts, in the same format."""
-        selected_filters = self._choose_host_filters()
+        chain = self._get_filter_chain()
 
         # Filter out original host
         if ('original_host' in request_spec and
@@ -403,11 +444,7 @@ class DistributedScheduler(driver.Scheduler):
             # No way to select; return the specified hosts.
             return hosts
 
-        for selected_filter in selected_filters:
-            query = selected_filter.instance_type_to_filter(instance_type)
-            hosts = selected_filter.filter_hosts(hosts, query, options)
-
-        return hosts
+        return chain.filter_hosts(hosts, instance_type, options)
 
     def get_cost_functions(self, topic=None):
         """Returns a list of tuples containing weights and cost functions to
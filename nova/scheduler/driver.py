@@ -31,12 +31,11 @@ from nova.compute import api as compute_api
 from nova.compute import power_state
 from nova.compute import vm_states
 from nova.api.ec2 import ec2utils
+from nova.servicegroup import api as servicegroup
 
 
 FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.scheduler.driver')
-flags.DEFINE_integer('service_down_time', 60,
-                     'maximum time since last check-in for up service')
 flags.DECLARE('instances_path', 'nova.compute.manager')
 
 
@@ -129,18 +128,16 @@ class Scheduler(object):
     @staticmethod
     def service_is_up(service):
         """Check whether a service is up based on last heartbeat."""
-        last_heartbeat = service['updated_at'] or service['created_at']
-        # Timestamps in DB are UTC.
-        elapsed = utils.total_seconds(utils.utcnow() - last_heartbeat)
-        return abs(elapsed) <= FLAGS.service_down_time
+        return servicegroup.is_up(service)
+
+    @staticmethod
+    def services_up(context, services):
+        """Check a list of services at once, see servicegroup.are_up."""
+        return servicegroup.are_up(context, services)
 
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
-
-        services = db.service_get_all_by_topic(context, topic)
-        return [service.host
-                for service in services
-                if self.service_is_up(service)]
+        return servicegroup.get_all_up(context, topic)
 
     def create_instance_db_entry(self, context, request_spec):
         """Create instance DB entry based on request_spec"""
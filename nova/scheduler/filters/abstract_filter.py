@@ -19,10 +19,20 @@ import nova.scheduler
 
 class AbstractHostFilter(object):
     """Base class for host filters."""
+
+    # Relative cost of filtering one host. Cheaper filters are run first
+    # so the expensive ones see fewer hosts.
+    cost = 1
+
     def instance_type_to_filter(self, instance_type):
         """Convert instance_type into a filter for most common use-case."""
         raise NotImplementedError()
 
+    def prepare_query(self, query):
+        """Turn a query into whatever form filter_hosts() works on
+        fastest. Called once per request, not once per filter_hosts()."""
+        return query
+
     def filter_hosts(self, host_list, query, options):
         """Return a list of hosts that fulfill the filter."""
         raise NotImplementedError()
@@ -20,6 +20,8 @@ import abstract_filter
 
 class AllHostsFilter(abstract_filter.AbstractHostFilter):
     """NOP host filter. Returns all hosts in ZoneManager."""
+    cost = 0
+
     def instance_type_to_filter(self, instance_type):
         """Return anything to prevent base-class from raising
         exception.
@@ -0,0 +1,90 @@
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+A FilterChain runs a list of host filter instances over the hosts for
+a request. It's built once per filter configuration and reused, and
+keeps running counts of how long each filter takes and how many hosts
+it turns away.
+"""
+
+import operator
+import time
+
+
+class FilterStats(object):
+    """Running totals for one filter in a FilterChain."""
+
+    def __init__(self):
+        self.calls = 0
+        self.hosts = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return dict(calls=self.calls, hosts=self.hosts,
+                    rejected=self.rejected, seconds=self.seconds)
+
+
+class FilterChain(object):
+    """An ordered list of host filter instances.
+
+    Filters run cheapest first (see AbstractHostFilter.cost), keeping
+    the configured order among filters of the same cost, and a host
+    rejected by one filter is never shown to the next. Queries are
+    built and prepared once per instance_type rather than once per
+    filter_hosts() call.
+    """
+
+    def __init__(self, host_filters):
+        self.host_filters = sorted(host_filters,
+                                   key=operator.attrgetter('cost'))
+        self.stats = [(host_filter._full_name(), FilterStats())
+                      for host_filter in self.host_filters]
+        self._queries_instance_type = None
+        self._queries = None
+
+    def _get_queries(self, instance_type):
+        """The same instance_type is filtered on over and over while
+        placing the instances of one request."""
+        if instance_type is not self._queries_instance_type:
+            self._queries = [host_filter.prepare_query(
+                                host_filter.instance_type_to_filter(
+                                                        instance_type))
+                             for host_filter in self.host_filters]
+            self._queries_instance_type = instance_type
+        return self._queries
+
+    def filter_hosts(self, host_list, instance_type, options):
+        """Return the hosts that pass every filter.
+        host_list = [(host, HostInfo()), ...]."""
+        queries = self._get_queries(instance_type)
+        for host_filter, query, (name, stats) in zip(self.host_filters,
+                                                     queries, self.stats):
+            if not host_list:
+                break
+            start = time.time()
+            filtered_hosts = host_filter.filter_hosts(host_list, query,
+                                                      options)
+            stats.seconds += time.time() - start
+            stats.calls += 1
+            stats.hosts += len(host_list)
+            stats.rejected += len(host_list) - len(filtered_hosts)
+            host_list = filtered_hosts
+        return host_list
+
+    def get_stats(self):
+        """Per-filter totals, in the order the filters run."""
+        return [(name, stats.to_dict()) for name, stats in self.stats]
@@ -17,14 +17,29 @@
 import json
 import operator
 
+from nova import flags
 import nova.scheduler
 from nova.scheduler.filters import abstract_filter
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('json_filter_cache_size', 256,
+        'Number of compiled JsonFilter queries to keep around.')
 
 
 class JsonFilter(abstract_filter.AbstractHostFilter):
     """Host Filter to allow simple JSON-based grammar for
     selecting hosts.
+
+    Queries are compiled once into a tree of closures, with capability
+    lookups pre-split, and the compiled form is cached by query string.
+    filter_hosts() takes a JSON string, the decoded query structure or
+    the result of prepare_query().
     """
+    cost = 10
+    _compiled_queries = None
+
     def _op_compare(self, args, op):
         """Returns True if the specified operator can successfully
         compare the first item in the args with all the rest. Will
@@ -94,51 +109,89 @@ class JsonFilter(abstract_filter.AbstractHostFilter):
         query = ['and',
                 ['>=', '$compute.host_memory_free', required_ram],
                 ['>=', '$compute.disk_available', required_disk]]
-        return json.dumps(query)
+        return query
 
-    def _parse_string(self, string, host, hostinfo):
+    def _compile_string(self, string):
         """Strings prefixed with $ are capability lookups in the
-        form '$service.capability[.subcap*]'.
+        form '$service.capability[.subcap*]'. Returns a function of
+        the hostinfo, or None if the string is always None.
         """
         if not string:
             return None
         if not string.startswith("$"):
-            return string
+            return lambda hostinfo: string
 
         path = string[1:].split(".")
-        services = dict(compute=hostinfo.compute, network=hostinfo.network,
-                        volume=hostinfo.volume)
-        service = services.get(path[0], None)
-        if not service:
-            return None
-        for item in path[1:]:
-            service = service.get(item, None)
+        service_name = path[0]
+        keys = path[1:]
+        if service_name not in ('compute', 'network', 'volume'):
+            return lambda hostinfo: None
+
+        def lookup(hostinfo):
+            service = getattr(hostinfo, service_name)
             if not service:
                 return None
-        return service
-
-    def _process_filter(self, query, host, hostinfo):
-        """Recursively parse the query structure."""
+            for item in keys:
+                service = service.get(item, None)
+                if not service:
+                    return None
+            return service
+        return lookup
+
+    def _compile_filter(self, query):
+        """Recursively compile the query structure into a function
+        of the hostinfo."""
         if not query:
-            return True
+            return lambda hostinfo: True
         cmd = query[0]
         method = self.commands[cmd]
-        cooked_args = []
+        arg_fns = []
         for arg in query[1:]:
             if isinstance(arg, list):
-                arg = self._process_filter(arg, host, hostinfo)
+                arg_fn = self._compile_filter(arg)
             elif isinstance(arg, basestring):
-                arg = self._parse_string(arg, host, hostinfo)
-            if arg is not None:
-                cooked_args.append(arg)
-        result = method(self, cooked_args)
-        return result
+                arg_fn = self._compile_string(arg)
+            else:
+                arg_fn = lambda hostinfo, arg=arg: arg
+            if arg_fn is not None:
+                arg_fns.append(arg_fn)
+
+        def process(hostinfo):
+            cooked_args = []
+            for arg_fn in arg_fns:
+                arg = arg_fn(hostinfo)
+                if arg is not None:
+                    cooked_args.append(arg)
+            return method(self, cooked_args)
+        return process
+
+    def _get_compiled_filter(self, query):
+        """Return the compiled form of a query. JSON query strings are
+        cached, query structures are compiled every time."""
+        if callable(query):
+            # Already compiled by prepare_query()
+            return query
+        if not isinstance(query, basestring):
+            return self._compile_filter(query)
+        if JsonFilter._compiled_queries is None:
+            JsonFilter._compiled_queries = utils.LRUCache(
+                    FLAGS.json_filter_cache_size)
+        key = (self.__class__, query)
+        compiled = JsonFilter._compiled_queries.get(key)
+        if compiled is None:
+            compiled = self._compile_filter(json.loads(query))
+            JsonFilter._compiled_queries[key] = compiled
+        return compiled
+
+    def prepare_query(self, query):
+        """Compile the query up front."""
+        return self._get_compiled_filter(query)
 
     def filter_hosts(self, host_list, query, options):
         """Return a list of hosts that can fulfill the requirements
         specified in the query.
         """
-        expanded = json.loads(query)
+        compiled = self._get_compiled_filter(query)
         filtered_hosts = []
         for host, hostinfo in host_list:
             if not hostinfo:
@@ -146,7 +199,7 @@ class JsonFilter(abstract_filter.AbstractHostFilter):
             if hostinfo.compute and not hostinfo.compute.get("enabled", True):
                 # Host is disabled
                 continue
-            result = self._process_filter(expanded, host, hostinfo)
+            result = compiled(hostinfo)
             if isinstance(result, list):
                 # If any succeeded, include the host
                 result = any(result)
@@ -20,8 +20,18 @@ The WeightedHost contains a combined weight for each cost-function.
 
 The cost-function and weights are tabulated, and the host with the least cost
 is then selected for provisioning.
+
+When many hosts are weighed at once, their metrics are laid out in
+NumPy arrays so that cost-functions which declare a vectorized form with
+the @vectorized decorator are evaluated once per column rather than once
+per host. Plain cost-functions still work, one host at a time.  A few
+hosts, such as the one host re-weighed after each placement, are cheaper
+to weigh one at a time.
 """
 
+import heapq
+
+import numpy
 
 from nova import flags
 from nova import log as logging
@@ -42,6 +52,9 @@ flags.DEFINE_float('noop_cost_fn_weight', 1.0,
 flags.DEFINE_float('compute_fill_first_cost_fn_weight', 1.0,
              'How much weight to give the fill-first cost function')
 
+# NOTE: building the columns costs more than it saves below this many hosts.
+VECTORIZE_MIN_HOSTS = 32
+
 
 class WeightedHost(object):
     """Reduced set of information about a host that has been weighed.
@@ -68,17 +81,138 @@ class WeightedHost(object):
         return x
 
 
+class HostColumns(object):
+    """Columnar view of the metrics of a list of hosts. Each column is a
+    NumPy array built on first access from the HostInfo attribute of
+    the same name.
+
+    host_list - [(host, HostInfo()), ...]
+    """
+
+    def __init__(self, host_list):
+        self.hosts = [host for host, host_info in host_list]
+        self.host_infos = [host_info for host, host_info in host_list]
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __getitem__(self, metric):
+        column = self._columns.get(metric)
+        if column is None:
+            column = numpy.array([getattr(host_info, metric)
+                                  for host_info in self.host_infos],
+                                 dtype=float)
+            self._columns[metric] = column
+        return column
+
+
+def vectorized(column_fn):
+    """Decorator declaring the vectorized form of a cost-function.
+
+    column_fn(columns, options) takes a HostColumns and returns the cost
+    of every host in it, in order, as a NumPy array. It's only used when
+    there are at least VECTORIZE_MIN_HOSTS hosts to weigh; otherwise the
+    cost-function is called per host.
+    """
+    def decorator(fn):
+        fn.vectorized = column_fn
+        return fn
+    return decorator
+
+
+@vectorized(lambda columns, options: numpy.ones(len(columns)))
 def noop_cost_fn(host_info, options=None):
     """Return a pre-weight cost of 1 for each host"""
     return 1
 
 
+@vectorized(lambda columns, options: columns['free_ram_mb'])
 def compute_fill_first_cost_fn(host_info, options=None):
     """More free ram = higher weight. So servers will less free
     ram will be preferred."""
     return host_info.free_ram_mb
 
 
+def score_hosts(weighted_fns, host_infos, options):
+    """Compute the weighted sum of the objective-functions for each
+    HostInfo, one host at a time. Returns a list of scores."""
+    return [sum((weight * fn(host_info, options)
+                 for weight, fn in weighted_fns), 0.0)
+            for host_info in host_infos]
+
+
+def score_columns(weighted_fns, columns, options):
+    """Compute the weighted sum of the objective-functions for every
+    host in a HostColumns. Returns a NumPy array of scores."""
+    totals = numpy.zeros(len(columns))
+    for weight, fn in weighted_fns:
+        column_fn = getattr(fn, 'vectorized', None)
+        if column_fn:
+            costs = column_fn(columns, options)
+        else:
+            costs = numpy.array([fn(host_info, options)
+                                 for host_info in columns.host_infos],
+                                dtype=float)
+        totals += weight * costs
+    return totals
+
+
+def weigh_hosts(weighted_fns, host_list, options):
+    """Compute the weighted sum of the objective-functions for each host
+    on its own. Since a host's score doesn't depend on any other host,
+    callers can re-weigh just the hosts that changed.
+
+    host_list - [(host, HostInfo()), ...]
+    weighted_fns - list of weights and functions like:
+        [(weight, objective-functions), ...]
+    options is an arbitrary dict of values.
+
+    Returns a list of WeightedHost objects, in the same order as host_list.
+    """
+    if len(host_list) < VECTORIZE_MIN_HOSTS:
+        scores = score_hosts(weighted_fns,
+                             [host_info for host, host_info in host_list],
+                             options)
+    else:
+        scores = score_columns(weighted_fns, HostColumns(host_list), options)
+    return [WeightedHost(float(score), host=host, hostinfo=host_info)
+            for score, (host, host_info) in zip(scores, host_list)]
+
+
+def best_hosts(weighted_fns, host_list, options, count=1):
+    """Return the (up to) count lowest scoring hosts as WeightedHost
+    objects, best first. Ties go to the lowest host name.
+
+    Only the winners are sorted; among many hosts they are picked out
+    with a partial sort.
+    """
+    if not host_list or count < 1:
+        return []
+    if len(host_list) < VECTORIZE_MIN_HOSTS:
+        scores = score_hosts(weighted_fns,
+                             [host_info for host, host_info in host_list],
+                             options)
+        ranked = heapq.nsmallest(count, ((score, host, idx)
+                for idx, (score, (host, host_info)) in enumerate(
+                                                zip(scores, host_list))))
+    else:
+        columns = HostColumns(host_list)
+        scores = score_columns(weighted_fns, columns, options)
+        if count < len(columns):
+            # Anything scoring the same as the count'th best host is
+            # still in the running, host name decides.
+            threshold = scores[numpy.argpartition(scores, count - 1)[
+                                                                count - 1]]
+            candidates = numpy.flatnonzero(scores <= threshold)
+        else:
+            candidates = xrange(len(columns))
+        ranked = sorted((float(scores[idx]), columns.hosts[idx], idx)
+                        for idx in candidates)[:count]
+    return [WeightedHost(score, host=host, hostinfo=host_list[idx][1])
+            for score, host, idx in ranked]
+
+
 def weighted_sum(weighted_fns, host_list, options):
     """Use the weighted-sum method to compute a score for an array of objects.
     Normalize the results of the objective-functions so that the weights are
@@ -93,30 +227,5 @@ def weighted_sum(weighted_fns, host_list, options):
     candidate.
     """
 
-    # Make a grid of functions results.
-    # One row per host. One column per function.
-    scores = []
-    for weight, fn in weighted_fns:
-        scores.append([fn(host_info, options) for hostname, host_info
-                                                                in host_list])
-
-    # Adjust the weights in the grid by the functions weight adjustment
-    # and sum them up to get a final list of weights.
-    adjusted_scores = []
-    for (weight, fn), row in zip(weighted_fns, scores):
-        adjusted_scores.append([weight * score for score in row])
-
-    # Now, sum down the columns to get the final score. Column per host.
-    final_scores = [0.0] * len(host_list)
-    for row in adjusted_scores:
-        for idx, col in enumerate(row):
-            final_scores[idx] += col
-
-    # Super-impose the hostinfo into the scores so
-    # we don't lose it when we sort.
-    final_scores = [(final_scores[idx], host_tuple)
-                    for idx, host_tuple in enumerate(host_list)]
-
-    final_scores = sorted(final_scores)
-    weight, (host, hostinfo) = final_scores[0]  # Lowest score is the winner!
-    return WeightedHost(weight, host=host, hostinfo=hostinfo)
+    # Lowest score is the winner!
+    return best_hosts(weighted_fns, host_list, options)[0]
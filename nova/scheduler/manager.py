@@ -31,6 +31,7 @@ from nova import manager
 from nova import rpc
 from nova import utils
 from nova.scheduler import zone_manager
+from nova.servicegroup import api as servicegroup
 
 LOG = logging.getLogger('nova.scheduler.manager')
 FLAGS = flags.FLAGS
@@ -78,6 +79,25 @@ class SchedulerManager(manager.Manager):
         self.zone_manager.update_service_capabilities(service_name,
                             host, capabilities)
 
+    def service_heartbeat(self, context=None, topic=None, host=None):
+        """Process a heartbeat fanned out by the rpc servicegroup driver."""
+        servicegroup.get_driver().heartbeat_received(topic, host)
+
+    def get_service_heartbeats(self, context=None):
+        """Get [topic, host, seconds since heartbeat] of known services."""
+        return servicegroup.get_driver().get_heartbeats()
+
+    def update_instance_resources(self, context=None, host=None,
+                                  instance_uuid=None, local_gb=0,
+                                  memory_mb=0):
+        """Process an instance create/resize from a compute node."""
+        self.zone_manager.update_instance_resources(host, instance_uuid,
+                            local_gb, memory_mb)
+
+    def delete_instance_resources(self, context=None, instance_uuid=None):
+        """Process an instance delete from a compute node."""
+        self.zone_manager.delete_instance_resources(instance_uuid)
+
     def select(self, context=None, *args, **kwargs):
         """Select a list of hosts best matching the provided specs."""
         return self.driver.select(context, *args, **kwargs)
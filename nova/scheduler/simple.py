@@ -59,12 +59,13 @@ class SimpleScheduler(chance.ChanceScheduler):
         if zone:
             results = [(service, cores) for (service, cores) in results
                        if service['availability_zone'] == zone]
-        for result in results:
+        ups = self.services_up(elevated, [result[0] for result in results])
+        for result, up in zip(results, ups):
             (service, instance_cores) = result
             if instance_cores + instance_opts['vcpus'] > FLAGS.max_cores:
                 msg = _("All hosts have too many cores")
                 raise exception.NoValidHost(reason=msg)
-            if self.service_is_up(service):
+            if up:
                 return service['host']
         msg = _("Is the appropriate service running?")
         raise exception.NoValidHost(reason=msg)
@@ -111,12 +112,13 @@ class SimpleScheduler(chance.ChanceScheduler):
         if zone:
             results = [(service, gigs) for (service, gigs) in results
                        if service['availability_zone'] == zone]
-        for result in results:
+        ups = self.services_up(elevated, [result[0] for result in results])
+        for result, up in zip(results, ups):
             (service, volume_gigabytes) = result
             if volume_gigabytes + volume_ref['size'] > FLAGS.max_gigabytes:
                 msg = _("All hosts have too many gigabytes")
                 raise exception.NoValidHost(reason=msg)
-            if self.service_is_up(service):
+            if up:
                 driver.cast_to_volume_host(context, service['host'],
                         'create_volume', volume_id=volume_id, **_kwargs)
                 return None
@@ -128,12 +130,13 @@ class SimpleScheduler(chance.ChanceScheduler):
         elevated = context.elevated()
 
         results = db.service_get_all_network_sorted(elevated)
-        for result in results:
+        ups = self.services_up(elevated, [result[0] for result in results])
+        for result, up in zip(results, ups):
             (service, instance_count) = result
             if instance_count >= FLAGS.max_networks:
                 msg = _("All hosts have too many networks")
                 raise exception.NoValidHost(reason=msg)
-            if self.service_is_up(service):
+            if up:
                 driver.cast_to_network_host(context, service['host'],
                         'set_network_host', **_kwargs)
                 return None
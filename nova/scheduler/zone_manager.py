@@ -25,6 +25,7 @@ import UserDict
 from eventlet import greenpool
 from novaclient import v1_1 as novaclient
 
+from nova.compute import vm_states
 from nova import db
 from nova import flags
 from nova import log as logging
@@ -39,6 +40,9 @@ flags.DEFINE_integer('reserved_host_disk_mb', 0,
         'Amount of disk in MB to reserve for host/dom0')
 flags.DEFINE_integer('reserved_host_memory_mb', 512,
         'Amount of memory in MB to reserve for host/dom0')
+flags.DEFINE_integer('host_data_sync_interval', 600,
+        'Seconds between reconciling the in-memory host resource view '
+        'with the db.')
 
 
 class ZoneState(object):
@@ -118,6 +122,7 @@ def _poll_zone(zone):
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
     def __init__(self, source=None):
+        self.data = {}
         self.update(source)
 
     def __setitem__(self, key, item):
@@ -188,6 +193,14 @@ class ZoneManager(object):
         self.service_states = {}  # { <host> : { <service> : { cap k : v }}}
         self.green_pool = greenpool.GreenPool()
 
+        # In-memory view of host resources. Seeded from the db by
+        # sync_host_data() and kept current by instance resource updates.
+        self.last_host_data_sync = datetime.datetime.min
+        self.host_data_dirty = True
+        self.compute_nodes = {}  # { <host> : { 'local_gb', 'memory_mb' }}
+        self.instance_resources = {}  # { <uuid> : (host, disk_gb, ram_mb) }
+        self.host_usage = {}  # { <host> : [used disk_gb, used ram_mb] }
+
     def get_zone_list(self):
         """Return the list of zones we know about."""
         return [zone.to_dict() for zone in self.zone_states.values()]
@@ -212,52 +225,101 @@ class ZoneManager(object):
         """Broken out for testing."""
         return db.instance_get_all(context)
 
-    def get_all_host_data(self, context):
-        """Returns a dict of all the hosts the ZoneManager
-        knows about. Also, each of the consumable resources in HostInfo
-        are pre-populated and adjusted based on data in the db.
+    def _host_data_stale(self):
+        """Check if the host resource view needs to be rebuilt from db."""
+        if self.host_data_dirty:
+            return True
+        diff = utils.utcnow() - self.last_host_data_sync
+        return diff >= datetime.timedelta(
+                seconds=FLAGS.host_data_sync_interval)
 
-        For example:
-        {'192.168.1.100': HostInfo(), ...}
+    def sync_host_data(self, context):
+        """Rebuild the host resource view from the compute_nodes and
+        instances tables. This is the slow path: it's only run on
+        startup, periodically to reconcile any missed updates, and when
+        a compute node we haven't seen before reports in.
 
-        Note: this can be very slow with a lot of instances.
         InstanceType table isn't required since a copy is stored
         with the instance (in case the InstanceType changed since the
         instance was created)."""
-
-        # Make a compute node dict with the bare essential metrics.
-        compute_nodes = self._compute_node_get_all(context)
-        host_info_map = {}
-        for compute in compute_nodes:
-            all_disk = compute['local_gb']
-            all_ram = compute['memory_mb']
+        logging.debug(_("Syncing host resource data from db."))
+        compute_nodes = {}
+        for compute in self._compute_node_get_all(context):
             service = compute['service']
             if not service:
                 logging.warn(_("No service for compute ID %s") % compute['id'])
                 continue
+            compute_nodes[service['host']] = dict(
+                    local_gb=compute['local_gb'],
+                    memory_mb=compute['memory_mb'])
+
+        self.compute_nodes = compute_nodes
+        self.instance_resources = {}
+        self.host_usage = {}
+        for instance in self._instance_get_all(context):
+            host = instance['host']
+            if not host:
+                continue
+            # NOTE: instances that failed to spawn hold no resources.
+            if (instance.get('vm_state') == vm_states.ERROR and
+                    not instance.get('launched_at')):
+                continue
+            self.update_instance_resources(host, instance['uuid'],
+                    instance['local_gb'], instance['memory_mb'])
+
+        self.last_host_data_sync = utils.utcnow()
+        self.host_data_dirty = False
+
+    def update_instance_resources(self, host, instance_uuid, local_gb,
+                                  memory_mb):
+        """Record the resources an instance consumes on a host. Called
+        on create and resize; any previous record for the instance is
+        released first."""
+        self.delete_instance_resources(instance_uuid)
+        self.instance_resources[instance_uuid] = (host, local_gb, memory_mb)
+        usage = self.host_usage.setdefault(host, [0, 0])
+        usage[0] += local_gb
+        usage[1] += memory_mb
+
+    def delete_instance_resources(self, instance_uuid):
+        """Release the resources an instance was consuming, if any."""
+        record = self.instance_resources.pop(instance_uuid, None)
+        if not record:
+            return
+        host, local_gb, memory_mb = record
+        usage = self.host_usage.get(host)
+        if usage:
+            usage[0] -= local_gb
+            usage[1] -= memory_mb
 
-            host = service['host']
+    def get_all_host_data(self, context):
+        """Returns a dict of all the hosts the ZoneManager
+        knows about. Also, each of the consumable resources in HostInfo
+        are pre-populated and adjusted based on the in-memory view
+        of instance resources.
+
+        For example:
+        {'192.168.1.100': HostInfo(), ...}
+
+        The db is only consulted when the view is stale.
+        See sync_host_data()."""
+        if self._host_data_stale():
+            self.sync_host_data(context)
+
+        host_info_map = {}
+        for host, compute in self.compute_nodes.iteritems():
             caps = self.service_states.get(host, None)
             host_info = HostInfo(host, caps=caps,
-                    free_disk_gb=all_disk, free_ram_mb=all_ram)
+                    free_disk_gb=compute['local_gb'],
+                    free_ram_mb=compute['memory_mb'])
             # Reserve resources for host/dom0
             host_info.consume_resources(FLAGS.reserved_host_disk_mb * 1024,
                     FLAGS.reserved_host_memory_mb)
+            # "Consume" resources used by instances on this host.
+            used_disk, used_ram = self.host_usage.get(host, (0, 0))
+            host_info.consume_resources(used_disk, used_ram)
             host_info_map[host] = host_info
 
-        # "Consume" resources from the host the instance resides on.
-        instances = self._instance_get_all(context)
-        for instance in instances:
-            host = instance['host']
-            if not host:
-                continue
-            host_info = host_info_map.get(host, None)
-            if not host_info:
-                continue
-            disk = instance['local_gb']
-            ram = instance['memory_mb']
-            host_info.consume_resources(disk, ram)
-
         return host_info_map
 
     def get_zone_capabilities(self, context):
@@ -332,6 +394,10 @@ class ZoneManager(object):
         logging.debug(_("Received %(service_name)s service update from "
                 "%(host)s.") % locals())
         service_caps = self.service_states.get(host, {})
+        if (service_name == 'compute' and service_name not in service_caps
+            and host not in self.compute_nodes):
+            # A compute node we haven't seen before, pick it up from the db.
+            self.host_data_dirty = True
         capabilities["timestamp"] = utils.utcnow()  # Reported time
         service_caps[service_name] = capabilities
         self.service_states[host] = service_caps
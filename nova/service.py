@@ -34,6 +34,7 @@ from nova import rpc
 from nova import utils
 from nova import version
 from nova import wsgi
+from nova.servicegroup import api as servicegroup
 
 
 LOG = logging.getLogger('nova.service')
@@ -257,20 +258,16 @@ class Service(object):
         self.manager.periodic_tasks(context.get_admin_context())
 
     def report_state(self):
-        """Update the state of this service in the datastore."""
+        """Report a heartbeat of this service to the servicegroup driver."""
         ctxt = context.get_admin_context()
         try:
             try:
-                service_ref = db.service_get(ctxt, self.service_id)
+                servicegroup.heartbeat(ctxt, self)
             except exception.NotFound:
                 logging.debug(_('The service database object disappeared, '
                                 'Recreating it.'))
                 self._create_service_ref(ctxt)
-                service_ref = db.service_get(ctxt, self.service_id)
-
-            db.service_update(ctxt,
-                             self.service_id,
-                             {'report_count': service_ref['report_count'] + 1})
+                servicegroup.heartbeat(ctxt, self)
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(self, 'model_disconnected', False):
@@ -0,0 +1,102 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tracks which nova services are up.
+
+Services report a heartbeat every report_interval seconds and the
+scheduler and admin tools ask whether a service is up.  Where the
+heartbeats are kept is up to the servicegroup_driver.
+
+"""
+
+from nova import db
+from nova import flags
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('servicegroup_driver',
+                    'nova.servicegroup.db_driver.DbDriver',
+                    'Driver that keeps track of the services that are up')
+flags.DEFINE_integer('service_down_time', 60,
+                     'maximum time since last check-in for up service')
+
+_DRIVERS = {}
+
+
+def get_driver():
+    """Return the driver named by the servicegroup_driver flag."""
+    name = FLAGS.servicegroup_driver
+    if name not in _DRIVERS:
+        _DRIVERS[name] = utils.import_object(name)
+    return _DRIVERS[name]
+
+
+def heartbeat(context, service):
+    """Report that a nova.service.Service is alive.
+
+    Raises NotFound if the database entry of the service is gone.
+
+    """
+    return get_driver().heartbeat(context, service)
+
+
+def is_up(service_ref):
+    """Check whether the service of a services table entry is up."""
+    return get_driver().is_up(service_ref)
+
+
+def are_up(context, service_refs):
+    """Check whether the services of a list of services entries are up.
+
+    Returns a list of booleans in the order of service_refs.  Use this
+    rather than is_up() when listing services, drivers look the
+    heartbeats up once for the whole list.
+
+    """
+    return get_driver().are_up(context, service_refs)
+
+
+def get_all_up(context, topic):
+    """Return the hosts with an enabled service for topic that is up."""
+    return get_driver().get_all_up(context, topic)
+
+
+class ServiceGroupDriver(object):
+    """Base class for servicegroup drivers."""
+
+    def heartbeat(self, context, service):
+        raise NotImplementedError()
+
+    def is_up(self, service_ref):
+        raise NotImplementedError()
+
+    def are_up(self, context, service_refs):
+        return [self.is_up(service_ref) for service_ref in service_refs]
+
+    def get_all_up(self, context, topic):
+        services = db.service_get_all_by_topic(context, topic)
+        return [service['host'] for service in services
+                if self.is_up(service)]
+
+    def heartbeat_received(self, topic, host):
+        """Record a heartbeat sent to the scheduler."""
+        pass
+
+    def get_heartbeats(self):
+        """Return [topic, host, seconds since heartbeat] of known services."""
+        return []
@@ -0,0 +1,44 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Keeps heartbeats in the services table."""
+
+from nova import db
+from nova import flags
+from nova import utils
+from nova.servicegroup import api
+
+
+FLAGS = flags.FLAGS
+
+
+class DbDriver(api.ServiceGroupDriver):
+    """Counts heartbeats in the report_count of the service's row.
+
+    Every heartbeat is a write to the database, see the memcached and rpc
+    drivers for large deployments.
+
+    """
+
+    def heartbeat(self, context, service):
+        db.service_heartbeat(context, service.service_id)
+
+    def is_up(self, service_ref):
+        last_heartbeat = service_ref['updated_at'] or service_ref['created_at']
+        # Timestamps in DB are UTC.
+        elapsed = utils.total_seconds(utils.utcnow() - last_heartbeat)
+        return abs(elapsed) <= FLAGS.service_down_time
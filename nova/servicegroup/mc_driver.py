@@ -0,0 +1,67 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Keeps heartbeats in memcached."""
+
+from nova import db
+from nova import flags
+from nova import utils
+from nova.servicegroup import api
+
+
+FLAGS = flags.FLAGS
+
+if FLAGS.memcached_servers:
+    import memcache
+else:
+    from nova import fakememcache as memcache
+
+
+class MemcachedDriver(api.ServiceGroupDriver):
+    """Stores a key per service that expires after service_down_time.
+
+    The services table is only read to find the services of a topic, so
+    heartbeats cost no database writes.  Without memcached_servers the
+    heartbeats are only seen by the process that sent them.
+
+    """
+
+    def __init__(self):
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0)
+
+    @staticmethod
+    def _key(topic, host):
+        return str('servicegroup/%s/%s' % (topic, host))
+
+    def heartbeat(self, context, service):
+        self.mc.set(self._key(service.topic, service.host),
+                    utils.utcnow_ts(), time=FLAGS.service_down_time)
+
+    def is_up(self, service_ref):
+        key = self._key(service_ref['topic'], service_ref['host'])
+        return self.mc.get(key) is not None
+
+    def are_up(self, context, service_refs):
+        keys = [self._key(service_ref['topic'], service_ref['host'])
+                for service_ref in service_refs]
+        alive = self.mc.get_multi(keys)
+        return [key in alive for key in keys]
+
+    def get_all_up(self, context, topic):
+        services = db.service_get_all_by_topic(context, topic)
+        return [service['host'] for service, up
+                in zip(services, self.are_up(context, services)) if up]
@@ -0,0 +1,103 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Sends heartbeats to the schedulers over rpc."""
+
+from nova import context
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import rpc
+from nova import utils
+from nova.servicegroup import api
+
+
+LOG = logging.getLogger('nova.servicegroup.rpc_driver')
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('servicegroup_rpc_timeout', 10,
+                     'Seconds to wait for a scheduler to return the '
+                     'heartbeats it received')
+
+
+class RpcDriver(api.ServiceGroupDriver):
+    """Fans heartbeats out to every nova-scheduler, which keep them in memory.
+
+    Other processes ask a scheduler for its heartbeats.  A scheduler that
+    just started sees every service as down until it heard from it, which
+    takes up to report_interval seconds.
+
+    """
+
+    def __init__(self):
+        self.heartbeats = {}
+        self.listening = False
+
+    def heartbeat(self, context, service):
+        rpc.fanout_cast(context, FLAGS.scheduler_topic,
+                        {'method': 'service_heartbeat',
+                         'args': {'topic': service.topic,
+                                  'host': service.host}})
+
+    def heartbeat_received(self, topic, host):
+        self.listening = True
+        self.heartbeats[(topic, host)] = utils.utcnow_ts()
+
+    def get_heartbeats(self):
+        now = utils.utcnow_ts()
+        return [[topic, host, now - timestamp]
+                for (topic, host), timestamp in self.heartbeats.iteritems()]
+
+    def _get_ages(self, ctxt):
+        """Return the seconds since each service's last heartbeat.
+
+        Services are reported down when no scheduler answers in time.
+
+        """
+        if self.listening:
+            heartbeats = self.get_heartbeats()
+        else:
+            try:
+                heartbeats = rpc.call(ctxt, FLAGS.scheduler_topic,
+                                      {'method': 'get_service_heartbeats',
+                                       'args': {}},
+                                      FLAGS.servicegroup_rpc_timeout)
+            except rpc.Timeout:
+                LOG.warn(_('No scheduler returned the service heartbeats '
+                           'within %d seconds'),
+                         FLAGS.servicegroup_rpc_timeout)
+                heartbeats = []
+        return dict(((topic, host), age) for topic, host, age in heartbeats)
+
+    @staticmethod
+    def _is_up(ages, topic, host):
+        age = ages.get((topic, host))
+        return age is not None and age <= FLAGS.service_down_time
+
+    def is_up(self, service_ref):
+        ages = self._get_ages(context.get_admin_context())
+        return self._is_up(ages, service_ref['topic'], service_ref['host'])
+
+    def are_up(self, context, service_refs):
+        ages = self._get_ages(context)
+        return [self._is_up(ages, service_ref['topic'], service_ref['host'])
+                for service_ref in service_refs]
+
+    def get_all_up(self, context, topic):
+        ages = self._get_ages(context)
+        services = db.service_get_all_by_topic(context, topic)
+        return [service['host'] for service in services
+                if self._is_up(ages, topic, service['host'])]
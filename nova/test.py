@@ -144,6 +144,7 @@ class TestCase(unittest.TestCase):
             # Clean out fake_rabbit's queue if we used it
             if FLAGS.fake_rabbit:
                 fakerabbit.reset_all()
+                rpc.cleanup()
 
             if FLAGS.connection_type == 'fake':
                 if hasattr(fake.FakeConnection, '_instance'):
@@ -30,6 +30,7 @@ from nova.api.ec2 import admin
 from nova.api.ec2 import ec2utils
 from nova.cloudpipe import pipelib
 from nova.compute import vm_states
+from nova.servicegroup import api as servicegroup
 
 
 class AdminTestCase(test.TestCase):
@@ -77,15 +78,14 @@ class AdminTestCase(test.TestCase):
     def test_project_dict_no_project(self):
         self.assertEqual({}, admin.project_dict(None))
 
-    def test_host_dict_using_updated_at(self):
+    def test_host_dict_services_up(self):
         # instances and volumes only used for count
         instances = range(2)
         volumes = range(3)
 
-        now = datetime.datetime.now()
-        updated_at = now - datetime.timedelta(seconds=10)
-        compute_service = {'updated_at': updated_at}
-        volume_service = {'updated_at': updated_at}
+        compute_service = {'id': 1}
+        volume_service = {'id': 2}
+        services_up = {1: True, 2: True}
 
         expected_host_dict = {'hostname': 'server',
                               'instance_count': 2,
@@ -95,19 +95,17 @@ class AdminTestCase(test.TestCase):
 
         self.assertEqual(expected_host_dict,
                          admin.host_dict('server', compute_service, instances,
-                                         volume_service, volumes, now))
+                                         volume_service, volumes,
+                                         services_up))
 
-    def test_host_dict_service_down_using_created_at(self):
+    def test_host_dict_services_down(self):
         # instances and volumes only used for count
         instances = range(2)
         volumes = range(3)
 
-        # service_down_time is 60 by defualt so we set to 70 to simulate
-        # services been down
-        now = datetime.datetime.now()
-        created_at = now - datetime.timedelta(seconds=70)
-        compute_service = {'created_at': created_at, 'updated_at': None}
-        volume_service = {'created_at': created_at, 'updated_at': None}
+        compute_service = {'id': 1}
+        volume_service = {'id': 2}
+        services_up = {1: False, 2: False}
 
         expected_host_dict = {'hostname': 'server',
                               'instance_count': 2,
@@ -117,7 +115,8 @@ class AdminTestCase(test.TestCase):
 
         self.assertEqual(expected_host_dict,
                          admin.host_dict('server', compute_service, instances,
-                                         volume_service, volumes, now))
+                                         volume_service, volumes,
+                                         services_up))
 
     def test_instance_dict(self):
         inst = {'name': 'this_inst',
@@ -365,6 +364,26 @@ class AdminControllerTestCase(test.TestCase):
         hosts = self._ac.describe_hosts(self._c)['hosts']
         self.assertEqual('volume1', hosts[0]['hostname'])
 
+    def test_describe_hosts_uses_servicegroup(self):
+        for host, binary, topic in (('host1', 'nova-compute', 'compute'),
+                                    ('host1', 'nova-volume', 'volume')):
+            db.service_create(self._c, {'host': host,
+                'binary': binary,
+                'topic': topic,
+                'report_count': 0,
+                'availability_zone': "zone1"})
+        calls = []
+
+        def fake_are_up(context, services):
+            calls.append(len(services))
+            return [service['topic'] == 'compute' for service in services]
+
+        self.stubs.Set(servicegroup, 'are_up', fake_are_up)
+        hosts = self._ac.describe_hosts(self._c)['hosts']
+        self.assertEqual(calls, [2])
+        self.assertEqual('up', hosts[0]['compute'])
+        self.assertEqual('down', hosts[0]['volume'])
+
     def test_block_external_addresses(self):
         result = self._ac.block_external_addresses(self._c, '192.168.100.1/24')
         self.assertEqual('OK', result['status'])
@@ -824,6 +824,49 @@ class CloudTestCase(test.TestCase):
 
         self._tearDownBlockDeviceMapping(inst1, inst2, volumes)
 
+    def test_describe_instances_batches_lookups(self):
+        """Make sure describe_instances doesn't look up images, block
+        device mappings, volumes or services one instance at a time
+        """
+        (inst1, inst2, volumes) = self._setUpBlockDeviceMapping()
+        for inst in (inst1, inst2):
+            db.instance_update(self.context, inst['id'],
+                               {'vm_state': vm_states.ACTIVE})
+        self.calls = []
+
+        def _counted(name, func):
+            def _wrapped(*args, **kwargs):
+                self.calls.append(name)
+                return func(*args, **kwargs)
+            return _wrapped
+
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance',
+                       _counted('bdm',
+                                db.block_device_mapping_get_all_by_instance))
+        self.stubs.Set(db, 'service_get_all_by_host',
+                       _counted('service', db.service_get_all_by_host))
+        image_service = self.cloud.image_service
+        self.stubs.Set(image_service, 'get_image_id',
+                       _counted('image', image_service.get_image_id))
+        self.stubs.Set(self.cloud.volume_api, 'get',
+                       _counted('volume', self.cloud.volume_api.get))
+
+        result = self.cloud.describe_instances(self.context)
+        self.assertEqual(self.calls, [])
+
+        instances = {}
+        for reservation in result['reservationSet']:
+            for instance in reservation['instancesSet']:
+                instances[instance['instanceId']] = instance
+        result = instances[ec2utils.id_to_ec2_id(inst1['id'])]
+        self.assertSubDictMatch(self._expected_instance_bdm1, result)
+        self._assertEqualBlockDeviceMapping(
+            self._expected_block_device_mapping0, result['blockDeviceMapping'])
+        result = instances[ec2utils.id_to_ec2_id(inst2['id'])]
+        self.assertSubDictMatch(self._expected_instance_bdm2, result)
+
+        self._tearDownBlockDeviceMapping(inst1, inst2, volumes)
+
     def test_describe_images(self):
         describe_images = self.cloud.describe_images
 
@@ -74,7 +74,8 @@ def return_server(context, server_id):
             'power_state': 0x01,
             'host': "localhost",
             'uuid': FAKE_UUID,
-            'name': 'asdf'}
+            'name': 'asdf',
+            'project_id': 'fake'}
 
 
 def return_server_by_uuid(context, server_uuid):
@@ -82,7 +83,8 @@ def return_server_by_uuid(context, server_uuid):
             'power_state': 0x01,
             'host': "localhost",
             'uuid': server_uuid,
-            'name': 'asdf'}
+            'name': 'asdf',
+            'project_id': 'fake'}
 
 
 def return_non_running_server(context, server_id):
@@ -33,6 +33,7 @@ from nova.compute import task_states
 from nova.compute import vm_states
 import nova.db
 from nova.db.sqlalchemy.models import InstanceMetadata
+from nova import exception
 from nova import flags
 import nova.image.fake
 import nova.rpc
@@ -105,6 +106,17 @@ def return_servers(context, *args, **kwargs):
     for i in xrange(5):
         server = fakes.stub_instance(i, 'fake', 'fake', uuid=get_fake_uuid(i))
         servers.append(server)
+
+    marker = kwargs.get('marker')
+    if marker is not None:
+        uuids = [server['uuid'] for server in servers]
+        if marker not in uuids:
+            raise exception.MarkerNotFound(marker=marker)
+        servers = servers[uuids.index(marker) + 1:]
+
+    limit = kwargs.get('limit')
+    if limit is not None:
+        servers = servers[:limit]
     return servers
 
 
@@ -758,10 +770,33 @@ class ServersControllerTest(test.TestCase):
         self.assertRaises(webob.exc.HTTPBadRequest,
                           self.controller.index, req)
 
+    def test_get_servers_pages_in_database(self):
+        calls = []
+
+        def fake_get_all(compute_self, context, search_opts=None,
+                         limit=None, marker=None, columns_to_join=None):
+            calls.append((limit, marker, columns_to_join))
+            return [fakes.stub_instance(100, uuid=get_fake_uuid(3))]
+
+        self.stubs.Set(nova.compute.API, 'get_all', fake_get_all)
+
+        url = '/v2/fake/servers?limit=1&marker=%s' % get_fake_uuid(2)
+        req = fakes.HTTPRequest.blank(url)
+        self.controller.index(req)
+        req = fakes.HTTPRequest.blank(url.replace('servers', 'servers/detail'))
+        self.controller.detail(req)
+
+        view_builder = self.controller._view_builder
+        self.assertEqual(calls,
+                [(1, get_fake_uuid(2), view_builder.index_joins),
+                 (1, get_fake_uuid(2), view_builder.detail_joins)])
+        self.assertFalse('metadata' in view_builder.index_joins)
+        self.assertTrue('metadata' in view_builder.detail_joins)
+
     def test_get_servers_with_bad_option(self):
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             return [fakes.stub_instance(100, uuid=server_uuid)]
 
         self.stubs.Set(nova.compute.API, 'get_all', fake_get_all)
@@ -775,7 +810,7 @@ class ServersControllerTest(test.TestCase):
     def test_get_servers_allows_image(self):
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('image' in search_opts)
             self.assertEqual(search_opts['image'], '12345')
@@ -791,7 +826,7 @@ class ServersControllerTest(test.TestCase):
         self.assertEqual(servers[0]['id'], server_uuid)
 
     def test_tenant_id_filter_converts_to_project_id_for_admin(self):
-        def fake_get_all(context, filters=None, instances=None):
+        def fake_get_all(context, filters=None, **kwargs):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             self.assertFalse(filters.get('tenant_id'))
@@ -810,7 +845,7 @@ class ServersControllerTest(test.TestCase):
     def test_get_servers_allows_flavor(self):
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('flavor' in search_opts)
             # flavor is an integer ID
@@ -829,7 +864,7 @@ class ServersControllerTest(test.TestCase):
     def test_get_servers_allows_status(self):
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('vm_state' in search_opts)
             self.assertEqual(search_opts['vm_state'], vm_states.ACTIVE)
@@ -853,7 +888,7 @@ class ServersControllerTest(test.TestCase):
     def test_get_servers_allows_name(self):
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('name' in search_opts)
             self.assertEqual(search_opts['name'], 'whee.*')
@@ -871,7 +906,7 @@ class ServersControllerTest(test.TestCase):
     def test_get_servers_allows_changes_since(self):
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('changes-since' in search_opts)
             changes_since = datetime.datetime(2011, 1, 24, 17, 8, 1)
@@ -904,7 +939,7 @@ class ServersControllerTest(test.TestCase):
 
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -936,7 +971,7 @@ class ServersControllerTest(test.TestCase):
 
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -966,7 +1001,7 @@ class ServersControllerTest(test.TestCase):
 
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -994,7 +1029,7 @@ class ServersControllerTest(test.TestCase):
 
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip' in search_opts)
             self.assertEqual(search_opts['ip'], '10\..*')
@@ -1017,7 +1052,7 @@ class ServersControllerTest(test.TestCase):
 
         server_uuid = str(utils.gen_uuid())
 
-        def fake_get_all(compute_self, context, search_opts=None):
+        def fake_get_all(compute_self, context, search_opts=None, **kwargs):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip6' in search_opts)
             self.assertEqual(search_opts['ip6'], 'ffff.*')
@@ -37,6 +37,10 @@ def get_backing_file(path):
     return disk_backing_files.get(path, None)
 
 
+def get_disk_backing_file(path):
+    return disk_backing_files.get(path, None)
+
+
 def copy_image(src, dest):
     pass
 
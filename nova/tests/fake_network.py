@@ -15,6 +15,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import re
+
 from nova import db
 from nova import exception
 from nova import flags
@@ -105,6 +107,28 @@ class FakeNetworkManager(network_manager.NetworkManager):
                                     'floating_ips': [floats[2]]}]}]
             return vifs
 
+        def fixed_ip_get_by_address(self, context, address):
+            for vif in self.virtual_interface_get_all(context):
+                for fixed_ip in vif['fixed_ips']:
+                    if fixed_ip['address'] == address:
+                        return dict(fixed_ip, instance_id=vif['instance_id'])
+            raise exception.FixedIpNotFoundForAddress(address=address)
+
+        def fixed_ip_get_instance_ips_by_regexp(self, context, pattern):
+            ip_re = re.compile(str(pattern))
+            results = []
+            for vif in self.virtual_interface_get_all(context):
+                for fixed_ip in vif['fixed_ips']:
+                    addresses = [fixed_ip['address']]
+                    if not ip_re.match(fixed_ip['address']):
+                        addresses = [floating_ip['address'] for floating_ip
+                                     in fixed_ip['floating_ips']]
+                    for address in addresses:
+                        if ip_re.match(address):
+                            results.append({'instance_id': vif['instance_id'],
+                                            'ip': address})
+            return results
+
         def instance_get_id_to_uuid_mapping(self, context, ids):
             # NOTE(jkoelker): This is just here until we can rely on UUIDs
             mapping = {}
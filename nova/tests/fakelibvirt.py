@@ -20,6 +20,7 @@ try:
 except ImportError:
     from xml.parsers.expat import ExpatError as ParseError
 
+import time
 import uuid
 
 # Allow passing None to the various connect methods
@@ -80,6 +81,16 @@ VIR_CPU_COMPARE_SUPERSET = 2
 VIR_CRED_AUTHNAME = 2
 VIR_CRED_NOECHOPROMPT = 7
 
+VIR_DOMAIN_EVENT_ID_LIFECYCLE = 0
+
+# virDomainEventType
+VIR_DOMAIN_EVENT_DEFINED = 0
+VIR_DOMAIN_EVENT_UNDEFINED = 1
+VIR_DOMAIN_EVENT_STARTED = 2
+VIR_DOMAIN_EVENT_SUSPENDED = 3
+VIR_DOMAIN_EVENT_RESUMED = 4
+VIR_DOMAIN_EVENT_STOPPED = 5
+
 # libvirtError enums
 # (Intentionally different from what's in libvirt. We do this to check,
 #  that consumers of the library are using the symbolic names rather than
@@ -87,6 +98,8 @@ VIR_CRED_NOECHOPROMPT = 7
 VIR_FROM_QEMU = 100
 VIR_FROM_DOMAIN = 200
 VIR_FROM_NWFILTER = 330
+VIR_FROM_REMOTE = 340
+VIR_ERR_SYSTEM_ERROR = 15
 VIR_ERR_XML_DETAIL = 350
 VIR_ERR_NO_DOMAIN = 420
 VIR_ERR_NO_NWFILTER = 620
@@ -262,16 +275,19 @@ class Domain(object):
         self._state = VIR_DOMAIN_RUNNING
         self._connection._mark_running(self)
         self._has_saved_state = False
+        self._connection._emit_event(self, VIR_DOMAIN_EVENT_STARTED)
 
     def isActive(self):
         return int(self._state == VIR_DOMAIN_RUNNING)
 
     def undefine(self):
         self._connection._undefine(self)
+        self._connection._emit_event(self, VIR_DOMAIN_EVENT_UNDEFINED)
 
     def destroy(self):
         self._state = VIR_DOMAIN_SHUTOFF
         self._connection._mark_not_running(self)
+        self._connection._emit_event(self, VIR_DOMAIN_EVENT_STOPPED)
 
     def name(self):
         return self._def['name']
@@ -287,6 +303,7 @@ class Domain(object):
 
     def suspend(self):
         self._state = VIR_DOMAIN_PAUSED
+        self._connection._emit_event(self, VIR_DOMAIN_EVENT_SUSPENDED)
 
     def info(self):
         return [VIR_DOMAIN_RUNNING,
@@ -383,6 +400,7 @@ class Domain(object):
     def managedSave(self, flags):
         self._connection._mark_not_running(self)
         self._has_saved_state = True
+        self._connection._emit_event(self, VIR_DOMAIN_EVENT_STOPPED)
 
     def managedSaveRemove(self, flags):
         self._has_saved_state = False
@@ -392,6 +410,7 @@ class Domain(object):
 
     def resume(self):
         self._state = VIR_DOMAIN_RUNNING
+        self._connection._emit_event(self, VIR_DOMAIN_EVENT_RESUMED)
 
     def snapshotCreateXML(self, xml, flags):
         tree = xml_to_tree(xml)
@@ -435,6 +454,15 @@ class Connection(object):
         self._running_vms = {}
         self._id_counter = 0
         self._nwfilters = {}
+        self._event_callbacks = []
+
+    def domainEventRegisterAny(self, dom, eventID, callback, opaque):
+        self._event_callbacks.append((eventID, callback, opaque))
+
+    def _emit_event(self, dom, event):
+        for (eventID, callback, opaque) in self._event_callbacks:
+            if eventID == VIR_DOMAIN_EVENT_ID_LIFECYCLE:
+                callback(self, dom, event, 0, opaque)
 
     def _add_filter(self, nwfilter):
         self._nwfilters[nwfilter._name] = nwfilter
@@ -488,11 +516,13 @@ class Connection(object):
     def defineXML(self, xml):
         dom = Domain(connection=self, running=False, transient=False, xml=xml)
         self._vms[dom.name()] = dom
+        self._emit_event(dom, VIR_DOMAIN_EVENT_DEFINED)
         return dom
 
     def createXML(self, xml, flags):
         dom = Domain(connection=self, running=True, transient=True, xml=xml)
         self._vms[dom.name()] = dom
+        self._emit_event(dom, VIR_DOMAIN_EVENT_STARTED)
         return dom
 
     def getType(self):
@@ -765,6 +795,19 @@ class Connection(object):
         self._add_filter(nwfilter)
 
 
+# The connection and domain classes of the real bindings.
+virConnect = Connection
+virDomain = Domain
+
+
+def virEventRegisterDefaultImpl():
+    pass
+
+
+def virEventRunDefaultImpl():
+    time.sleep(1)
+
+
 def openReadOnly(uri):
     return Connection(uri, readonly=True)
 
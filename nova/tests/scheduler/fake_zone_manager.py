@@ -32,6 +32,7 @@ class FakeZoneManager(zone_manager.ZoneManager):
        host4: free_ram_mb=8192  free_disk_gb=8192"""
 
     def __init__(self):
+        super(FakeZoneManager, self).__init__()
         self.service_states = {
             'host1': {
                 'compute': {'host_memory_free': 1073741824},
@@ -65,8 +66,8 @@ class FakeZoneManager(zone_manager.ZoneManager):
 
     def _instance_get_all(self, context):
         return [
-            dict(local_gb=512, memory_mb=512, host='host1'),
-            dict(local_gb=512, memory_mb=512, host='host1'),
-            dict(local_gb=512, memory_mb=512, host='host2'),
-            dict(local_gb=1024, memory_mb=1024, host='host3'),
+            dict(uuid='uuid1', local_gb=512, memory_mb=512, host='host1'),
+            dict(uuid='uuid2', local_gb=512, memory_mb=512, host='host1'),
+            dict(uuid='uuid3', local_gb=512, memory_mb=512, host='host2'),
+            dict(uuid='uuid4', local_gb=1024, memory_mb=1024, host='host3'),
         ]
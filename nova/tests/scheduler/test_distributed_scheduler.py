@@ -33,6 +33,7 @@ from nova.tests.scheduler import fake_zone_manager as ds_fakes
 
 class FakeEmptyZoneManager(zone_manager.ZoneManager):
     def __init__(self):
+        super(FakeEmptyZoneManager, self).__init__()
         self.service_states = {}
 
     def get_host_list_from_db(self, context):
@@ -214,17 +215,25 @@ class DistributedSchedulerTestCase(test.TestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weighted_sum(functions, hosts, options):
-            self.next_weight += 2.0
-            host, hostinfo = hosts[0]
-            return least_cost.WeightedHost(self.next_weight, host=host,
-                                           hostinfo=hostinfo)
+        def _fake_weigh_hosts(functions, hosts, options):
+            weighted_hosts = []
+            for host, hostinfo in hosts:
+                self.next_weight += 2.0
+                weighted_hosts.append(least_cost.WeightedHost(
+                        self.next_weight, host=host, hostinfo=hostinfo))
+            return weighted_hosts
+
+        def _fake_best_hosts(functions, hosts, options, count=1):
+            weighted_hosts = _fake_weigh_hosts(functions, hosts, options)
+            weighted_hosts.sort(key=lambda w: (w.weight, w.host))
+            return weighted_hosts[:count]
 
         sched = ds_fakes.FakeDistributedScheduler()
         fake_context = context.RequestContext('user', 'project')
         sched.zone_manager = ds_fakes.FakeZoneManager()
         self.stubs.Set(sched, '_filter_hosts', fake_filter_hosts)
-        self.stubs.Set(least_cost, 'weighted_sum', _fake_weighted_sum)
+        self.stubs.Set(least_cost, 'weigh_hosts', _fake_weigh_hosts)
+        self.stubs.Set(least_cost, 'best_hosts', _fake_best_hosts)
         self.stubs.Set(nova.db, 'zone_get_all', fake_zone_get_all)
         self.stubs.Set(sched, '_call_zone_method', fake_call_zone_method)
 
@@ -248,17 +257,25 @@ class DistributedSchedulerTestCase(test.TestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weighted_sum(functions, hosts, options):
-            self.next_weight += 2.0
-            host, hostinfo = hosts[0]
-            return least_cost.WeightedHost(self.next_weight, host=host,
-                                           hostinfo=hostinfo)
+        def _fake_weigh_hosts(functions, hosts, options):
+            weighted_hosts = []
+            for host, hostinfo in hosts:
+                self.next_weight += 2.0
+                weighted_hosts.append(least_cost.WeightedHost(
+                        self.next_weight, host=host, hostinfo=hostinfo))
+            return weighted_hosts
+
+        def _fake_best_hosts(functions, hosts, options, count=1):
+            weighted_hosts = _fake_weigh_hosts(functions, hosts, options)
+            weighted_hosts.sort(key=lambda w: (w.weight, w.host))
+            return weighted_hosts[:count]
 
         sched = ds_fakes.FakeDistributedScheduler()
         fake_context = context.RequestContext('user', 'project')
         sched.zone_manager = ds_fakes.FakeZoneManager()
         self.stubs.Set(sched, '_filter_hosts', fake_filter_hosts)
-        self.stubs.Set(least_cost, 'weighted_sum', _fake_weighted_sum)
+        self.stubs.Set(least_cost, 'weigh_hosts', _fake_weigh_hosts)
+        self.stubs.Set(least_cost, 'best_hosts', _fake_best_hosts)
         self.stubs.Set(nova.db, 'zone_get_all', fake_zone_get_all)
         self.stubs.Set(sched, '_call_zone_method', fake_call_zone_method)
 
@@ -273,6 +290,65 @@ class DistributedSchedulerTestCase(test.TestCase):
             self.assertTrue(weighted_host.host != None)
             self.assertTrue(weighted_host.zone == None)
 
+    def test_schedule_places_off_heap(self):
+        """Make sure hosts are re-filtered and re-weighed as resources
+        are consumed, giving the same placement as weighing every host
+        for every instance."""
+        self.flags(reserved_host_disk_mb=0, reserved_host_memory_mb=0)
+        self.filtered = []
+
+        sched = ds_fakes.FakeDistributedScheduler()
+        real_filter_hosts = sched._filter_hosts
+
+        def _fake_filter_hosts(topic, request_spec, hosts, options):
+            self.filtered.append(len(hosts))
+            return real_filter_hosts(topic, request_spec, hosts, options)
+
+        fake_context = context.RequestContext('user', 'project')
+        sched.zone_manager = ds_fakes.FakeZoneManager()
+        self.stubs.Set(sched, '_filter_hosts', _fake_filter_hosts)
+
+        # host1: free_ram_mb=0
+        # host2: free_ram_mb=1536
+        # host3: free_ram_mb=3072
+        # host4: free_ram_mb=8192
+        instance_type = dict(memory_mb=1024, local_gb=0)
+        request_spec = dict(num_instances=5, instance_type=instance_type,
+                            local_zone=True)
+        weighted_hosts = sched._schedule(fake_context, 'compute',
+                                         request_spec)
+        self.assertEquals([(w.host, w.weight) for w in weighted_hosts],
+                          [('host3', 1024), ('host2', 1536),
+                           ('host3', 2048), ('host3', 3072),
+                           ('host4', 8192)])
+        # One pass over all the hosts, then one host per instance.
+        self.assertEquals(self.filtered, [4, 1, 1, 1, 1, 1])
+
+    def test_schedule_seeds_heap_with_best_hosts(self):
+        """Make sure only the num_instances best hosts of the first pass
+        are weighed onto the heap, without changing the placement."""
+        self.flags(reserved_host_disk_mb=0, reserved_host_memory_mb=0)
+        self.counts = []
+        real_best_hosts = least_cost.best_hosts
+
+        def _fake_best_hosts(functions, hosts, options, count=1):
+            self.counts.append((len(hosts), count))
+            return real_best_hosts(functions, hosts, options, count=count)
+
+        sched = ds_fakes.FakeDistributedScheduler()
+        fake_context = context.RequestContext('user', 'project')
+        sched.zone_manager = ds_fakes.FakeZoneManager()
+        self.stubs.Set(least_cost, 'best_hosts', _fake_best_hosts)
+
+        instance_type = dict(memory_mb=1024, local_gb=0)
+        request_spec = dict(num_instances=2, instance_type=instance_type,
+                            local_zone=True)
+        weighted_hosts = sched._schedule(fake_context, 'compute',
+                                         request_spec)
+        self.assertEquals([(w.host, w.weight) for w in weighted_hosts],
+                          [('host2', 1536), ('host3', 3072)])
+        self.assertEquals(self.counts, [(3, 2)])
+
     def test_decrypt_blob(self):
         """Test that the decrypt method works."""
 
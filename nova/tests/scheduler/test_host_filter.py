@@ -22,6 +22,7 @@ import nova
 from nova import exception
 from nova import test
 from nova.scheduler import distributed_scheduler as dist
+from nova.scheduler.filters import filter_chain
 from nova.scheduler import zone_manager
 from nova.tests.scheduler import fake_zone_manager as ds_fakes
 
@@ -251,3 +252,137 @@ class HostFilterTestCase(test.TestCase):
 
         self.assertFalse(hf.filter_hosts(all_hosts,
                 json.dumps(['=', {}, ['>', '$missing....foo']]), {}))
+
+    def test_json_filter_compiled_once(self):
+        self.flags(json_filter_cache_size=2)
+        self.stubs.Set(nova.scheduler.filters.JsonFilter,
+                       '_compiled_queries', None)
+        hf = nova.scheduler.filters.JsonFilter()
+        all_hosts = self._get_all_hosts()
+        self.compiled = []
+        real_compile_filter = hf._compile_filter
+
+        def _fake_compile_filter(query):
+            self.compiled.append(query)
+            return real_compile_filter(query)
+
+        self.stubs.Set(hf, '_compile_filter', _fake_compile_filter)
+
+        query1 = json.dumps(['>', '$compute.host_memory_free', 30])
+        query2 = json.dumps(['<', '$compute.host_memory_free', 30])
+        query3 = json.dumps(['=', '$compute.host_memory_free', 30])
+        for i in xrange(3):
+            self.assertEquals(1, len(hf.filter_hosts(all_hosts, query1, {})))
+        self.assertEquals(self.compiled, [['>', '$compute.host_memory_free',
+                                           30]])
+
+        # Least recently used query is evicted
+        self.assertEquals(2, len(hf.filter_hosts(all_hosts, query2, {})))
+        self.assertEquals(1, len(hf.filter_hosts(all_hosts, query1, {})))
+        self.assertEquals(1, len(hf.filter_hosts(all_hosts, query3, {})))
+        self.assertEquals(2, len(hf.filter_hosts(all_hosts, query2, {})))
+        self.assertEquals(1, len(hf.filter_hosts(all_hosts, query1, {})))
+        self.assertEquals([query[0] for query in self.compiled],
+                          ['>', '<', '=', '<', '>'])
+
+    def test_json_filter_capability_paths(self):
+        hf = nova.scheduler.filters.JsonFilter()
+        all_hosts = self._get_all_hosts()
+        host4 = self.zone_manager.service_states['host4']['compute']
+        host4['nested'] = {'a': {'b': 5}}
+
+        hosts = hf.filter_hosts(all_hosts,
+                json.dumps(['=', '$compute.nested.a.b', 5]), {})
+        self.assertEquals(['host4'], [host for host, caps in hosts])
+        self.assertFalse(hf.filter_hosts(all_hosts,
+                json.dumps(['=', '$compute.nested.a.c', 5]), {}))
+        self.assertFalse(hf.filter_hosts(all_hosts,
+                json.dumps(['=', '$volume.nested', 5]), {}))
+        self.assertFalse(hf.filter_hosts(all_hosts,
+                json.dumps(['=', '$', 5]), {}))
+
+    def test_host_info_missing_service_caps(self):
+        # A service that reported no capabilities gets an empty dict
+        host_info = zone_manager.HostInfo('host1',
+                caps={'compute': {'host_memory_free': 10}})
+        self.assertEquals(dict(host_info.volume), {})
+        self.assertEquals(host_info.volume.get('nested'), None)
+        self.assertRaises(TypeError, host_info.volume.__setitem__, 'a', 1)
+
+    def test_filter_chain_cheapest_first(self):
+        self.seen = []
+        test_case = self
+
+        class CountingJsonFilter(nova.scheduler.filters.JsonFilter):
+            def filter_hosts(self, host_list, query, options):
+                test_case.seen.extend(host for host, info in host_list)
+                return super(CountingJsonFilter, self).filter_hosts(
+                        host_list, query, options)
+
+        json_filter = CountingJsonFilter()
+        type_filter = nova.scheduler.filters.InstanceTypeFilter()
+        chain = filter_chain.FilterChain([json_filter, type_filter])
+        self.assertEquals(chain.host_filters, [type_filter, json_filter])
+
+        all_hosts = self._get_all_hosts()
+        hosts = chain.filter_hosts(all_hosts, self.gpu_instance_type, {})
+        self.assertEquals(['host4'], [host for host, caps in hosts])
+        # Only the host that made it past InstanceTypeFilter
+        self.assertEquals(['host4'], self.seen)
+
+        stats = dict(chain.get_stats())
+        type_stats = stats[type_filter._full_name()]
+        self.assertEquals(type_stats['calls'], 1)
+        self.assertEquals(type_stats['hosts'], 4)
+        self.assertEquals(type_stats['rejected'], 3)
+        json_stats = stats[json_filter._full_name()]
+        self.assertEquals(json_stats['hosts'], 1)
+        self.assertEquals(json_stats['rejected'], 0)
+
+    def test_filter_chain_prepares_queries_once(self):
+        self.prepared = 0
+        test_case = self
+
+        class CountingJsonFilter(nova.scheduler.filters.JsonFilter):
+            def prepare_query(self, query):
+                test_case.prepared += 1
+                # No JSON round trip on the way in
+                test_case.assertTrue(isinstance(query, list))
+                return super(CountingJsonFilter, self).prepare_query(query)
+
+        chain = filter_chain.FilterChain([CountingJsonFilter()])
+        all_hosts = self._get_all_hosts()
+        for i in xrange(3):
+            hosts = chain.filter_hosts(all_hosts, self.instance_type, {})
+            self.assertEquals(2, len(hosts))
+        self.assertEquals(self.prepared, 1)
+        chain.filter_hosts(all_hosts, dict(self.instance_type), {})
+        self.assertEquals(self.prepared, 2)
+
+    def test_filter_chain_reused(self):
+        self.flags(default_host_filters=['InstanceTypeFilter'])
+        sched = dist.DistributedScheduler()
+        self.chosen = 0
+        real_choose_host_filters = sched._choose_host_filters
+
+        def _fake_choose_host_filters():
+            self.chosen += 1
+            return real_choose_host_filters()
+
+        self.stubs.Set(sched, '_choose_host_filters',
+                       _fake_choose_host_filters)
+        request_spec = dict(instance_type=self.instance_type)
+        all_hosts = self._get_all_hosts()
+        for i in xrange(3):
+            hosts = sched._filter_hosts('compute', request_spec, all_hosts,
+                                        {})
+            self.assertEquals(3, len(hosts))
+        self.assertEquals(self.chosen, 1)
+
+        self.flags(default_host_filters=['JsonFilter'])
+        hosts = sched._filter_hosts('compute', request_spec, all_hosts, {})
+        self.assertEquals(2, len(hosts))
+        self.assertEquals(self.chosen, 2)
+        stats = sched.get_filter_stats()
+        self.assertEquals(stats[0][0],
+                          'nova.scheduler.filters.json_filter.JsonFilter')
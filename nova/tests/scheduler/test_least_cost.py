@@ -29,6 +29,15 @@ def scale(hostinfo, options):
     return hostinfo.free_ram_mb * 2
 
 
+@least_cost.vectorized(lambda columns, options: columns['free_ram_mb'] * 2)
+def vectorized_scale(hostinfo, options):
+    return hostinfo.free_ram_mb * 2
+
+
+def constant(hostinfo, options):
+    return 5
+
+
 class LeastCostTestCase(test.TestCase):
     def setUp(self):
         super(LeastCostTestCase, self).setUp()
@@ -80,3 +89,84 @@ class LeastCostTestCase(test.TestCase):
                                                                     options)
         self.assertEqual(weighted_host.weight, 10000)
         self.assertEqual(weighted_host.host, 'host1')
+
+    def test_weigh_hosts(self):
+        fn_tuples = [(1.0, offset), (1.0, scale)]
+        hostinfo_list = sorted(self.zone_manager.get_all_host_data(
+                                                            None).items())
+
+        options = {}
+        weighted_hosts = least_cost.weigh_hosts(fn_tuples, hostinfo_list,
+                                                options)
+        self.assertEqual([w.host for w in weighted_hosts],
+                         ['host1', 'host2', 'host3', 'host4'])
+        self.assertEqual([w.weight for w in weighted_hosts],
+                         [10000, 14608, 19216, 34576])
+        for weighted_host, (host, hostinfo) in zip(weighted_hosts,
+                                                   hostinfo_list):
+            self.assertTrue(weighted_host.hostinfo is hostinfo)
+
+    def test_weigh_hosts_vectorized(self):
+        hostinfo_list = sorted(self.zone_manager.get_all_host_data(
+                                                            None).items())
+        options = {}
+        scalar = least_cost.weigh_hosts([(1.0, offset), (1.0, scale)],
+                                        hostinfo_list, options)
+        mixed = least_cost.weigh_hosts([(1.0, offset),
+                                        (1.0, vectorized_scale)],
+                                       hostinfo_list, options)
+        self.assertEqual([w.weight for w in scalar],
+                         [w.weight for w in mixed])
+
+    def test_weigh_hosts_by_column(self):
+        self.stubs.Set(least_cost, 'VECTORIZE_MIN_HOSTS', 0)
+        self.test_weigh_hosts()
+        self.test_weigh_hosts_vectorized()
+
+    def _test_best_hosts(self):
+        hostinfo_list = self.zone_manager.get_all_host_data(None).items()
+        fn_tuples = [(1.0, least_cost.compute_fill_first_cost_fn)]
+        options = {}
+
+        # host1: free_ram_mb=0
+        # host2: free_ram_mb=1536
+        # host3: free_ram_mb=3072
+        # host4: free_ram_mb=8192
+        weighted_hosts = least_cost.best_hosts(fn_tuples, hostinfo_list,
+                                               options, 2)
+        self.assertEqual([(w.host, w.weight) for w in weighted_hosts],
+                         [('host1', 0), ('host2', 1536)])
+
+        weighted_hosts = least_cost.best_hosts(fn_tuples, hostinfo_list,
+                                               options, 10)
+        self.assertEqual([w.host for w in weighted_hosts],
+                         ['host1', 'host2', 'host3', 'host4'])
+
+        # Ties go to the lowest host name.
+        weighted_hosts = least_cost.best_hosts([(1.0, constant)],
+                                               list(reversed(sorted(
+                                                   hostinfo_list))),
+                                               options, 3)
+        self.assertEqual([(w.host, w.weight) for w in weighted_hosts],
+                         [('host1', 5), ('host2', 5), ('host3', 5)])
+
+        self.assertEqual(least_cost.best_hosts(fn_tuples, [], options), [])
+
+    def test_best_hosts(self):
+        self._test_best_hosts()
+
+    def test_best_hosts_by_column(self):
+        self.stubs.Set(least_cost, 'VECTORIZE_MIN_HOSTS', 0)
+        self._test_best_hosts()
+
+    def test_few_hosts_are_weighed_one_at_a_time(self):
+        def fake_host_columns(host_list):
+            self.fail('columns should not be built for one host')
+
+        self.stubs.Set(least_cost, 'HostColumns', fake_host_columns)
+        hostinfo_list = sorted(self.zone_manager.get_all_host_data(
+                                                            None).items())
+        weighted_hosts = least_cost.weigh_hosts([(1.0, vectorized_scale)],
+                                                hostinfo_list[-1:], {})
+        self.assertEqual([(w.host, w.weight) for w in weighted_hosts],
+                         [('host4', 16384)])
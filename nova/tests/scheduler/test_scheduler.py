@@ -37,6 +37,7 @@ from nova.scheduler import api
 from nova.scheduler import driver
 from nova.scheduler import manager
 from nova.scheduler.simple import SimpleScheduler
+from nova.servicegroup import api as servicegroup
 from nova.compute import power_state
 from nova.compute import vm_states
 
@@ -718,6 +719,39 @@ class SimpleDriverTestCase(test.TestCase):
                           request_spec)
         compute1.kill()
 
+    def test_checks_services_up_in_one_call(self):
+        compute1 = self.start_service('compute', host='host1')
+        compute2 = self.start_service('compute', host='host2')
+        calls = []
+
+        def fake_are_up(context, services):
+            calls.append([service['host'] for service in services])
+            return [service['host'] == 'host2' for service in services]
+
+        def fake_is_up(service):
+            self.fail(_('services should be checked in one call'))
+
+        self.stubs.Set(servicegroup, 'are_up', fake_are_up)
+        self.stubs.Set(servicegroup, 'is_up', fake_is_up)
+        global instance_ids
+        instance_ids = []
+        self.stubs.Set(SimpleScheduler,
+                'create_instance_db_entry', _fake_create_instance_db_entry)
+        global _picked_host
+        _picked_host = None
+        self.stubs.Set(driver,
+                'cast_to_compute_host', _fake_cast_to_compute_host)
+
+        request_spec = _create_request_spec()
+        self.scheduler.driver.schedule_run_instance(self.context,
+                                                    request_spec)
+        self.assertEqual(_picked_host, 'host2')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(calls[0]), ['host1', 'host2'])
+        compute1.terminate_instance(self.context, instance_ids[0])
+        compute1.kill()
+        compute2.kill()
+
     def test_will_schedule_on_disabled_host_if_specified(self):
         compute1 = self.start_service('compute', host='host1')
         s1 = db.service_get_by_args(self.context, 'host1', 'nova-compute')
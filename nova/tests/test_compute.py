@@ -22,6 +22,8 @@ Tests For Compute
 
 from copy import copy
 
+from eventlet import greenthread
+import greenlet
 import mox
 
 import nova
@@ -469,6 +471,102 @@ class ComputeTestCase(BaseTestCase):
         self.assertEquals(payload['image_ref_url'], image_ref_url)
         self.compute.terminate_instance(self.context, instance_id)
 
+    def test_run_instance_records_spawn_timings(self):
+        """Ensure run instance reports how long each phase took"""
+        instance_id = self._create_instance()
+        self.compute.run_instance(self.context, instance_id)
+        msg = test_notifier.NOTIFICATIONS[0]
+        timings = msg['payload']['timings']
+        for phase in ('image_meta', 'network', 'block_device', 'prefetch',
+                      'prefetch_wait', 'spawn', 'total'):
+            self.assertTrue(phase in timings)
+        actions = db.instance_get_actions(context.get_admin_context(),
+                                          instance_id)
+        self.assertEqual(len(actions), 1)
+        self.assertTrue(actions[0]['action'].startswith('run_instance: '))
+        self.assertEqual(actions[0]['error'], None)
+        self.compute.terminate_instance(self.context, instance_id)
+
+    def test_run_instance_prefetches_image_before_spawn(self):
+        """Ensure the image is prefetched before the driver spawns"""
+        called = []
+
+        def fake_prefetch_image(context, instance, image_meta):
+            called.append('prefetch')
+
+        def fake_spawn(context, instance, image_meta, network_info,
+                       block_device_info):
+            called.append('spawn')
+
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       fake_prefetch_image)
+        self.stubs.Set(self.compute.driver, 'spawn', fake_spawn)
+        instance_id = self._create_instance()
+        self.compute.run_instance(self.context, instance_id)
+        self.assertEqual(called, ['prefetch', 'spawn'])
+        db.instance_destroy(self.context, instance_id)
+
+    def test_run_instance_without_prefetch(self):
+        self.flags(prefetch_image_on_spawn=False)
+
+        def fake_prefetch_image(context, instance, image_meta):
+            self.fail('image should not be prefetched')
+
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       fake_prefetch_image)
+        instance_id = self._create_instance()
+        self.compute.run_instance(self.context, instance_id)
+        timings = test_notifier.NOTIFICATIONS[0]['payload']['timings']
+        self.assertFalse('prefetch' in timings)
+        self.compute.terminate_instance(self.context, instance_id)
+
+    def test_run_instance_volume_root_is_not_prefetched(self):
+        """Ensure no image is fetched for a root disk from a volume"""
+        def fake_prefetch_image(context, instance, image_meta):
+            self.fail('image should not be prefetched')
+
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       fake_prefetch_image)
+        self.stubs.Set(self.compute, '_setup_block_device_mapping',
+                       lambda context, instance_id: (None, [], []))
+        instance_id = self._create_instance({'root_device_name': '/dev/vda'})
+        db.block_device_mapping_create(self.context,
+                                       {'instance_id': instance_id,
+                                        'device_name': 'vda',
+                                        'volume_id': 1})
+        self.compute.run_instance(self.context, instance_id)
+        timings = test_notifier.NOTIFICATIONS[0]['payload']['timings']
+        self.assertFalse('prefetch' in timings)
+        db.instance_destroy(self.context, instance_id)
+
+    def test_run_instance_failure_kills_prefetch(self):
+        """Ensure a failed spawn doesn't leave the image downloading"""
+        called = []
+
+        def fake_prefetch_image(context, instance, image_meta):
+            called.append('prefetch')
+            try:
+                # Wait for a download that never finishes
+                greenthread.sleep(60)
+            except greenlet.GreenletExit:
+                called.append('killed')
+                raise
+
+        def fake_setup_block_device_mapping(context, instance_id):
+            greenthread.sleep(0)
+            raise exception.VolumeNotFound(volume_id=1)
+
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       fake_prefetch_image)
+        self.stubs.Set(self.compute, '_setup_block_device_mapping',
+                       fake_setup_block_device_mapping)
+        instance_id = self._create_instance()
+        self.assertRaises(exception.VolumeNotFound,
+                          self.compute.run_instance,
+                          self.context, instance_id)
+        self.assertEqual(called, ['prefetch', 'killed'])
+        db.instance_destroy(self.context, instance_id)
+
     def test_terminate_usage_notification(self):
         """Ensure terminate_instance generates apropriate usage notification"""
         instance_id = self._create_instance()
@@ -552,6 +650,29 @@ class ComputeTestCase(BaseTestCase):
 
         self.compute.terminate_instance(self.context, instance_id)
 
+    def test_scheduler_resources_are_released_on_spawn_failure(self):
+        """When a spawn fails the scheduler must stop counting it"""
+        released = []
+
+        def fake_spawn(*args, **kwargs):
+            raise exception.Error('spawn failed')
+
+        def fake_delete_instance_resources(context, instance):
+            released.append(instance['uuid'])
+
+        self.stubs.Set(self.compute.driver, 'spawn', fake_spawn)
+        self.stubs.Set(compute_manager.scheduler_api,
+                       'delete_instance_resources',
+                       fake_delete_instance_resources)
+        instance_id = self._create_instance()
+        inst_ref = db.instance_get(self.context, instance_id)
+        self.assertRaises(exception.Error,
+                          self.compute.run_instance,
+                          self.context,
+                          instance_id)
+        self.assertEqual(released, [inst_ref['uuid']])
+        db.instance_destroy(self.context, instance_id)
+
     def test_lock(self):
         """ensure locked instance cannot be changed"""
         instance = self._create_fake_instance()
@@ -920,6 +1041,30 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(power_state.NOSTATE, instances[0]['power_state'])
 
+    def test_power_state_change_event(self):
+        """Ensure driver events don't list all instances of the host"""
+        instance_id = self._create_instance()
+        self.compute.run_instance(self.context, instance_id)
+        instance_name = db.instance_get(self.context, instance_id)['name']
+        listings = []
+
+        def fake_get_all_by_host(context, host):
+            listings.append(host)
+            return []
+
+        self.stubs.Set(db, 'instance_get_all_by_host', fake_get_all_by_host)
+        self.compute._handle_power_state_change(instance_name,
+                                                power_state.PAUSED)
+        instance = db.instance_get(self.context, instance_id)
+        self.assertEqual(instance['power_state'], power_state.PAUSED)
+        self.assertEqual(listings, [])
+
+        # Unknown domains make the manager list the instances again
+        self.compute._handle_power_state_change('unknown',
+                                                power_state.RUNNING)
+        self.assertEqual(listings, [self.compute.host])
+        self.compute.terminate_instance(self.context, instance_id)
+
 
 class ComputeAPITestCase(BaseTestCase):
 
@@ -1768,6 +1913,78 @@ class ComputeAPITestCase(BaseTestCase):
         db.instance_destroy(c, instance_id2)
         db.instance_destroy(c, instance_id3)
 
+    def _stub_child_zones(self):
+        """Three child zones with two servers each; zone 2 has 'marker'."""
+        class Zone(object):
+            def __init__(self, id):
+                self.id = id
+
+        class Server(object):
+            def __init__(self, name):
+                self._info = {'name': name}
+
+        child_zones = [Zone(i) for i in xrange(1, 4)]
+        calls = []
+
+        def fake_call_zone_method(context, method_name, errors_to_ignore=None,
+                                  novaclient_collection_name='zones',
+                                  zones=None, search_opts=None):
+            calls.append(dict(search_opts))
+            results = []
+            for zone in zones or child_zones:
+                names = ['zone%d-a' % zone.id, 'zone%d-b' % zone.id]
+                if zone.id == 2:
+                    names[0] = 'marker'
+                marker = search_opts.get('marker')
+                if marker is not None:
+                    if marker not in names:
+                        results.append((zone.id, None))
+                        continue
+                    names = names[names.index(marker) + 1:]
+                names = names[:search_opts.get('limit')]
+                results.append((zone.id, [Server(name) for name in names]))
+            return results
+
+        self.stubs.Set(db, 'zone_get_all', lambda context: child_zones)
+        self.stubs.Set(nova.scheduler.api, 'call_zone_method',
+                       fake_call_zone_method)
+        return calls
+
+    def test_get_all_fills_page_from_child_zones(self):
+        c = context.get_admin_context()
+        calls = self._stub_child_zones()
+        instance_id = self._create_instance()
+
+        instances = self.compute_api.get_all(c, limit=3)
+        self.assertEqual([instance_id, 'zone1-a', 'zone1-b'],
+                         [inst.get('id', inst['name']) for inst in instances])
+        self.assertEqual(2, calls[0]['limit'])
+
+        instances = self.compute_api.get_all(c, limit=1)
+        self.assertEqual([instance_id], [inst['id'] for inst in instances])
+        self.assertEqual(1, len(calls))
+
+        db.instance_destroy(c, instance_id)
+
+    def test_get_all_with_marker_in_child_zone(self):
+        c = context.get_admin_context()
+        calls = self._stub_child_zones()
+        instance_id = self._create_instance()
+
+        instances = self.compute_api.get_all(c, marker='marker', limit=2)
+        self.assertEqual(['zone2-b', 'zone3-a'],
+                         [inst['name'] for inst in instances])
+        self.assertEqual('marker', calls[0]['marker'])
+        self.assertFalse('marker' in calls[1])
+
+        self.assertRaises(exception.MarkerNotFound,
+                          self.compute_api.get_all, c, marker='unknown')
+        self.assertRaises(exception.MarkerNotFound,
+                          self.compute_api.get_all, c, marker='marker',
+                          search_opts={'local_zone_only': True})
+
+        db.instance_destroy(c, instance_id)
+
     def test_get_all_by_metadata(self):
         """Test searching instances by metadata"""
 
@@ -2201,6 +2418,7 @@ class ComputeAPITestCase(BaseTestCase):
         self.compute.run_instance(self.context, instance_id)
         instance = self.compute_api.get(self.context, instance_id)
         security_group_name = self._create_group()['name']
+        test_notifier.NOTIFICATIONS = []
         self.compute_api.add_security_group(self.context,
                                             instance,
                                             security_group_name)
@@ -2208,6 +2426,14 @@ class ComputeAPITestCase(BaseTestCase):
                                                instance,
                                                security_group_name)
 
+        self.assertEquals(['compute.instance.security_group.add',
+                           'compute.instance.security_group.remove'],
+                          [msg['event_type']
+                           for msg in test_notifier.NOTIFICATIONS])
+        payload = test_notifier.NOTIFICATIONS[0]['payload']
+        self.assertEquals(payload['instance_id'], instance['uuid'])
+        self.assertEquals(payload['tenant_id'], instance['project_id'])
+
     def test_get_diagnostics(self):
         instance_id = self._create_instance()
         instance = self.compute_api.get(self.context, instance_id)
@@ -23,6 +23,7 @@ import datetime
 from nova import test
 from nova import context
 from nova import db
+from nova import exception
 from nova import flags
 
 FLAGS = flags.FLAGS
@@ -101,6 +102,166 @@ class DbApiTestCase(test.TestCase):
         else:
             self.assertTrue(result[1].deleted)
 
+    def test_instance_get_all_by_filters_regexp(self):
+        ctxt = context.get_admin_context()
+        for name in ('woot', 'woo', 'not-woot', 'woo_t', 'wooxt', 'WOOT'):
+            db.instance_create(ctxt, {'display_name': name})
+
+        def _names(filters):
+            result = db.instance_get_all_by_filters(ctxt, filters)
+            return sorted(inst['display_name'] for inst in result)
+
+        # LIKE compatible patterns
+        self.assertEqual(_names({'display_name': 'woo.*'}),
+                         ['woo', 'woo_t', 'woot', 'wooxt'])
+        self.assertEqual(_names({'display_name': '.*oot$'}),
+                         ['not-woot', 'woot'])
+        self.assertEqual(_names({'display_name': '^woo_t$'}), ['woo_t'])
+        self.assertEqual(_names({'display_name': 'woo.t'}),
+                         ['woo_t', 'wooxt'])
+        # LIKE is case insensitive in sqlite, the regexp isn't
+        self.assertEqual(_names({'display_name': 'WOO'}), ['WOOT'])
+        # Patterns only python can match
+        self.assertEqual(_names({'display_name': 'wo+t'}), ['woot'])
+        self.assertEqual(_names({'display_name': '.*'}),
+                         ['WOOT', 'not-woot', 'woo', 'woo_t', 'woot',
+                          'wooxt'])
+
+    def test_fixed_ip_get_instance_ips_by_regexp(self):
+        ctxt = context.get_admin_context()
+        # Addresses outside of FLAGS.fixed_range, which the test networks
+        # already hold
+        addresses = {1: ('192.168.10.2', '172.16.1.2'),
+                     2: ('192.168.10.3', '172.16.1.3'),
+                     3: ('192.168.11.2', None)}
+        for instance_id, (address, floating) in addresses.iteritems():
+            db.fixed_ip_create(ctxt, {'address': address,
+                                      'instance_id': instance_id})
+            if floating:
+                fixed_ip = db.fixed_ip_get_by_address(ctxt, address)
+                db.floating_ip_create(ctxt, {'address': floating,
+                                             'fixed_ip_id': fixed_ip['id']})
+        db.fixed_ip_create(ctxt, {'address': '192.168.10.4'})
+
+        def _ips(pattern):
+            result = db.fixed_ip_get_instance_ips_by_regexp(ctxt, pattern)
+            return sorted((r['instance_id'], r['ip']) for r in result)
+
+        # Exact addresses, fixed or floating
+        self.assertEqual(_ips('^192\.168\.10\.2$'), [(1, '192.168.10.2')])
+        self.assertEqual(_ips('172.16.1.3'), [(2, '172.16.1.3')])
+        self.assertEqual(_ips('192.168.10.4'), [])
+        # Prefixes
+        self.assertEqual(_ips('192.168.10.'),
+                         [(1, '192.168.10.2'), (2, '192.168.10.3')])
+        self.assertEqual(_ips('.*\.2$'),
+                         [(1, '192.168.10.2'), (3, '192.168.11.2')])
+        # Patterns only python can match
+        self.assertEqual(_ips('192\.168\.1[13]'), [(3, '192.168.11.2')])
+
+    def test_fixed_ip_get_by_address_unassociated(self):
+        ctxt = context.get_admin_context()
+        db.fixed_ip_create(ctxt, {'address': '192.168.10.5'})
+        fixed_ip = db.fixed_ip_get_by_address(self.context, '192.168.10.5')
+        self.assertEqual(fixed_ip['address'], '192.168.10.5')
+        self.assertEqual(fixed_ip['instance'], None)
+
+    def test_fixed_ip_get_by_address_other_project(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {'project_id': 'other'})
+        db.fixed_ip_create(ctxt, {'address': '192.168.10.6',
+                                  'instance_id': instance['id']})
+        self.assertRaises(exception.NotAuthorized,
+                          db.fixed_ip_get_by_address,
+                          self.context, '192.168.10.6')
+
+    def test_instance_get_all_by_filters_metadata(self):
+        ctxt = context.get_admin_context()
+        inst1 = db.instance_create(ctxt,
+                                   {'metadata': {'key1': 'value1'}})
+        inst2 = db.instance_create(ctxt,
+                                   {'metadata': {'key1': 'value1',
+                                                 'key2': 'value2'}})
+        db.instance_create(ctxt, {'metadata': {'key1': 'value2'}})
+
+        result = db.instance_get_all_by_filters(ctxt,
+                {'metadata': {'key1': 'value1'}})
+        self.assertEqual(sorted([inst1.id, inst2.id]),
+                         sorted(inst.id for inst in result))
+
+        result = db.instance_get_all_by_filters(ctxt,
+                {'metadata': [{'key1': 'value1'}, {'key2': 'value2'}]})
+        self.assertEqual([inst2.id], [inst.id for inst in result])
+
+    def test_instance_get_all_by_filters_paginate(self):
+        ctxt = context.get_admin_context()
+        for i in xrange(5):
+            db.instance_create(ctxt, {'display_name': 'inst%d' % i})
+        expected = db.instance_get_all_by_filters(ctxt, {})
+        self.assertEqual(5, len(expected))
+
+        seen = []
+        marker = None
+        while True:
+            page = db.instance_get_all_by_filters(ctxt, {},
+                                                  limit=2, marker=marker)
+            if not page:
+                break
+            self.assertTrue(len(page) <= 2)
+            seen.extend(page)
+            marker = page[-1]['uuid']
+        self.assertEqual([inst.id for inst in expected],
+                         [inst.id for inst in seen])
+
+        # Python-side filters still honour the limit and marker
+        page = db.instance_get_all_by_filters(ctxt,
+                {'display_name': 'inst[0-4]'}, limit=2,
+                marker=expected[0]['uuid'])
+        self.assertEqual([inst.id for inst in expected[1:3]],
+                         [inst.id for inst in page])
+
+        # LIKE filters are checked again, reading on past the rows
+        # that fail the check
+        for i in xrange(5):
+            db.instance_create(ctxt, {'display_name': 'INST%d' % i})
+        page = db.instance_get_all_by_filters(ctxt,
+                {'display_name': 'inst'}, limit=2)
+        self.assertEqual([inst.id for inst in expected[:2]],
+                         [inst.id for inst in page])
+
+        # Markers can be ids as well as uuids
+        page = db.instance_get_all_by_filters(ctxt,
+                {'display_name': 'inst'}, limit=2,
+                marker=str(expected[2]['id']))
+        self.assertEqual([inst.id for inst in expected[3:5]],
+                         [inst.id for inst in page])
+
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          ctxt, {}, marker='not-a-marker')
+
+    def test_instance_get_all_by_filters_marker_in_project(self):
+        ctxt = context.get_admin_context()
+        inst1 = db.instance_create(ctxt, {'project_id': 'project1'})
+        inst2 = db.instance_create(ctxt, {'project_id': 'project2'})
+        user_ctxt = context.RequestContext('user1', 'project1')
+
+        result = db.instance_get_all_by_filters(user_ctxt, {},
+                                                marker=inst1['uuid'])
+        self.assertEqual([], result)
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          user_ctxt, {}, marker=inst2['uuid'])
+
+    def test_instance_get_all_by_filters_columns_to_join(self):
+        ctxt = context.get_admin_context()
+        db.instance_create(ctxt, {'metadata': {'key1': 'value1'}})
+        result = db.instance_get_all_by_filters(ctxt, {},
+                                                columns_to_join=[])
+        self.assertFalse('metadata' in result[0].__dict__)
+        result = db.instance_get_all_by_filters(ctxt, {})
+        self.assertTrue('metadata' in result[0].__dict__)
+
     def test_migration_get_all_unconfirmed(self):
         ctxt = context.get_admin_context()
 
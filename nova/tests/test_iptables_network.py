@@ -78,6 +78,75 @@ class IptablesManagerTestCase(test.TestCase):
         super(IptablesManagerTestCase, self).setUp()
         self.manager = linux_net.IptablesManager()
 
+    def test_apply_only_changed_tables(self):
+        restored = []
+        saved = {'filter': self.sample_filter, 'nat': self.sample_nat}
+
+        def fake_execute(*cmd, **kwargs):
+            if cmd[0] == 'iptables-save':
+                return '\n'.join(saved[cmd[2]]), None
+            if cmd[0] == 'iptables-restore':
+                restored.append(kwargs['process_input'])
+                lines = kwargs['process_input'].split('\n')
+                table = [line for line in lines if line.startswith('*')][0]
+                saved[table[1:]] = lines
+            return '', None
+
+        self.flags(use_ipv6=False)
+        self.manager.execute = fake_execute
+        self.manager.apply()
+        self.assertEqual(len(restored), 2)
+
+        self.manager.apply()
+        self.assertEqual(len(restored), 2)
+
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-s 1.2.3.4/5 -j DROP')
+        self.manager.apply()
+        self.assertEqual(len(restored), 3)
+        self.assertTrue('-A run_tests.py-FORWARD -s 1.2.3.4/5 -j DROP'
+                        in restored[-1].split('\n'))
+
+        # Removing something that isn't there changes nothing
+        self.manager.ipv4['filter'].remove_rule('FORWARD', '-j ACCEPT')
+        self.manager.ipv4['nat'].empty_chain('float-snat')
+        self.manager.apply()
+        self.assertEqual(len(restored), 3)
+
+        # Neither does taking back a change before it is applied
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-j ACCEPT')
+        self.manager.ipv4['filter'].remove_rule('FORWARD', '-j ACCEPT')
+        self.manager.apply()
+        self.assertEqual(len(restored), 3)
+
+        # Rules flushed outside of nova are put back when the table is
+        # next applied
+        saved['nat'] = [line for line in self.sample_nat
+                        if 'nova-compute' not in line]
+        self.manager.apply()
+        self.assertEqual(len(restored), 3)
+        self.manager.ipv4['nat'].add_rule('float-snat', '-j ACCEPT')
+        self.manager.ipv4['nat'].remove_rule('float-snat', '-j ACCEPT')
+        self.manager.apply()
+        self.assertEqual(len(restored), 4)
+        self.assertTrue('*nat' in restored[-1].split('\n'))
+
+    def test_apply_saves_once_per_table(self):
+        commands = []
+
+        def fake_execute(*cmd, **kwargs):
+            commands.append(cmd[0])
+            if cmd[0] == 'iptables-save':
+                return '\n'.join(self.sample_filter), None
+            return '', None
+
+        self.flags(use_ipv6=False)
+        self.manager.execute = fake_execute
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-j DROP')
+        self.manager.apply()
+        # No iptables-save to check the restore
+        self.assertEqual(commands.count('iptables-save'), 2)
+        self.assertEqual(commands.count('iptables-restore'), 2)
+
     def test_filter_rules_are_wrapped(self):
         current_lines = self.sample_filter
 
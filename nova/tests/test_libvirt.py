@@ -16,12 +16,14 @@
 
 import copy
 import eventlet
+from eventlet import tpool
 import mox
 import os
 import re
 import shutil
 import sys
 import tempfile
+import time
 
 from xml.etree.ElementTree import fromstring as xml_to_tree
 from xml.dom.minidom import parseString as xml_to_dom
@@ -36,15 +38,20 @@ from nova import utils
 from nova.api.ec2 import cloud
 from nova.compute import power_state
 from nova.compute import vm_states
+from nova.network import linux_net
 from nova.virt import disk
 from nova.virt import images
 from nova.virt import driver
 from nova.virt.libvirt import connection
+from nova.virt.libvirt import events
 from nova.virt.libvirt import firewall
+from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import templates
 from nova.virt.libvirt import volume
 from nova.volume import driver as volume_driver
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.tests import fake_network
+from nova.tests import fakelibvirt
 from nova.tests import fake_libvirt_utils
 
 
@@ -179,6 +186,7 @@ class CacheConcurrencyTestCase(test.TestCase):
     def setUp(self):
         super(CacheConcurrencyTestCase, self).setUp()
         self.flags(instances_path='nova.compute.manager')
+        self.conn = connection.LibvirtConnection(False)
 
         def fake_exists(fname):
             basedir = os.path.join(FLAGS.instances_path, '_base')
@@ -199,7 +207,7 @@ class CacheConcurrencyTestCase(test.TestCase):
 
     def test_same_fname_concurrency(self):
         """Ensures that the same fname cache runs at a sequentially"""
-        conn = connection.LibvirtConnection
+        conn = self.conn
         wait1 = eventlet.event.Event()
         done1 = eventlet.event.Event()
         eventlet.spawn(conn._cache_image, _concurrency,
@@ -220,7 +228,7 @@ class CacheConcurrencyTestCase(test.TestCase):
 
     def test_different_fname_concurrency(self):
         """Ensures that two different fname caches are concurrent"""
-        conn = connection.LibvirtConnection
+        conn = self.conn
         wait1 = eventlet.event.Event()
         done1 = eventlet.event.Event()
         eventlet.spawn(conn._cache_image, _concurrency,
@@ -238,6 +246,359 @@ class CacheConcurrencyTestCase(test.TestCase):
             eventlet.sleep(0)
 
 
+class ImageCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.instances_path = tempfile.mkdtemp()
+        self.flags(instances_path=self.instances_path,
+                   image_cache_size_gb=2,
+                   image_cache_min_age=3600)
+        self.base_dir = os.path.join(self.instances_path, '_base')
+        os.mkdir(self.base_dir)
+        imagecache.libvirt_utils = fake_libvirt_utils
+        self.manager = imagecache.ImageCacheManager()
+
+    def tearDown(self):
+        imagecache.libvirt_utils = libvirt_utils
+        fake_libvirt_utils.disk_backing_files.clear()
+        shutil.rmtree(self.instances_path)
+        super(ImageCacheTestCase, self).tearDown()
+
+    def _create_base_files(self, ages):
+        """Creates 1 GB base files last used the given seconds ago."""
+        now = time.time()
+        files = []
+        for fname, age in ages.iteritems():
+            open(os.path.join(self.base_dir, fname), 'w').close()
+            files.append((fname, 1024 * 1024 * 1024, now - age))
+        self.stubs.Set(self.manager, '_list_base_files', lambda: files)
+
+    def _create_instance_disk(self, name, backing_file):
+        instance_dir = os.path.join(self.instances_path, name)
+        os.mkdir(instance_dir)
+        path = os.path.join(instance_dir, 'disk')
+        open(path, 'w').close()
+        fake_libvirt_utils.disk_backing_files[path] = backing_file
+
+    def _cached(self):
+        return sorted(os.listdir(self.base_dir))
+
+    def test_fetch_counts_hits_and_misses(self):
+        calls = []
+
+        def fake_fetch(target, image_id):
+            calls.append(image_id)
+            open(target, 'w').close()
+
+        base = self.manager.fetch('fname', fake_fetch, image_id=1)
+        self.manager.fetch('fname', fake_fetch, image_id=1)
+        self.assertEqual(base, os.path.join(self.base_dir, 'fname'))
+        self.assertEqual(calls, [1])
+        stats = self.manager.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_fetch_removes_partial_file(self):
+        def fake_fetch(target, image_id):
+            open(target, 'w').close()
+            raise IOError('download interrupted')
+
+        self.assertRaises(IOError, self.manager.fetch, 'fname', fake_fetch,
+                          image_id=1)
+        self.assertEqual(self._cached(), [])
+
+    def test_evict_least_recently_used_first(self):
+        self._create_base_files({'old': 7200, 'older': 8000,
+                                 'oldest': 9000, 'recent': 60})
+        self.manager.evict()
+        self.assertEqual(self._cached(), ['old', 'recent'])
+        stats = self.manager.stats()
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['cached_files'], 2)
+
+    def test_evict_keeps_referenced_files(self):
+        self._create_base_files({'old': 7200, 'older': 8000,
+                                 'oldest': 9000, 'recent': 60})
+        self._create_instance_disk('instance-00000001', 'oldest')
+        self.manager.evict()
+        self.assertEqual(self._cached(), ['oldest', 'recent'])
+        self.assertEqual(self.manager.stats()['referenced'], 1)
+
+    def test_evict_keeps_recently_used_files(self):
+        self._create_base_files({'a': 60, 'b': 120, 'c': 180})
+        self.manager.evict()
+        self.assertEqual(self._cached(), ['a', 'b', 'c'])
+        self.assertEqual(self.manager.stats()['evictions'], 0)
+
+    def test_evict_keeps_prewarm_images(self):
+        pinned = imagecache.get_root_fname('42')
+        self._create_base_files({pinned: 9000, 'old': 7200, 'recent': 60})
+        self.flags(image_cache_prewarm=['42'])
+        self.manager.evict()
+        self.assertEqual(self._cached(), sorted([pinned, 'recent']))
+
+    def test_evict_disabled_without_budget(self):
+        self.flags(image_cache_size_gb=0)
+        self._create_base_files({'a': 9000, 'b': 9000, 'c': 9000})
+        self.manager.evict()
+        self.assertEqual(self._cached(), ['a', 'b', 'c'])
+
+    def test_prewarm_fetches_missing_images(self):
+        cached = imagecache.get_root_fname('1')
+        open(os.path.join(self.base_dir, cached), 'w').close()
+        self.flags(image_cache_prewarm=['1', '2'])
+        fetched = []
+
+        def fake_fetch_image(context, target, image_id, user_id, project_id,
+                             size=None):
+            fetched.append(image_id)
+            open(target, 'w').close()
+
+        self.stubs.Set(fake_libvirt_utils, 'fetch_image', fake_fetch_image)
+        self.stubs.Set(imagecache.greenthread, 'spawn',
+                       lambda f, *args: f(*args))
+        ctxt = context.get_admin_context()
+        self.manager.prewarm(ctxt)
+        self.manager.prewarm(ctxt)
+        self.assertEqual(fetched, ['2'])
+        self.assertEqual(self.manager.stats()['prewarmed'], 1)
+
+
+class LibvirtTemplatesTestCase(test.TestCase):
+    def setUp(self):
+        super(LibvirtTemplatesTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test.template')
+        self._write('<domain>${name}</domain>')
+        templates.clear()
+        templates.load_cheetah()
+        self.compiled = []
+        real_compile = templates.Template.compile
+
+        def fake_compile(*args, **kwargs):
+            self.compiled.append(kwargs.get('source'))
+            return real_compile(*args, **kwargs)
+
+        self.stubs.Set(templates.Template, 'compile',
+                       staticmethod(fake_compile))
+
+    def tearDown(self):
+        templates.clear()
+        shutil.rmtree(self.tmpdir)
+        super(LibvirtTemplatesTestCase, self).tearDown()
+
+    def _write(self, source):
+        with open(self.path, 'w') as f:
+            f.write(source)
+
+    def test_render_compiles_once(self):
+        self.assertEqual(templates.render(self.path, [{'name': 'a'}]),
+                         '<domain>a</domain>')
+        self.assertEqual(templates.render(self.path, [{'name': 'b'}]),
+                         '<domain>b</domain>')
+        self.assertEqual(len(self.compiled), 1)
+
+    def test_render_recompiles_modified_template(self):
+        templates.render(self.path, [{'name': 'a'}])
+        mtime = os.stat(self.path).st_mtime
+        self._write('<domain type="kvm">${name}</domain>')
+        os.utime(self.path, (mtime + 10, mtime + 10))
+        self.assertEqual(templates.render(self.path, [{'name': 'a'}]),
+                         '<domain type="kvm">a</domain>')
+        self.assertEqual(len(self.compiled), 2)
+
+
+class LibvirtEventsTestCase(test.TestCase):
+    def setUp(self):
+        super(LibvirtEventsTestCase, self).setUp()
+        self.saved_libvirt = connection.libvirt
+        connection.libvirt = fakelibvirt
+        self.flags(libvirt_nonblocking=False,
+                   libvirt_connection_check_interval=60)
+        self.stubs.Set(events, 'start_event_loop', lambda libvirt: None)
+        self.conn = connection.LibvirtConnection(False)
+
+    def tearDown(self):
+        connection.libvirt = self.saved_libvirt
+        super(LibvirtEventsTestCase, self).tearDown()
+
+    def _define_domain(self, name):
+        xml = ("<domain type='kvm'><name>%s</name><memory>128000</memory>"
+               "<vcpu>1</vcpu></domain>" % name)
+        return self.conn._conn.defineXML(xml)
+
+    def test_connection_check_is_cached(self):
+        libvirt_conn = self.conn._conn
+        calls = []
+
+        def fake_get_capabilities():
+            calls.append(1)
+            return ''
+
+        self.stubs.Set(libvirt_conn, 'getCapabilities',
+                       fake_get_capabilities)
+        for i in xrange(5):
+            self.assertTrue(self.conn._conn is libvirt_conn)
+        self.assertEqual(calls, [])
+
+        self.conn._conn_checked_at -= 60
+        self.assertTrue(self.conn._conn is libvirt_conn)
+        self.assertTrue(self.conn._conn is libvirt_conn)
+        self.assertEqual(calls, [1])
+
+    def test_calls_go_through_tpool(self):
+        self.flags(libvirt_nonblocking=True)
+        conn = connection.LibvirtConnection(False)
+        self.assertTrue(isinstance(conn._conn, tpool.Proxy))
+        dom = conn._conn.defineXML("<domain type='kvm'><name>proxied</name>"
+                                   "<memory>128000</memory></domain>")
+        self.assertTrue(isinstance(dom, tpool.Proxy))
+        self.assertEqual(dom.name(), 'proxied')
+
+    def test_lifecycle_events_reach_listener(self):
+        changes = []
+        done = eventlet.event.Event()
+
+        def listener(instance_name, state):
+            changes.append((instance_name, state))
+            if state == power_state.SHUTOFF:
+                done.send()
+
+        self.assertTrue(self.conn.register_event_listener(listener))
+        dom = self._define_domain('instance-00000001')
+        dom.createWithFlags(0)
+        dom.suspend()
+        dom.destroy()
+        with eventlet.Timeout(5):
+            done.wait()
+        self.assertEqual(changes,
+                         [('instance-00000001', power_state.RUNNING),
+                          ('instance-00000001', power_state.PAUSED),
+                          ('instance-00000001', power_state.SHUTOFF)])
+
+    def test_events_disabled(self):
+        self.flags(libvirt_domain_events=False)
+        self.assertFalse(self.conn.register_event_listener(None))
+        self.assertEqual(self.conn._events, None)
+
+    def test_wait_for_domain_wakes_on_event(self):
+        self.conn.register_event_listener(lambda name, state: None)
+        dom = self._define_domain('instance-00000002')
+        calls = []
+
+        def _wait_for_boot():
+            calls.append(1)
+            if dom.isActive():
+                raise utils.LoopingCallDone
+
+        done = self.conn._wait_for_domain('instance-00000002',
+                                          _wait_for_boot)
+        eventlet.sleep(0)
+        dom.createWithFlags(0)
+        # NOTE: far less than the poll interval used with events.
+        with eventlet.Timeout(1):
+            done.wait()
+        self.assertEqual(len(calls), 2)
+
+
+class LibvirtHostInventoryTestCase(test.TestCase):
+    def setUp(self):
+        super(LibvirtHostInventoryTestCase, self).setUp()
+        self.saved_libvirt = connection.libvirt
+        connection.libvirt = fakelibvirt
+        self.flags(libvirt_nonblocking=False)
+        self.stubs.Set(libvirt_utils, 'get_fs_info',
+                       fake_libvirt_utils.get_fs_info)
+        self.conn = connection.LibvirtConnection(False)
+        for i in xrange(3):
+            xml = ("<domain type='kvm'><name>instance-%08x</name>"
+                   "<memory>128000</memory><vcpu>2</vcpu></domain>" % i)
+            self.conn._conn.defineXML(xml).createWithFlags(0)
+
+        self.calls = {}
+        for cls, names in ((fakelibvirt.Connection,
+                            ('listDomainsID', 'lookupByID', 'getType',
+                             'getVersion', 'getCapabilities')),
+                           (fakelibvirt.Domain, ('info', 'name'))):
+            for name in names:
+                self._count_calls(cls, name)
+
+    def tearDown(self):
+        connection.libvirt = self.saved_libvirt
+        super(LibvirtHostInventoryTestCase, self).tearDown()
+
+    def _count_calls(self, cls, name):
+        method = getattr(cls, name)
+        calls = self.calls
+
+        def counted(*args, **kwargs):
+            calls[name] = calls.get(name, 0) + 1
+            return method(*args, **kwargs)
+
+        self.stubs.Set(cls, name, counted)
+
+    def test_list_instances_detail_walks_domains_once(self):
+        infos = self.conn.list_instances_detail()
+        self.assertEqual(sorted(info.name for info in infos),
+                         ['instance-00000000', 'instance-00000001',
+                          'instance-00000002'])
+        self.assertEqual(self.calls, {'listDomainsID': 1,
+                                      'lookupByID': 3,
+                                      'info': 3,
+                                      'name': 3})
+
+    def test_host_inventory_uses_one_sweep(self):
+        inventory = self.conn.get_host_inventory()
+        self.assertEqual(inventory['vcpus_used'], 6)
+        self.assertEqual(inventory['hypervisor_version'], 14000)
+        self.assertEqual(self.calls, {'listDomainsID': 1,
+                                      'lookupByID': 3,
+                                      'info': 3,
+                                      'name': 3,
+                                      'getType': 1,
+                                      'getVersion': 1,
+                                      'getCapabilities': 1})
+
+        # NOTE: the sweep over the domains is reused for a little while.
+        self.calls.clear()
+        self.conn.get_host_inventory()
+        self.assertEqual(self.calls, {})
+
+        self.flags(libvirt_domain_snapshot_ttl=0)
+        self.conn.get_host_inventory()
+        self.assertEqual(self.calls, {'listDomainsID': 1,
+                                      'lookupByID': 3,
+                                      'info': 3,
+                                      'name': 3})
+
+    def test_periodic_tasks_share_one_sweep(self):
+        self.conn.list_instances_detail()
+        self.conn.get_host_inventory()
+        self.conn.get_host_stats(refresh=True)
+        self.assertEqual(self.calls['listDomainsID'], 1)
+        # list_instances() is used to check that a domain exists
+        self.conn.list_instances()
+        self.assertEqual(self.calls['listDomainsID'], 2)
+
+    def test_domain_changes_drop_the_shared_sweep(self):
+        self.conn.list_instances_detail()
+        xml = ("<domain type='kvm'><name>instance-00000003</name>"
+               "<memory>128000</memory><vcpu>2</vcpu></domain>")
+        self.conn._create_new_domain(xml)
+        names = [info.name for info in self.conn.list_instances_detail()]
+        self.assertTrue('instance-00000003' in names)
+        self.assertEqual(self.calls['listDomainsID'], 2)
+
+    def test_host_state_shares_connection(self):
+        stats = self.conn.get_host_stats()
+        self.assertEqual(stats['vcpus_used'], 6)
+        self.assertEqual(stats['hypervisor_type'], 'QEMU')
+        self.assertEqual(stats['disk_total'], 128)
+        self.assertEqual(stats['disk_available'], 84)
+        self.assertEqual(self.calls['listDomainsID'], 1)
+
+
 class FakeVolumeDriver(object):
     def __init__(self, *args, **kwargs):
         pass
@@ -1099,32 +1460,16 @@ class HostStateTestCase(test.TestCase):
     class FakeConnection(object):
         """Fake connection object"""
 
-        def get_vcpu_total(self):
-            return 1
-
-        def get_vcpu_used(self):
-            return 0
-
-        def get_cpu_info(self):
-            return HostStateTestCase.cpu_info
-
-        def get_local_gb_total(self):
-            return 100
-
-        def get_local_gb_used(self):
-            return 20
-
-        def get_memory_mb_total(self):
-            return 497
-
-        def get_memory_mb_used(self):
-            return 88
-
-        def get_hypervisor_type(self):
-            return 'QEMU'
-
-        def get_hypervisor_version(self):
-            return 13091
+        def get_host_inventory(self):
+            return {'vcpus': 1,
+                    'vcpus_used': 0,
+                    'cpu_info': HostStateTestCase.cpu_info,
+                    'local_gb': 100,
+                    'local_gb_used': 20,
+                    'memory_mb': 497,
+                    'memory_mb_used': 88,
+                    'hypervisor_type': 'QEMU',
+                    'hypervisor_version': 13091}
 
     def test_update_status(self):
         self.mox.StubOutWithMock(connection, 'get_connection')
@@ -1190,6 +1535,9 @@ class IptablesFirewallTestCase(test.TestCase):
                 """setup_basic_rules in nwfilter calls this."""
                 pass
         self.fake_libvirt_connection = FakeLibvirtConnection()
+        # Don't let rules added by other tests leak into the driver's tables
+        self.stubs.Set(linux_net, 'iptables_manager',
+                       linux_net.IptablesManager())
         self.fw = firewall.IptablesFirewallDriver(
                       get_connection=lambda: self.fake_libvirt_connection)
 
@@ -1315,7 +1663,6 @@ class IptablesFirewallTestCase(test.TestCase):
                 ips.extend(info['ips'])
             return [ip['ip'] for ip in ips]
 
-        from nova.network import linux_net
         linux_net.iptables_manager.execute = fake_iptables_execute
 
         network_info = _fake_network_info(self.stubs, 1)
@@ -1407,14 +1754,101 @@ class IptablesFirewallTestCase(test.TestCase):
                   ipv6_rules_per_addr * ipv6_addr_per_network * networks_count)
 
     def test_do_refresh_security_group_rules(self):
+        admin_ctxt = context.get_admin_context()
         instance_ref = self._create_instance_ref()
+        grantee_instance_ref = self._create_instance_ref()
+        other_instance_ref = self._create_instance_ref()
+
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        grantee_secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgranteegroup',
+                                             'description': 'test group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id':
+                                           grantee_secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 80,
+                                       'to_port': 81,
+                                       'group_id': secgroup['id']})
+        db.instance_add_security_group(admin_ctxt, instance_ref['id'],
+                                       secgroup['id'])
+        db.instance_add_security_group(admin_ctxt, grantee_instance_ref['id'],
+                                       grantee_secgroup['id'])
+
+        for ref in (instance_ref, grantee_instance_ref, other_instance_ref):
+            self.fw.instances[ref['id']] = ref
+
         self.mox.StubOutWithMock(self.fw,
-                                 'add_filters_for_instance',
+                                 'refresh_instance_chain',
                                  use_mock_anything=True)
-        self.fw.prepare_instance_filter(instance_ref, mox.IgnoreArg())
-        self.fw.instances[instance_ref['id']] = instance_ref
+        self.fw.refresh_instance_chain(instance_ref)
+        self.fw.refresh_instance_chain(grantee_instance_ref)
         self.mox.ReplayAll()
-        self.fw.do_refresh_security_group_rules("fake")
+        self.fw.do_refresh_security_group_rules(secgroup['id'])
+
+    def test_refresh_security_group_rules_after_removal(self):
+        admin_ctxt = context.get_admin_context()
+        instance_ref = self._create_instance_ref()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 22,
+                                       'to_port': 22,
+                                       'cidr': '192.168.99.0/24'})
+        db.instance_add_security_group(admin_ctxt, instance_ref['id'],
+                                       secgroup['id'])
+        network_info = _fake_network_info(self.stubs, 1)
+        self.fw.instances[instance_ref['id']] = instance_ref
+        self.fw.network_infos[instance_ref['id']] = network_info
+        self.fw.add_filters_for_instance(instance_ref)
+
+        chain_name = self.fw._instance_chain_name(instance_ref)
+        table = self.fw.iptables.ipv4['filter']
+
+        def _has_group_rule():
+            return any('192.168.99.0/24' in r.rule for r in table.rules
+                       if r.chain == chain_name)
+
+        self.assertTrue(_has_group_rule())
+
+        # compute.api removes the instance from the group before the
+        # refresh is cast
+        db.instance_remove_security_group(admin_ctxt, instance_ref['id'],
+                                          secgroup['id'])
+        self.fw.do_refresh_security_group_rules(secgroup['id'])
+        self.assertFalse(_has_group_rule())
+        self.fw.remove_filters_for_instance(instance_ref)
+
+    def test_refresh_instance_chain(self):
+        instance_ref = self._create_instance_ref()
+        network_info = _fake_network_info(self.stubs, 1)
+        self.fw.instances[instance_ref['id']] = instance_ref
+        self.fw.network_infos[instance_ref['id']] = network_info
+        self.fw.add_filters_for_instance(instance_ref)
+
+        chain_name = self.fw._instance_chain_name(instance_ref)
+        table = self.fw.iptables.ipv4['filter']
+        local_rules = [r for r in table.rules if r.chain == 'local']
+        chain_rules = [r for r in table.rules if r.chain == chain_name]
+
+        self.fw.refresh_instance_chain(instance_ref)
+        self.assertEqual([r for r in table.rules if r.chain == 'local'],
+                         local_rules)
+        self.assertEqual([r for r in table.rules if r.chain == chain_name],
+                         chain_rules)
+        self.assertTrue(table.dirty)
+        self.fw.remove_filters_for_instance(instance_ref)
 
     @test.skip_if(missing_libvirt(), "Test requires libvirt")
     def test_unfilter_instance_undefines_nwfilter(self):
@@ -1694,6 +2128,24 @@ class NWFilterTestCase(test.TestCase):
 
         db.instance_destroy(admin_ctxt, instance_ref['id'])
 
+    def test_define_filter_skips_unchanged_filters(self):
+        defined = []
+        self.fake_libvirt_connection.nwfilterDefineXML = defined.append
+        xml = "<filter name='nova-instance-fake' chain='root'></filter>"
+
+        self.fw._define_filter(xml)
+        self.fw._define_filter(xml)
+        self.assertEqual(len(defined), 1)
+
+        changed = "<filter name='nova-instance-fake' chain='ipv4'></filter>"
+        self.fw._define_filter(changed)
+        self.fw._define_filter(changed)
+        self.assertEqual(defined, [xml, changed])
+
+        self.fw._defined_filters.pop('nova-instance-fake')
+        self.fw._define_filter(changed)
+        self.assertEqual(len(defined), 3)
+
 
 class LibvirtUtilsTestCase(test.TestCase):
     def test_create_image(self):
@@ -19,16 +19,20 @@
 """Tests for the testing the metadata code."""
 
 import base64
+import datetime
 import webob
 
+from nova.api.metadata import cache
 from nova.api.metadata import handler
 from nova.db.sqlalchemy import api
 from nova import db
 from nova import exception
 from nova import flags
 from nova import network
+from nova import rpc
 from nova import test
 from nova.tests import fake_network
+from nova import utils
 
 
 FLAGS = flags.FLAGS
@@ -48,6 +52,9 @@ class MetadataTestCase(test.TestCase):
     def setUp(self):
         super(MetadataTestCase, self).setUp()
         self.instance = ({'id': 1,
+                         'uuid': 'aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa',
+                         'updated_at': None,
+                         'deleted': False,
                          'name': 'fake',
                          'project_id': 'test',
                          'key_name': None,
@@ -87,6 +94,8 @@ class MetadataTestCase(test.TestCase):
         self.stubs.Set(api, 'instance_get', instance_get)
         self.stubs.Set(api, 'instance_get_all_by_filters', instance_get_list)
         self.stubs.Set(api, 'instance_get_floating_address', floating_get)
+        self.stubs.Set(cache, 'consume_invalidations', lambda: None)
+        cache.invalidate()
         self.app = handler.MetadataRequestHandler()
         network_manager = fake_network.FakeNetworkManager()
         self.stubs.Set(self.app.compute_api.network_api,
@@ -147,6 +156,128 @@ class MetadataTestCase(test.TestCase):
         self.assertEqual(self.request('/meta-data/local-hostname'),
             "%s.%s" % (self.instance['hostname'], FLAGS.dhcp_domain))
 
+    def test_metadata_is_cached(self):
+        self.instance['user_data'] = base64.b64encode('happy')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.instance['user_data'] = base64.b64encode('sad')
+
+        self.calls = 0
+
+        def instance_get_list(*args, **kwargs):
+            self.calls += 1
+            return [self.instance]
+
+        def fixed_ip_get(*args, **kwargs):
+            self.fail(_('a cache hit should not query the database'))
+
+        self.stubs.Set(api, 'instance_get_all_by_filters', instance_get_list)
+        self.stubs.Set(api, 'fixed_ip_get_by_address', fixed_ip_get)
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.assertEqual(self.request('/meta-data/instance-id'), 'i-00000001')
+        self.assertEqual(self.calls, 0)
+
+        # Security group changes drop the entry through notifications
+        self.stubs.Set(rpc, 'fanout_cast', lambda *args: None)
+        cache.notify({'event_type': 'compute.instance.security_group.add',
+                      'payload': {'instance_id': self.instance['uuid'],
+                                  'tenant_id': self.instance['project_id']}})
+        self.assertEqual(self.request('/user-data'), 'sad')
+        # One lookup by fixed ip and one for the project's MPI data
+        self.assertEqual(self.calls, 2)
+
+    def test_metadata_cache_notify_fans_out(self):
+        casts = []
+
+        def fake_fanout_cast(context, topic, msg):
+            casts.append((topic, msg))
+
+        self.stubs.Set(rpc, 'fanout_cast', fake_fanout_cast)
+        cache.notify({'event_type': 'compute.instance.delete',
+                      'payload': {'instance_id': self.instance['uuid'],
+                                  'tenant_id': self.instance['project_id']}})
+        cache.notify({'event_type': 'network.floating_ip.allocate',
+                      'payload': {}})
+        args = {'instance_id': self.instance['uuid'],
+                'project_id': self.instance['project_id']}
+        self.assertEqual(casts, [(FLAGS.metadata_cache_topic,
+                                  {'method': 'invalidate', 'args': args})])
+
+    def test_metadata_cache_invalidated_from_fanout(self):
+        self.instance['user_data'] = base64.b64encode('happy')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.instance['user_data'] = base64.b64encode('sad')
+
+        # The instance was deleted elsewhere and its fixed ip handed to
+        # a new instance
+        cache.CacheInvalidator().invalidate(
+                None, instance_id=self.instance['uuid'],
+                project_id=self.instance['project_id'])
+        self.instance = dict(self.instance,
+                             uuid='bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbbb')
+        self.assertEqual(self.request('/user-data'), 'sad')
+
+    def test_metadata_cache_expires(self):
+        self.instance['user_data'] = base64.b64encode('happy')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.instance['user_data'] = base64.b64encode('sad')
+
+        later = utils.utcnow() + datetime.timedelta(
+                seconds=FLAGS.metadata_cache_ttl + 1)
+        utils.set_time_override(later)
+        try:
+            self.assertEqual(self.request('/user-data'), 'sad')
+        finally:
+            utils.clear_time_override()
+
+    def test_metadata_cache_disabled(self):
+        self.flags(metadata_cache_ttl=0)
+        self.instance['user_data'] = base64.b64encode('happy')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.instance['user_data'] = base64.b64encode('sad')
+        self.assertEqual(self.request('/user-data'), 'sad')
+
+    def test_metadata_cache_invalidate(self):
+        metadata_cache = cache.MetadataCache(ttl=60)
+        metadata_cache.set_metadata('10.0.0.1', 1, 'proj1', 'data1')
+        metadata_cache.set_metadata('10.0.0.2', 2, 'proj1', 'data2')
+        metadata_cache.set_metadata('10.0.0.3', 3, 'proj2', 'data3')
+        metadata_cache.set_metadata('10.0.0.4', 4, 'proj3', 'data4')
+        metadata_cache.set_mpi('proj1', 'mpi1')
+        metadata_cache.set_mpi('proj2', 'mpi2')
+
+        self.assertEqual(metadata_cache.get_metadata('10.0.0.1'),
+                         'data1')
+
+        metadata_cache.invalidate(address='10.0.0.3')
+        self.assertEqual(metadata_cache.get_metadata('10.0.0.3'), None)
+        self.assertEqual(metadata_cache.get_mpi('proj2'), 'mpi2')
+
+        # The metadata of an instance embeds the MPI data of its project
+        metadata_cache.invalidate(instance_id=2)
+        self.assertEqual(metadata_cache.get_metadata('10.0.0.1'), None)
+        self.assertEqual(metadata_cache.get_metadata('10.0.0.2'), None)
+        self.assertEqual(metadata_cache.get_mpi('proj1'), None)
+        self.assertEqual(metadata_cache.get_metadata('10.0.0.4'),
+                         'data4')
+
+        metadata_cache.set_metadata('10.0.0.1', 1, 'proj1', 'data1')
+        metadata_cache.set_mpi('proj1', 'mpi1')
+        metadata_cache.invalidate(project_id='proj1')
+        self.assertEqual(metadata_cache.get_metadata('10.0.0.1'), None)
+        self.assertEqual(metadata_cache.get_mpi('proj1'), None)
+        self.assertEqual(metadata_cache.get_mpi('proj2'), 'mpi2')
+
+        metadata_cache.invalidate()
+        self.assertEqual(metadata_cache.get_mpi('proj2'), None)
+
+    def test_metadata_cache_evicts_from_indexes(self):
+        metadata_cache = cache.MetadataCache(ttl=60, size=1)
+        metadata_cache.set_metadata('10.0.0.1', 1, 'proj1', 'data1')
+        metadata_cache.set_metadata('10.0.0.2', 2, 'proj2', 'data2')
+        self.assertEqual(metadata_cache._by_instance, {2: set(['10.0.0.2'])})
+        self.assertEqual(metadata_cache._by_project,
+                         {'proj2': set(['10.0.0.2'])})
+
     def test_get_instance_mapping(self):
         """Make sure that _get_instance_mapping works"""
         ctxt = None
@@ -19,16 +19,27 @@
 Unit Tests for remote procedure calls using kombu
 """
 
+import eventlet
+from eventlet import event
+import kombu.serialization
+
 from nova import context
+from nova import flags
 from nova import log as logging
 from nova import test
+from nova.rpc import common as rpc_common
 from nova.rpc import impl_kombu
 from nova.tests import test_rpc_common
 
 
+FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.tests.rpc')
 
 
+def have_msgpack():
+    return 'msgpack' in kombu.serialization.registry._encoders
+
+
 class RpcKombuTestCase(test_rpc_common._BaseRpcTestCase):
     def setUp(self):
         self.rpc = impl_kombu
@@ -108,3 +119,236 @@ class RpcKombuTestCase(test_rpc_common._BaseRpcTestCase):
         conn2.consume(limit=1)
         conn2.close()
         self.assertEqual(self.received_message, message)
+
+    def test_calls_share_reply_queue(self):
+        """Test that calls receive their replies on one queue"""
+        self.flags(rpc_shared_reply_queue=True)
+        value = 42
+        for i in xrange(3):
+            result = self.rpc.call(self.context, 'test',
+                                   {"method": "echo",
+                                    "args": {"value": value + i}})
+            self.assertEqual(value + i, result)
+
+        proxy = self.rpc._get_reply_proxy()
+        self.assertEqual(len(proxy.connection.consumers), 1)
+        self.assertEqual(proxy._waiters, {})
+
+    def test_call_without_shared_reply_queue(self):
+        """Test calls that declare a reply queue per call"""
+        value = 42
+        result = self.rpc.call(self.context, 'test',
+                               {"method": "echo_three_times",
+                                "args": {"value": value}})
+        self.assertEqual(value + 2, result)
+
+    def test_call_timeout(self):
+        """Test that a call nobody answers times out"""
+        self.flags(rpc_shared_reply_queue=True)
+        self.assertRaises(rpc_common.Timeout, self.rpc.call, self.context,
+                          'no_such_topic', {"method": "echo",
+                                            "args": {"value": 42}},
+                          timeout=0.1)
+
+        self.flags(rpc_shared_reply_queue=False)
+        self.assertRaises(rpc_common.Timeout, self.rpc.call, self.context,
+                          'no_such_topic', {"method": "echo",
+                                            "args": {"value": 42}},
+                          timeout=0.1)
+
+    def test_publish_queue_groups_by_topic(self):
+        """Test that queued messages are published grouped by topic"""
+        sent = []
+
+        class FakePublisher(object):
+            def __init__(self, channel, topic):
+                self.topic = topic
+
+            def send(self, msg):
+                sent.append((self.topic, msg))
+
+        publish_queue = self.rpc.PublishQueue(batch_size=10)
+        for i in xrange(3):
+            publish_queue.send(FakePublisher, 'a', i)
+            publish_queue.send(FakePublisher, 'b', i)
+        publish_queue.flush(timeout=5)
+
+        self.assertEqual(sent, [('a', 0), ('a', 1), ('a', 2),
+                                ('b', 0), ('b', 1), ('b', 2)])
+        stats = publish_queue.stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['published'], 6)
+        self.assertEqual(stats['batches'], 1)
+        publish_queue.close()
+
+    def test_publish_queue_retries_and_drains_on_close(self):
+        """Test that failed messages are retried and close publishes all"""
+        sent = []
+        failures = {'flaky': 1, 'broken': 10}
+
+        class FakePublisher(object):
+            def __init__(self, channel, topic):
+                self.topic = topic
+
+            def send(self, msg):
+                if failures.get(msg):
+                    failures[msg] -= 1
+                    raise ValueError(msg)
+                sent.append(msg)
+
+        publish_queue = self.rpc.PublishQueue(batch_size=10)
+        for msg in ('first', 'flaky', 'broken', 'last'):
+            publish_queue.send(FakePublisher, 'a', msg)
+        publish_queue.close(timeout=5)
+
+        self.assertEqual(sent, ['first', 'flaky', 'last'])
+        self.assertEqual(failures['broken'],
+                         10 - FLAGS.rpc_publish_attempts)
+
+    def test_cast_without_publish_queue(self):
+        """Test casts published synchronously"""
+        conn = self.rpc.create_connection()
+        self.received_message = None
+
+        def _callback(message):
+            self.received_message = message
+
+        conn.declare_topic_consumer('a_topic', _callback)
+        self.rpc.cast(self.context, 'a_topic', {'method': 'echo'})
+        conn.consume(limit=1)
+        conn.close()
+        self.assertEqual(self.received_message['method'], 'echo')
+
+    def test_cast_with_publish_queue(self):
+        """Test casts published from the publish queue"""
+        self.flags(rpc_async_publish=True)
+        conn = self.rpc.create_connection()
+        self.received_message = None
+
+        def _callback(message):
+            self.received_message = message
+
+        conn.declare_topic_consumer('a_topic', _callback)
+        self.rpc.cast(self.context, 'a_topic', {'method': 'echo'})
+        self.rpc.flush(timeout=5)
+        conn.consume(limit=1)
+        conn.close()
+        self.assertEqual(self.received_message['method'], 'echo')
+        self.assertEqual(self.rpc.publish_stats()['published'], 1)
+
+    def test_pack_context_nested(self):
+        """Test that a context packed as one dict unpacks the same"""
+        self.flags(rpc_serializer='msgpack')
+        msg = {'method': 'echo'}
+        self.rpc._pack_context(msg, self.context)
+        self.assertEqual(sorted(msg.keys()), ['_context', 'method'])
+
+        ctxt = self.rpc._unpack_context(msg)
+        self.assertEqual(msg, {'method': 'echo'})
+        self.assertEqual(ctxt.to_dict(), self.context.to_dict())
+
+    @test.skip_unless(have_msgpack(), "Test requires msgpack")
+    def test_call_msgpack(self):
+        """Test a call encoded with msgpack"""
+        self.flags(rpc_serializer='msgpack')
+        value = {'name': u'caf\xe9', 'ids': [1, 2, 3]}
+        result = self.rpc.call(self.context, 'test', {"method": "echo",
+                                                 "args": {"value": value}})
+        self.assertEqual(value, result)
+
+    def test_worker_lane_backlog(self):
+        """Test that a full lane queues messages in order"""
+        ran = []
+        acked = []
+        blocker = event.Event()
+
+        def _work(value):
+            if value == 0:
+                blocker.wait()
+            ran.append(value)
+
+        lane = self.rpc.WorkerLane('test_lane', 1)
+        for value in xrange(3):
+            lane.spawn('lane_work', _work, value,
+                       ack=lambda value=value: acked.append(value))
+        self.assertEqual(lane.stats(), {'size': 1, 'running': 1,
+                                        'backlog': 2})
+        # Waiting messages stay unacked so the broker stops sending more
+        eventlet.sleep(0)
+        self.assertEqual(acked, [0])
+
+        blocker.send()
+        lane.pool.waitall()
+        self.assertEqual(ran, [0, 1, 2])
+        self.assertEqual(acked, [0, 1, 2])
+        stats = self.rpc.method_stats()['lane_work']
+        self.assertEqual(stats['lane'], 'test_lane')
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertTrue(stats['calls'] >= 3)
+        self.assertEqual(sum(stats['run_time'].values()), stats['calls'])
+
+    def test_worker_lane_skips_message_when_ack_fails(self):
+        """Test that a message is not run if it can't be acked"""
+        ran = []
+
+        def _ack():
+            raise IOError('channel closed')
+
+        lane = self.rpc.WorkerLane('test_lane', 1)
+        lane.spawn('lane_work', ran.append, 1, ack=_ack)
+        lane.spawn('lane_work', ran.append, 2)
+        lane.pool.waitall()
+        self.assertEqual(ran, [2])
+
+    def test_prefetch_count_follows_pool_size(self):
+        """Test that the prefetch window defaults to the smallest pool"""
+        self.flags(rpc_thread_pool_size=32, rpc_long_running_pool_size=8)
+        self.assertEqual(self.rpc._prefetch_count(), 8)
+        self.flags(rpc_prefetch_count=0)
+        self.assertEqual(self.rpc._prefetch_count(), 0)
+
+    def test_prefetch_window_shared_by_lanes(self):
+        """Test that a long running backlog holds the prefetch window.
+
+        Lanes share the channel, and so its prefetch count: messages
+        waiting for a busy long running lane stay unacked and count
+        against the window quick methods are delivered through too.
+        """
+        self.flags(rpc_long_running_pool_size=1)
+        callback = self.rpc.ProxyCallback(object())
+        blocker = event.Event()
+        ran = []
+        acked = []
+
+        def _spawn(method, value):
+            def _work():
+                if method == 'run_instance':
+                    blocker.wait()
+                ran.append(value)
+            callback._get_lane(method).spawn(method, _work,
+                    ack=lambda: acked.append(value))
+
+        for value in xrange(3):
+            _spawn('run_instance', value)
+        eventlet.sleep(0)
+        # Two long running messages wait unacked for the busy worker
+        self.assertEqual(acked, [0])
+        self.assertEqual(callback.long_running_pool.stats()['backlog'], 2)
+
+        # A quick method that got delivered still runs right away
+        _spawn('echo', 'quick')
+        callback.pool.pool.waitall()
+        self.assertEqual(ran, ['quick'])
+        self.assertEqual(acked, [0, 'quick'])
+
+        blocker.send()
+        callback.long_running_pool.pool.waitall()
+        self.assertEqual(ran, ['quick', 0, 1, 2])
+
+    def test_long_running_methods_use_own_lane(self):
+        """Test that long running methods don't share the default pool"""
+        callback = self.rpc.ProxyCallback(object())
+        self.assertEqual(callback._get_lane('run_instance').name,
+                         'long_running')
+        self.assertEqual(callback._get_lane('echo').name, 'default')
@@ -0,0 +1,138 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the servicegroup drivers."""
+
+import datetime
+
+from nova import context
+from nova import db
+from nova import exception
+from nova import rpc
+from nova import test
+from nova import utils
+from nova.servicegroup import api as servicegroup
+
+
+class FakeService(object):
+    def __init__(self, service_ref):
+        self.host = service_ref['host']
+        self.topic = service_ref['topic']
+        self.service_id = service_ref['id']
+
+
+class _BaseServiceGroupTestCase(object):
+    driver = None
+
+    def setUp(self):
+        super(_BaseServiceGroupTestCase, self).setUp()
+        self.flags(servicegroup_driver=self.driver)
+        self.context = context.get_admin_context()
+        self.services = []
+        for host in ('host1', 'host2'):
+            self.services.append(db.service_create(self.context,
+                    {'host': host, 'binary': 'nova-compute',
+                     'topic': 'compute', 'report_count': 0}))
+
+    def test_heartbeat(self):
+        servicegroup.heartbeat(self.context, FakeService(self.services[0]))
+        self.assertTrue(servicegroup.is_up(
+                db.service_get(self.context, self.services[0]['id'])))
+        self.assertEqual(servicegroup.get_all_up(self.context, 'compute'),
+                         ['host1'])
+        self.assertEqual(servicegroup.are_up(self.context,
+                                             self.services[:1]), [True])
+
+
+class DbServiceGroupTestCase(_BaseServiceGroupTestCase, test.TestCase):
+    driver = 'nova.servicegroup.db_driver.DbDriver'
+
+    def setUp(self):
+        super(DbServiceGroupTestCase, self).setUp()
+        long_ago = utils.utcnow() - datetime.timedelta(hours=1)
+        db.service_update(self.context, self.services[1]['id'],
+                          {'created_at': long_ago, 'updated_at': long_ago})
+
+    def test_heartbeat_counts_reports(self):
+        service = FakeService(self.services[0])
+        servicegroup.heartbeat(self.context, service)
+        servicegroup.heartbeat(self.context, service)
+        service_ref = db.service_get(self.context, service.service_id)
+        self.assertEqual(service_ref['report_count'], 2)
+
+    def test_heartbeat_deleted_service(self):
+        db.service_destroy(self.context, self.services[0]['id'])
+        self.assertRaises(exception.NotFound, servicegroup.heartbeat,
+                          self.context, FakeService(self.services[0]))
+
+
+class MemcachedServiceGroupTestCase(_BaseServiceGroupTestCase,
+                                    test.TestCase):
+    driver = 'nova.servicegroup.mc_driver.MemcachedDriver'
+
+    def setUp(self):
+        super(MemcachedServiceGroupTestCase, self).setUp()
+        servicegroup._DRIVERS.pop(self.driver, None)
+
+    def test_heartbeat_does_not_touch_db(self):
+        self.mox.StubOutWithMock(db, 'service_heartbeat')
+        self.mox.ReplayAll()
+        servicegroup.heartbeat(self.context, FakeService(self.services[1]))
+        self.assertEqual(servicegroup.get_all_up(self.context, 'compute'),
+                         ['host2'])
+
+
+class RpcServiceGroupTestCase(_BaseServiceGroupTestCase, test.TestCase):
+    driver = 'nova.servicegroup.rpc_driver.RpcDriver'
+
+    def setUp(self):
+        super(RpcServiceGroupTestCase, self).setUp()
+        servicegroup._DRIVERS.pop(self.driver, None)
+        self.driver_obj = servicegroup.get_driver()
+
+        def _fanout_cast(context, topic, msg):
+            self.driver_obj.heartbeat_received(**msg['args'])
+
+        self.stubs.Set(rpc, 'fanout_cast', _fanout_cast)
+
+    def test_heartbeat_expires(self):
+        self.driver_obj.heartbeat_received('compute', 'host1')
+        self.driver_obj.heartbeat_received('compute', 'host2')
+        self.driver_obj.heartbeats[('compute', 'host2')] -= 3600
+        self.assertEqual(servicegroup.get_all_up(self.context, 'compute'),
+                         ['host1'])
+
+    def test_are_up_asks_scheduler_once(self):
+        calls = []
+
+        def _call(context, topic, msg, timeout=None):
+            calls.append(timeout)
+            return [['compute', 'host2', 0]]
+
+        self.stubs.Set(rpc, 'call', _call)
+        self.flags(servicegroup_rpc_timeout=5)
+        self.assertEqual(servicegroup.are_up(self.context, self.services),
+                         [False, True])
+        self.assertEqual(calls, [5])
+
+    def test_are_up_scheduler_timeout(self):
+        def _call(context, topic, msg, timeout=None):
+            raise rpc.Timeout()
+
+        self.stubs.Set(rpc, 'call', _call)
+        self.assertEqual(servicegroup.are_up(self.context, self.services),
+                         [False, False])
@@ -325,6 +325,49 @@ class GenericUtilsTestCase(test.TestCase):
         self.assertEqual(generated_url, actual_url)
 
 
+class LRUCacheTestCase(test.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.keys(), ['c', 'a'])
+
+    def test_update_refreshes_key(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 10
+        cache['c'] = 3
+        self.assertEqual(cache['a'], 10)
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+
+    def test_pop_and_clear(self):
+        cache = utils.LRUCache(3)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertEqual(cache.pop('a', 'gone'), 'gone')
+        self.assertEqual(cache.keys(), ['b'])
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('b'), None)
+
+    def test_peek_and_on_evict(self):
+        evicted = []
+        cache = utils.LRUCache(2, on_evict=lambda k, v: evicted.append(k))
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.peek('a'), 1)
+        self.assertEqual(cache.peek('c', 'missing'), 'missing')
+        cache['c'] = 3
+        self.assertEqual(evicted, ['a'])
+        self.assertEqual(cache.keys(), ['c', 'b'])
+
+
 class IsUUIDLikeTestCase(test.TestCase):
     def assertUUIDLike(self, val, expected):
         result = utils.is_uuid_like(val)
@@ -155,6 +155,31 @@ class VMWareAPIVMTestCase(test.TestCase):
         instances = self.conn.list_instances()
         self.assertEquals(len(instances), 1)
 
+    def test_list_instances_detail(self):
+        self._create_vm()
+        instances = self.conn.list_instances_detail()
+        self.assertEquals(len(instances), 1)
+        self.assertEquals(instances[0].name, 1)
+        self.assertEquals(instances[0].state, power_state.RUNNING)
+
+    def test_get_info_uses_inventory_cache(self):
+        self._create_vm()
+        vmwareapi_fake.reset_call_counts()
+        info = self.conn.get_info(1)
+        self._check_vm_info(info, power_state.RUNNING)
+        # Only the check for changes, no RetrieveProperties of every VM
+        self.assertEquals(vmwareapi_fake.call_count(), 1)
+        self.assertEquals(vmwareapi_fake.call_count('WaitForUpdatesEx'), 1)
+
+    def test_inventory_refreshed_on_expired_version(self):
+        self._create_vm()
+        vm = vmwareapi_fake._get_objects("VirtualMachine")[0]
+        # A change the property collector will not report
+        vm.set("runtime.powerState", "poweredOff")
+        vmwareapi_fake.expire_updates()
+        info = self.conn.get_info(1)
+        self._check_vm_info(info, power_state.SHUTDOWN)
+
     def test_spawn(self):
         self._create_vm()
         info = self.conn.get_info(1)
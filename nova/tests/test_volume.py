@@ -21,6 +21,9 @@ Tests for Volume Code.
 """
 
 import cStringIO
+import socket
+import time
+
 
 from nova import context
 from nova import exception
@@ -31,11 +34,21 @@ from nova import rpc
 from nova import test
 from nova import utils
 from nova import volume
+from nova.volume import driver
+from nova.volume import reclaim
+from nova.volume import san
 
 FLAGS = flags.FLAGS
 LOG = logging.getLogger('nova.tests.volume')
 
 
+def _wait_for_reclaim(volume_driver):
+    """Wait for the background reclaim of a volume driver to finish."""
+    worker = volume_driver.reclaimer._worker
+    if worker is not None:
+        worker.wait()
+
+
 class VolumeTestCase(test.TestCase):
     """Test Case for volumes."""
 
@@ -48,6 +61,7 @@ class VolumeTestCase(test.TestCase):
         self.instance_id = db.instance_create(self.context, {})['id']
 
     def tearDown(self):
+        _wait_for_reclaim(self.volume.driver)
         db.instance_destroy(self.context, self.instance_id)
         super(VolumeTestCase, self).tearDown()
 
@@ -280,6 +294,7 @@ class DriverTestCase(test.TestCase):
         self.instance_id = db.instance_create(self.context, inst)['id']
 
     def tearDown(self):
+        _wait_for_reclaim(self.volume.driver)
         super(DriverTestCase, self).tearDown()
 
     def _attach_volume(self):
@@ -366,3 +381,208 @@ class ISCSITestCase(DriverTestCase):
         self.mox.UnsetStubs()
 
         self._detach_volume(volume_id_list)
+
+
+class ReclaimTestCase(test.TestCase):
+    """Test Case for the background reclaim of deleted volumes."""
+
+    def setUp(self):
+        super(ReclaimTestCase, self).setUp()
+        self.flags(volume_clear_chunk_size=256,
+                   volume_clear_ionice='')
+        self.commands = []
+        self.lv_attr = '-wi-a-'
+        self.lvs_output = ''
+        self.sleeps = []
+
+        def fake_execute(*cmd, **kwargs):
+            self.commands.append(cmd)
+            if cmd[:4] == ('lvs', '--noheadings', '-o', 'lv_attr'):
+                return '  %s\n' % self.lv_attr, ''
+            if cmd[0] == 'lvs':
+                return self.lvs_output, ''
+            if cmd[0] == 'lvdisplay':
+                return '  %s\n' % self.lv_attr, ''
+            return '', ''
+
+        self.stubs.Set(reclaim, '_sleep', self.sleeps.append)
+        self.driver = driver.VolumeDriver(execute=fake_execute)
+
+    def tearDown(self):
+        self._wait()
+        super(ReclaimTestCase, self).tearDown()
+
+    def _wait(self):
+        _wait_for_reclaim(self.driver)
+
+    def test_delete_volume_is_wiped_in_background(self):
+        self.flags(volume_clear_bandwidth=128)
+        self.driver.delete_volume({'name': 'volume-1', 'size': 1})
+        self.assertEqual(self.commands[-1],
+                         ('lvrename', FLAGS.volume_group, 'volume-1',
+                          'reclaim-volume-1'))
+        stats = self.driver.get_reclaim_stats()
+        self.assertEqual(stats['queue_depth'], 1)
+        self.assertEqual(stats['pending_mb'], 1024)
+
+        self._wait()
+        wipes = [cmd for cmd in self.commands if cmd[0] == 'dd']
+        self.assertEqual(len(wipes), 4)
+        self.assertEqual(wipes[1],
+                         ('dd', 'if=/dev/zero',
+                          'of=/dev/%s/reclaim-volume-1' % FLAGS.volume_group,
+                          'bs=1024K', 'seek=256', 'count=256',
+                          'oflag=direct'))
+        self.assertEqual(self.commands[-1],
+                         ('lvremove', '-f',
+                          '%s/reclaim-volume-1' % FLAGS.volume_group))
+        # 256MB chunks at 128MB/s
+        self.assertEqual(len(self.sleeps), 4)
+        self.assertTrue(all(1.5 < secs <= 2 for secs in self.sleeps))
+
+        stats = self.driver.get_reclaim_stats()
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['reclaimed'], 1)
+        self.assertEqual(stats['reclaimed_mb'], 1024)
+
+    def test_thin_volume_is_not_wiped(self):
+        self.lv_attr = 'Vwi-a-tz'
+        self.driver.delete_volume({'name': 'volume-1', 'size': 1})
+        self._wait()
+        self.assertFalse([cmd for cmd in self.commands if cmd[0] == 'dd'])
+        self.assertEqual(self.commands[-1][0], 'lvremove')
+
+    def test_discard(self):
+        self.flags(volume_clear='discard')
+        self.driver.delete_volume({'name': 'volume-1', 'size': 1})
+        self._wait()
+        self.assertTrue(('blkdiscard', '/dev/%s/reclaim-volume-1' %
+                         FLAGS.volume_group) in self.commands)
+        self.assertFalse([cmd for cmd in self.commands if cmd[0] == 'dd'])
+
+    def test_pending_volumes_are_resumed(self):
+        self.flags(volume_clear='none')
+        self.lvs_output = ('  reclaim-volume-2 100.00\n'
+                           '  volume-3 1024.00\n')
+        self.driver.reclaimer.start()
+        stats = self.driver.get_reclaim_stats()
+        self.assertEqual(stats['queue_depth'], 1)
+        self.assertEqual(stats['pending_mb'], 100)
+        self._wait()
+        self.assertEqual(self.commands[-1],
+                         ('lvremove', '-f',
+                          '%s/reclaim-volume-2' % FLAGS.volume_group))
+
+    def test_synchronous_delete(self):
+        self.flags(volume_reclaim_in_background=False)
+        self.driver.delete_volume({'name': 'volume-1', 'size': 1})
+        self.assertEqual(self.driver.get_reclaim_stats()['queue_depth'], 0)
+        self.assertFalse([cmd for cmd in self.commands
+                          if cmd[0] == 'lvrename'])
+        self.assertEqual(self.commands[-1][0], 'lvremove')
+
+
+class FakeSSHTransport(object):
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+
+class FakeSSHClient(object):
+    def __init__(self):
+        self.transport = FakeSSHTransport()
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+class SanSSHPoolTestCase(test.TestCase):
+    """Test Case for the pool of SSH connections to SANs."""
+
+    def setUp(self):
+        super(SanSSHPoolTestCase, self).setUp()
+        self.clients = []
+        self.commands = []
+
+        def fake_ssh_execute(ssh, cmd, check_exit_code=True):
+            self.commands.append((ssh, cmd))
+            return ('out', '')
+
+        self.stubs.Set(san, 'ssh_execute', fake_ssh_execute)
+
+    def _connect(self):
+        client = FakeSSHClient()
+        self.clients.append(client)
+        return client
+
+    def test_connections_are_reused(self):
+        pool = san.SSHPool(self._connect, 2, keepalive=30)
+        for i in xrange(3):
+            self.assertEqual(pool.execute('ls'), ('out', ''))
+        self.assertEqual(len(self.clients), 1)
+        self.assertEqual(self.clients[0].transport.keepalive, 30)
+        stats = pool.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['free'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertAlmostEqual(stats['hit_rate'], 2.0 / 3)
+
+    def test_dead_and_idle_connections_are_evicted(self):
+        pool = san.SSHPool(self._connect, 2, idle_timeout=60)
+        pool.put(pool.get())
+        self.clients[0].transport.active = False
+        pool.put(pool.get())
+        self.assertEqual(len(self.clients), 2)
+        pool._last_used[self.clients[1]] = time.time() - 120
+        pool.put(pool.get())
+        self.assertEqual(len(self.clients), 3)
+        self.assertTrue(self.clients[1].closed)
+        self.assertEqual(pool.stats()['evicted'], 2)
+
+    def test_broken_channel_is_retried(self):
+        def broken_once(ssh, cmd, check_exit_code=True):
+            self.commands.append((ssh, cmd))
+            if len(self.commands) == 1:
+                raise socket.error('broken pipe')
+            return ('out', '')
+
+        self.stubs.Set(san, 'ssh_execute', broken_once)
+        pool = san.SSHPool(self._connect, 1, retries=1)
+        self.assertEqual(pool.execute('ls'), ('out', ''))
+        self.assertEqual(len(self.clients), 2)
+        self.assertTrue(self.clients[0].closed)
+        stats = pool.stats()
+        self.assertEqual(stats['broken'], 1)
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['in_use'], 0)
+
+        self.commands = []
+        pool = san.SSHPool(self._connect, 1, retries=0)
+        self.assertRaises(socket.error, pool.execute, 'ls')
+        # The slot of the broken connection was released
+        self.assertEqual(pool.execute('ls'), ('out', ''))
+
+    def test_commands_run_concurrently(self):
+        self.flags(san_ip='10.0.0.1', san_ssh_pool_size=2)
+        self.stubs.Set(san.SanISCSIDriver, '_connect_to_ssh',
+                       lambda driver: self._connect())
+        san._SSH_POOLS.clear()
+        driver = san.SanISCSIDriver()
+        results = driver._run_concurrently((driver._run_ssh, 'ls'),
+                                           (driver._run_ssh, 'pwd'))
+        self.assertEqual(results, [('out', ''), ('out', '')])
+        stats = san.ssh_pool_stats()['admin@10.0.0.1:22']
+        self.assertEqual(stats['requests'], 2)
+        san._SSH_POOLS.clear()
@@ -23,6 +23,10 @@ import os
 import re
 import stubout
 import ast
+import StringIO
+from decimal import Decimal
+
+import eventlet
 
 from nova import db
 from nova import context
@@ -229,6 +233,81 @@ class XenAPIVMTestCase(test.TestCase):
         instances = self.conn.list_instances()
         self.assertEquals(instances, [])
 
+    def test_list_instances_fetches_records_in_bulk(self):
+        for name in ('1', '2', '3'):
+            xenapi_fake.create_vm(name, 'Running')
+        xenapi_fake.reset_call_counts()
+        self.assertEquals(sorted(self.conn.list_instances()),
+                          ['1', '2', '3'])
+        # The second listing reuses the records
+        self.assertEquals(len(self.conn.list_instances()), 3)
+        self.assertEquals(xenapi_fake.call_count(), 1)
+        self.assertEquals(xenapi_fake.call_count('VM.get_all_records'), 1)
+
+    def test_wait_for_task_event(self):
+        session = self.conn._session
+        task = xenapi_fake.create_task('Async.VM.start')
+        waiter = eventlet.spawn(session.wait_for_task, task)
+        # Only finish the task once the event loop is waiting on event.next
+        with eventlet.Timeout(5):
+            while (task not in session._task_waiters or
+                   not xenapi_fake.call_count('event.next')):
+                eventlet.sleep(0.01)
+        task_rec = xenapi_fake.get_record('task', task)
+        task_rec['status'] = 'success'
+        task_rec['result'] = ''
+        xenapi_fake.send_event('task', task)
+        with eventlet.Timeout(5):
+            self.assertEquals(waiter.wait(), '')
+        self.assertEquals(session._task_waiters, {})
+
+    def test_wait_for_task_finished_before_waiting(self):
+        session = self.conn._session
+        # Keep the event loop busy waiting on another task
+        other_task = xenapi_fake.create_task('Async.VM.clean_shutdown')
+        other_waiter = eventlet.spawn(session.wait_for_task, other_task)
+        with eventlet.Timeout(5):
+            while not xenapi_fake.call_count('event.next'):
+                eventlet.sleep(0.01)
+
+        task = xenapi_fake.create_task('Async.VM.start')
+        real_call_xenapi = session.call_xenapi
+
+        def _call_xenapi(method, *args):
+            task_rec = dict(real_call_xenapi(method, *args))
+            # The task finishes without an event right after the first look
+            finished = xenapi_fake.get_record('task', task)
+            finished['status'] = 'success'
+            finished['result'] = ''
+            return task_rec
+
+        self.stubs.Set(session, 'call_xenapi', _call_xenapi)
+        with eventlet.Timeout(5):
+            self.assertEquals(session.wait_for_task(task), '')
+        self.assertFalse(task in session._task_waiters)
+
+        other_rec = xenapi_fake.get_record('task', other_task)
+        other_rec['status'] = 'success'
+        other_rec['result'] = ''
+        xenapi_fake.send_event('task', other_task)
+        with eventlet.Timeout(5):
+            other_waiter.wait()
+
+    def test_wait_for_task_rechecks_without_event(self):
+        self.flags(xenapi_task_recheck_interval=0.01)
+        session = self.conn._session
+        task = xenapi_fake.create_task('Async.VM.start')
+        self.stubs.Set(session, '_watch_tasks', lambda: eventlet.sleep(5))
+        waiter = eventlet.spawn(session.wait_for_task, task)
+        with eventlet.Timeout(5):
+            while task not in session._task_waiters:
+                eventlet.sleep(0.01)
+        task_rec = xenapi_fake.get_record('task', task)
+        task_rec['status'] = 'success'
+        task_rec['result'] = ''
+        with eventlet.Timeout(5):
+            self.assertEquals(waiter.wait(), '')
+
     def test_get_diagnostics(self):
         instance = self._create_instance()
         self.conn.get_diagnostics(instance)
@@ -1072,6 +1151,123 @@ class CompareVersionTestCase(test.TestCase):
         self.assertTrue(vmops.cmp_version('1.2.3', '1.2.3.4') < 0)
 
 
+RRD_UPDATES = ('<xport><meta><start>1000</start><step>60</step>'
+               '<end>1240</end><rows>5</rows><columns>6</columns>'
+               '<legend>'
+               '<entry>AVERAGE:vm:aaaa-1111:cpu0</entry>'
+               '<entry>AVERAGE:vm:aaaa-1111:vif_0_tx</entry>'
+               '<entry>AVERAGE:vm:aaaa-1111:vif_0_rx</entry>'
+               '<entry>AVERAGE:vm:bbbb-2222:cpu0</entry>'
+               '<entry>AVERAGE:vm:bbbb-2222:memory</entry>'
+               '<entry>AVERAGE:vm:bbbb-2222:vif_1_tx</entry>'
+               '</legend></meta><data>'
+               '<row><t>1240</t>'
+               '<v>0.0123</v><v>1532.6667</v><v>NaN</v>'
+               '<v>0.5</v><v>536870912.0000</v><v>98765.4321</v></row>'
+               '<row><t>1180</t>'
+               '<v>0.0456</v><v>2048.5</v><v>17.25</v>'
+               '<v>0.25</v><v>536870912.0000</v><v>12345.6789</v></row>'
+               '<row><t>1120</t>'
+               '<v>NaN</v><v>1024.1234</v><v>33.3333</v>'
+               '<v>0.125</v><v>268435456.0000</v><v>NaN</v></row>'
+               '<row><t>1060</t>'
+               '<v>0.0789</v><v>0.0000</v><v>12.5</v>'
+               '<v>0.0625</v><v>268435456.0000</v><v>555.5555</v></row>'
+               '<row><t>1000</t>'
+               '<v>0.0011</v><v>4096.0</v><v>8.75</v>'
+               '<v>0.03125</v><v>134217728.0000</v><v>1.1111</v></row>'
+               '</data></xport>')
+
+
+class RRDTestCase(test.TestCase):
+    """Compares parse_rrd_update to the results of the Decimal based
+    parser it replaced."""
+
+    def _parse(self, start, until=None):
+        return vm_utils.parse_rrd_update(StringIO.StringIO(RRD_UPDATES),
+                                         start, until)
+
+    def _assertMetrics(self, metrics, expected):
+        self.assertEqual(sorted(metrics.keys()), sorted(expected.keys()))
+        for uuid, names in expected.iteritems():
+            self.assertEqual(sorted(metrics[uuid].keys()), sorted(names))
+            for name, value in names.iteritems():
+                self.assertEqual(metrics[uuid][name], float(value))
+
+    def test_parse_rrd_update(self):
+        expected = {'aaaa-1111': {'cpu0': Decimal('0.0345'),
+                                  'vif_0_rx': Decimal('4047.4980'),
+                                  'vif_0_tx': Decimal('353217.4050')},
+                    'bbbb-2222': {'cpu0': Decimal('0.1938'),
+                                  'memory': Decimal('348966092.8000'),
+                                  'vif_1_tx': Decimal('3737070.3600')}}
+        self._assertMetrics(self._parse(1000), expected)
+
+    def test_parse_rrd_update_until(self):
+        expected = {'aaaa-1111': {'cpu0': Decimal('0.0400'),
+                                  'vif_0_rx': Decimal('2887.4990'),
+                                  'vif_0_tx': Decimal('563203.7020')},
+                    'bbbb-2222': {'cpu0': Decimal('0.0729'),
+                                  'memory': Decimal('223696213.3333'),
+                                  'vif_1_tx': Decimal('33477.7730')}}
+        self._assertMetrics(self._parse(900, 1150), expected)
+
+    def _stub_connections(self):
+        connections = []
+        self.fail_requests = False
+        test_case = self
+
+        class FakeResponse(StringIO.StringIO):
+            status = 200
+
+        class FakeConnection(object):
+            def __init__(self, host):
+                self.closed = False
+                connections.append(self)
+
+            def request(self, method, path, headers=None):
+                # Let other greenthreads run while the request is out
+                eventlet.sleep(0)
+                if test_case.fail_requests:
+                    raise vm_utils.socket.error('connection reset')
+
+            def getresponse(self):
+                return FakeResponse(RRD_UPDATES)
+
+            def close(self):
+                self.closed = True
+
+        self.stubs.Set(vm_utils.httplib, 'HTTPConnection', FakeConnection)
+        self.stubs.Set(vm_utils, '_RRD_CONNECTIONS', {})
+        return connections
+
+    def test_rrd_connections_not_shared(self):
+        connections = self._stub_connections()
+        fetches = [eventlet.spawn(vm_utils.get_rrd_updates, 'host', 1000)
+                   for i in xrange(2)]
+        for fetch in fetches:
+            self.assertTrue(fetch.wait())
+        self.assertEqual(len(connections), 2)
+        self.assertEqual(vm_utils._RRD_CONNECTIONS['host'], connections)
+
+        # Kept connections are reused
+        self.assertTrue(vm_utils.get_rrd_updates('host', 1000))
+        self.assertEqual(len(connections), 2)
+
+    def test_rrd_connection_failure(self):
+        connections = self._stub_connections()
+        fetches = [eventlet.spawn(vm_utils.get_rrd_updates, 'host', 1000)
+                   for i in xrange(2)]
+        for fetch in fetches:
+            fetch.wait()
+        self.fail_requests = True
+        self.assertEqual(vm_utils.get_rrd_updates('host', 1000), None)
+        # Both kept connections are dropped and one new one is tried
+        self.assertEqual(len(connections), 3)
+        self.assertTrue(all(conn.closed for conn in connections))
+        self.assertFalse('host' in vm_utils._RRD_CONNECTIONS)
+
+
 class FakeXenApi(object):
     """Fake XenApi for testing HostState."""
 
@@ -27,6 +27,7 @@ from nova import test
 from nova import rpc
 from nova import utils
 from nova.auth import manager as auth_manager
+from nova.compute import vm_states
 from nova.scheduler import zone_manager
 
 FLAGS = flags.FLAGS
@@ -379,3 +380,85 @@ class ZoneManagerTestCase(test.TestCase):
         utils.set_time_override(time_future)
         caps = zm.get_zone_capabilities(None)
         self.assertEquals(caps, {})
+
+    def _setup_host_data(self, zm, syncs=1):
+        self.mox.StubOutWithMock(zm, '_compute_node_get_all')
+        self.mox.StubOutWithMock(zm, '_instance_get_all')
+        for i in xrange(syncs):
+            zm._compute_node_get_all(mox.IgnoreArg()).AndReturn([
+                    dict(local_gb=1024, memory_mb=2048,
+                         service=dict(host='host1')),
+                    dict(local_gb=2048, memory_mb=4096,
+                         service=dict(host='host2'))])
+            zm._instance_get_all(mox.IgnoreArg()).AndReturn([
+                    dict(uuid='uuid1', local_gb=10, memory_mb=512,
+                         host='host1'),
+                    dict(uuid='uuid2', local_gb=20, memory_mb=1024,
+                         host='host2'),
+                    dict(uuid='uuid3', local_gb=20, memory_mb=1024,
+                         host=None),
+                    dict(uuid='uuid4', local_gb=40, memory_mb=256,
+                         host='host1', vm_state=vm_states.ERROR,
+                         launched_at=None)])
+
+    def test_get_all_host_data_syncs_once(self):
+        zm = zone_manager.ZoneManager()
+        self._setup_host_data(zm)
+
+        self.mox.ReplayAll()
+        host_data = zm.get_all_host_data(None)
+        # Served from memory this time around; mox would complain.
+        host_data = zm.get_all_host_data(None)
+        self.mox.VerifyAll()
+
+        self.assertEquals(len(host_data), 2)
+        reserved = FLAGS.reserved_host_memory_mb
+        self.assertEquals(host_data['host1'].free_ram_mb,
+                          2048 - 512 - reserved)
+        self.assertEquals(host_data['host1'].free_disk_gb, 1024 - 10)
+        self.assertEquals(host_data['host2'].free_ram_mb,
+                          4096 - 1024 - reserved)
+
+    def test_get_all_host_data_incremental_updates(self):
+        zm = zone_manager.ZoneManager()
+        self._setup_host_data(zm)
+
+        self.mox.ReplayAll()
+        zm.get_all_host_data(None)
+        # Create, resize and delete
+        zm.update_instance_resources('host1', 'uuid4', 40, 256)
+        zm.update_instance_resources('host2', 'uuid2', 5, 128)
+        zm.delete_instance_resources('uuid1')
+        zm.delete_instance_resources('unknown')
+        host_data = zm.get_all_host_data(None)
+        self.mox.VerifyAll()
+
+        reserved = FLAGS.reserved_host_memory_mb
+        self.assertEquals(host_data['host1'].free_ram_mb,
+                          2048 - 256 - reserved)
+        self.assertEquals(host_data['host1'].free_disk_gb, 1024 - 40)
+        self.assertEquals(host_data['host2'].free_ram_mb,
+                          4096 - 128 - reserved)
+        self.assertEquals(host_data['host2'].free_disk_gb, 2048 - 5)
+
+    def test_get_all_host_data_resyncs(self):
+        zm = zone_manager.ZoneManager()
+        self._setup_host_data(zm, syncs=3)
+
+        self.mox.ReplayAll()
+        zm.get_all_host_data(None)
+
+        # Periodic reconciliation
+        time_future = utils.utcnow() + datetime.timedelta(
+                seconds=FLAGS.host_data_sync_interval + 1)
+        utils.set_time_override(time_future)
+        zm.get_all_host_data(None)
+        utils.clear_time_override()
+
+        # New compute node reporting in
+        zm.update_service_capabilities("compute", "host1", dict(a=1))
+        zm.get_all_host_data(None)
+        zm.update_service_capabilities("compute", "host3", dict(a=1))
+        zm.update_service_capabilities("compute", "host3", dict(a=1))
+        zm.get_all_host_data(None)
+        self.mox.VerifyAll()
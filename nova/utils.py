@@ -560,6 +560,100 @@ class LoopingCall(object):
         return self.done.wait()
 
 
+class LRUCache(object):
+    """A mapping holding at most `size` items. Once full, storing a new
+    key evicts the least recently used one.
+
+    Entries are kept on a circular doubly linked list, most recently
+    used first, so every operation is O(1).  on_evict, if given, is called
+    with the key and value of every entry evicted to make room.
+    """
+
+    _PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+    def __init__(self, size, on_evict=None):
+        self.size = size
+        self.on_evict = on_evict
+        self.clear()
+
+    def clear(self):
+        self._map = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def _unlink(self, link):
+        prev_link, next_link = link[self._PREV], link[self._NEXT]
+        prev_link[self._NEXT] = next_link
+        next_link[self._PREV] = prev_link
+
+    def _push_front(self, link):
+        root = self._root
+        first = root[self._NEXT]
+        link[self._PREV] = root
+        link[self._NEXT] = first
+        first[self._PREV] = link
+        root[self._NEXT] = link
+
+    def get(self, key, default=None):
+        link = self._map.get(key)
+        if link is None:
+            return default
+        self._unlink(link)
+        self._push_front(link)
+        return link[self._VALUE]
+
+    def peek(self, key, default=None):
+        """Like get(), without making key the most recently used."""
+        link = self._map.get(key)
+        if link is None:
+            return default
+        return link[self._VALUE]
+
+    def __getitem__(self, key):
+        link = self._map.get(key)
+        if link is None:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        link = self._map.get(key)
+        if link is not None:
+            self._unlink(link)
+            link[self._VALUE] = value
+        else:
+            if self._map and len(self._map) >= self.size:
+                oldest = self._root[self._PREV]
+                self._unlink(oldest)
+                del self._map[oldest[self._KEY]]
+                if self.on_evict is not None:
+                    self.on_evict(oldest[self._KEY], oldest[self._VALUE])
+            link = [None, None, key, value]
+            self._map[key] = link
+        self._push_front(link)
+
+    def pop(self, key, default=None):
+        link = self._map.pop(key, None)
+        if link is None:
+            return default
+        self._unlink(link)
+        return link[self._VALUE]
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __len__(self):
+        return len(self._map)
+
+    def keys(self):
+        """Keys from most to least recently used."""
+        keys = []
+        link = self._root[self._NEXT]
+        while link is not self._root:
+            keys.append(link[self._KEY])
+            link = link[self._NEXT]
+        return keys
+
+
 def xhtml_escape(value):
     """Escapes a string so it is valid within XML or XHTML.
 
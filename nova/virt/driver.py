@@ -505,6 +505,34 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def register_event_listener(self, callback):
+        """Register a callback for changes to the power state of instances.
+
+        callback(instance_name, power_state) is called from a greenthread
+        whenever the hypervisor reports such a change.  Returns True if
+        the driver reports them, False if their power state has to be
+        polled.
+        """
+        return False
+
+    def manage_image_cache(self, context):
+        """Manage the driver's local image cache.
+
+        Some drivers keep copies of images locally to speed up booting.
+        This is called periodically by the compute manager so they can
+        prune images nothing uses anymore and prefetch popular ones.
+        """
+        pass
+
+    def prefetch_image(self, context, instance, image_meta):
+        """Fetch the images of an instance about to be spawned.
+
+        Called by the compute manager while the network and block devices
+        of the instance are set up, so drivers caching images locally can
+        have them downloaded by the time spawn() needs them.
+        """
+        pass
+
     def host_power_action(self, host, action):
         """Reboots, shuts down or powers up the host."""
         raise NotImplementedError()
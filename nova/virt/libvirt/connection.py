@@ -39,7 +39,6 @@ Supports KVM, LXC, QEMU, UML, and XEN.
 
 """
 
-import hashlib
 import functools
 import multiprocessing
 import netaddr
@@ -54,6 +53,7 @@ import uuid
 from xml.dom import minidom
 from xml.etree import ElementTree
 
+from eventlet import event
 from eventlet import greenthread
 from eventlet import tpool
 
@@ -72,11 +72,13 @@ from nova.compute import power_state
 from nova.virt import disk
 from nova.virt import driver
 from nova.virt import images
+from nova.virt.libvirt import events
+from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import templates
 from nova.virt.libvirt import utils as libvirt_utils
 
 
 libvirt = None
-Template = None
 
 
 LOG = logging.getLogger('nova.virt.libvirt_conn')
@@ -154,6 +156,27 @@ flags.DEFINE_string('libvirt_disk_prefix',
                     'Override the default disk prefix for the devices '
                     'attached to a server, which is dependent on '
                     'libvirt_type. (valid options are: sd, xvd, uvd, vd)')
+flags.DEFINE_bool('libvirt_nonblocking',
+                  True,
+                  'Make libvirt calls in native threads so they do not '
+                  'block other greenthreads')
+flags.DEFINE_integer('libvirt_connection_check_interval',
+                     60,
+                     'Seconds a libvirt connection is trusted to be alive '
+                     'without checking it again')
+flags.DEFINE_bool('libvirt_domain_events',
+                  True,
+                  'Use libvirt domain events to follow power state '
+                  'changes instead of polling')
+flags.DEFINE_integer('libvirt_domain_snapshot_ttl',
+                     5,
+                     'Seconds the power state sync and the host stats reuse '
+                     'a sweep over the running domains, 0 to sweep every '
+                     'time')
+
+# NOTE: how often the wait loops poll the domain state when events are
+#       delivered, in case one is missed.
+EVENT_POLL_INTERVAL = 5
 
 
 def get_connection(read_only):
@@ -169,11 +192,7 @@ def get_connection(read_only):
 
 
 def _late_load_cheetah():
-    global Template
-    if Template is None:
-        t = __import__('Cheetah.Template', globals(), locals(),
-                       ['Template'], -1)
-        Template = t.Template
+    templates.load_cheetah()
 
 
 def _get_eph_disk(ephemeral):
@@ -186,10 +205,14 @@ class LibvirtConnection(driver.ComputeDriver):
         super(LibvirtConnection, self).__init__()
         self.libvirt_uri = self.get_uri()
 
-        self.libvirt_xml = open(FLAGS.libvirt_xml_template).read()
-        self.cpuinfo_xml = open(FLAGS.cpuinfo_xml_template).read()
         self._host_state = None
         self._wrapped_conn = None
+        self._conn_checked_at = 0
+        self._events = None
+        # NOTE: host facts that do not change while connected.
+        self._host_info = {}
+        # (time taken, domains) of the last sweep over the domains
+        self._domain_snapshot = None
         self.read_only = read_only
 
         fw_class = utils.import_class(FLAGS.firewall_driver)
@@ -201,6 +224,7 @@ class LibvirtConnection(driver.ComputeDriver):
             driver_class = utils.import_class(driver)
             self.volume_drivers[driver_type] = driver_class(self)
         self._host_state = None
+        self.image_cache = imagecache.ImageCacheManager()
 
         disk_prefix_map = {"lxc": "", "uml": "ubd", "xen": "sd"}
         if FLAGS.libvirt_disk_prefix:
@@ -214,7 +238,7 @@ class LibvirtConnection(driver.ComputeDriver):
     @property
     def host_state(self):
         if not self._host_state:
-            self._host_state = HostState(self.read_only)
+            self._host_state = HostState(self.read_only, self)
         return self._host_state
 
     def init_host(self, host):
@@ -226,20 +250,100 @@ class LibvirtConnection(driver.ComputeDriver):
             LOG.debug(_('Connecting to libvirt: %s'), self.libvirt_uri)
             self._wrapped_conn = self._connect(self.libvirt_uri,
                                                self.read_only)
+            self._conn_checked_at = time.time()
+            self._host_info = {}
+            self._domain_snapshot = None
+            if self._events is not None:
+                self._wrapped_conn.domainEventRegisterAny(None,
+                        libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                        self._lifecycle_event, None)
         return self._wrapped_conn
     _conn = property(_get_connection)
 
     def _test_connection(self):
+        now = time.time()
+        if now - self._conn_checked_at < \
+           FLAGS.libvirt_connection_check_interval:
+            return True
         try:
             self._wrapped_conn.getCapabilities()
+            self._conn_checked_at = now
             return True
         except libvirt.libvirtError as e:
-            if e.get_error_code() == libvirt.VIR_ERR_SYSTEM_ERROR and \
-               e.get_error_domain() == libvirt.VIR_FROM_REMOTE:
+            if self._is_connection_error(e):
                 LOG.debug(_('Connection to libvirt broke'))
                 return False
             raise
 
+    def _is_connection_error(self, e):
+        """Returns True for errors caused by a broken connection.
+
+        The connection is then checked again the next time it is used.
+        """
+        if e.get_error_code() == libvirt.VIR_ERR_SYSTEM_ERROR and \
+           e.get_error_domain() == libvirt.VIR_FROM_REMOTE:
+            self._conn_checked_at = 0
+            return True
+        return False
+
+    def register_event_listener(self, callback):
+        """Calls callback(instance_name, power_state) on lifecycle events."""
+        if not FLAGS.libvirt_domain_events:
+            return False
+        if self._events is None:
+            events.start_event_loop(libvirt)
+            self._events = events.DomainEventMonitor()
+            self._events.start()
+            # NOTE: only connections opened after the event loop was
+            #       registered deliver events.
+            self._wrapped_conn = None
+        self._events.add_listener(callback)
+        return True
+
+    def _lifecycle_event(self, conn, dom, event_id, detail, opaque):
+        """Called by libvirt, from its event loop thread."""
+        state = {libvirt.VIR_DOMAIN_EVENT_STARTED: power_state.RUNNING,
+                 libvirt.VIR_DOMAIN_EVENT_RESUMED: power_state.RUNNING,
+                 libvirt.VIR_DOMAIN_EVENT_SUSPENDED: power_state.PAUSED,
+                 libvirt.VIR_DOMAIN_EVENT_STOPPED: power_state.SHUTOFF,
+                 libvirt.VIR_DOMAIN_EVENT_UNDEFINED: power_state.NOSTATE,
+                 }.get(event_id)
+        if state is not None:
+            self._domain_snapshot = None
+            self._events.queue_event(dom.name(), state)
+
+    def _wait_for_domain(self, instance_name, f):
+        """Calls f until it raises utils.LoopingCallDone.
+
+        f is called again whenever there is an event for the domain, or
+        every half a second if events are not delivered.
+        """
+        if self._events is None:
+            timer = utils.LoopingCall(f)
+            return timer.start(interval=0.5, now=True)
+
+        done = event.Event()
+
+        def _inner():
+            try:
+                while True:
+                    waiter = self._events.watch(instance_name)
+                    try:
+                        f()
+                    except Exception:
+                        self._events.unwatch(instance_name, waiter)
+                        raise
+                    self._events.wait(instance_name, waiter,
+                                      EVENT_POLL_INTERVAL)
+            except utils.LoopingCallDone, e:
+                done.send(e.retvalue)
+            except Exception:
+                LOG.exception(_('in domain wait loop'))
+                done.send_exception(*sys.exc_info())
+
+        greenthread.spawn(_inner)
+        return done
+
     def get_uri(self):
         if FLAGS.libvirt_type == 'uml':
             uri = FLAGS.libvirt_uri or 'uml:///system'
@@ -257,16 +361,30 @@ class LibvirtConnection(driver.ComputeDriver):
                 None]
 
         if read_only:
-            return libvirt.openReadOnly(uri)
+            open_conn = functools.partial(libvirt.openReadOnly, uri)
         else:
-            return libvirt.openAuth(uri, auth, 0)
-
-    def list_instances(self):
-        return [self._conn.lookupByID(x).name()
-                for x in self._conn.listDomainsID()]
-
-    def _map_to_instance_info(self, domain):
-        """Gets info from a virsh domain object into an InstanceInfo"""
+            open_conn = functools.partial(libvirt.openAuth, uri, auth, 0)
+
+        if not FLAGS.libvirt_nonblocking:
+            return open_conn()
+        # NOTE: domains looked up through the proxy are proxied too, so
+        #       none of the libvirt calls block the hub.
+        return tpool.Proxy(tpool.execute(open_conn),
+                           autowrap=(libvirt.virConnect, libvirt.virDomain))
+
+    def _get_domain_snapshot(self, max_age=0):
+        """Returns the name and info() of every running domain.
+
+        Every domain is looked up once; callers that need several
+        figures about the domains should share a single snapshot.  A
+        sweep taken less than max_age seconds ago is reused, unless this
+        driver or a domain event changed a domain since.
+        """
+        if max_age and self._domain_snapshot is not None:
+            taken_at, domains = self._domain_snapshot
+            if time.time() - taken_at < max_age:
+                return domains
+        taken_at = time.time()
 
         # domain.info() returns a list of:
         #    state:       one of the state values (virDomainState)
@@ -275,18 +393,38 @@ class LibvirtConnection(driver.ComputeDriver):
         #    nbVirtCPU:   the number of virtual CPU
         #    puTime:      the time used by the domain in nanoseconds
 
-        (state, _max_mem, _mem, _num_cpu, _cpu_time) = domain.info()
-        name = domain.name()
+        domains = []
+        for domain_id in self._conn.listDomainsID():
+            try:
+                domain = self._conn.lookupByID(domain_id)
+                (state, max_mem, mem, num_cpu, cpu_time) = domain.info()
+                name = domain.name()
+            except libvirt.libvirtError as e:
+                # NOTE: the domain went away after it was listed.
+                if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                    continue
+                raise
+            domains.append({'id': domain_id,
+                            'name': name,
+                            'state': state,
+                            'max_mem': max_mem,
+                            'mem': mem,
+                            'num_cpu': num_cpu,
+                            'cpu_time': cpu_time})
+        self._domain_snapshot = (taken_at, domains)
+        return domains
+
+    def _get_shared_domain_snapshot(self):
+        """Returns a domain snapshot the periodic tasks may share."""
+        return self._get_domain_snapshot(
+                max_age=FLAGS.libvirt_domain_snapshot_ttl)
 
-        return driver.InstanceInfo(name, state)
+    def list_instances(self):
+        return [domain['name'] for domain in self._get_domain_snapshot()]
 
     def list_instances_detail(self):
-        infos = []
-        for domain_id in self._conn.listDomainsID():
-            domain = self._conn.lookupByID(domain_id)
-            info = self._map_to_instance_info(domain)
-            infos.append(info)
-        return infos
+        return [driver.InstanceInfo(domain['name'], domain['state'])
+                for domain in self._get_shared_domain_snapshot()]
 
     def plug_vifs(self, instance, network_info):
         """Plugin VIFs into networks."""
@@ -305,6 +443,7 @@ class LibvirtConnection(driver.ComputeDriver):
         # If the instance is already terminated, we're still happy
         # Otherwise, destroy it
         if virt_dom is not None:
+            self._domain_snapshot = None
             try:
                 virt_dom.destroy()
             except libvirt.libvirtError as e:
@@ -363,8 +502,7 @@ class LibvirtConnection(driver.ComputeDriver):
                 LOG.info(msg)
                 raise utils.LoopingCallDone
 
-        timer = utils.LoopingCall(_wait_for_destroy)
-        timer.start(interval=0.5, now=True)
+        self._wait_for_domain(instance['name'], _wait_for_destroy)
 
         self.firewall_driver.unfilter_instance(instance,
                                                network_info=network_info)
@@ -566,31 +704,34 @@ class LibvirtConnection(driver.ComputeDriver):
                 LOG.info(msg)
                 raise utils.LoopingCallDone
 
-        timer = utils.LoopingCall(_wait_for_reboot)
-        return timer.start(interval=0.5, now=True)
+        return self._wait_for_domain(instance['name'], _wait_for_reboot)
 
     @exception.wrap_exception()
     def pause(self, instance):
         """Pause VM instance"""
         dom = self._lookup_by_name(instance.name)
+        self._domain_snapshot = None
         dom.suspend()
 
     @exception.wrap_exception()
     def unpause(self, instance):
         """Unpause paused VM instance"""
         dom = self._lookup_by_name(instance.name)
+        self._domain_snapshot = None
         dom.resume()
 
     @exception.wrap_exception()
     def suspend(self, instance):
         """Suspend the specified instance"""
         dom = self._lookup_by_name(instance.name)
+        self._domain_snapshot = None
         dom.managedSave(0)
 
     @exception.wrap_exception()
     def resume(self, instance):
         """resume the specified instance"""
         dom = self._lookup_by_name(instance.name)
+        self._domain_snapshot = None
         dom.create()
 
     @exception.wrap_exception()
@@ -680,8 +821,7 @@ class LibvirtConnection(driver.ComputeDriver):
                 LOG.info(msg)
                 raise utils.LoopingCallDone
 
-        timer = utils.LoopingCall(_wait_for_boot)
-        return timer.start(interval=0.5, now=True)
+        return self._wait_for_domain(instance['name'], _wait_for_boot)
 
     def _flush_xen_console(self, virsh_output):
         LOG.info(_('virsh said: %r'), virsh_output)
@@ -769,8 +909,7 @@ class LibvirtConnection(driver.ComputeDriver):
 
         return {'token': token, 'host': host, 'port': port}
 
-    @staticmethod
-    def _cache_image(fn, target, fname, cow=False, *args, **kwargs):
+    def _cache_image(self, fn, target, fname, cow=False, *args, **kwargs):
         """Wrapper for a method that creates an image that caches the image.
 
         This wrapper will save the image into a common store and create a
@@ -786,23 +925,57 @@ class LibvirtConnection(driver.ComputeDriver):
         """
 
         if not os.path.exists(target):
-            base_dir = os.path.join(FLAGS.instances_path, '_base')
-            if not os.path.exists(base_dir):
-                libvirt_utils.ensure_tree(base_dir)
-            base = os.path.join(base_dir, fname)
-
-            @utils.synchronized(fname)
-            def call_if_not_exists(base, fn, *args, **kwargs):
-                if not os.path.exists(base):
-                    fn(target=base, *args, **kwargs)
-
-            call_if_not_exists(base, fn, *args, **kwargs)
+            base = self.image_cache.fetch(fname, fn, *args, **kwargs)
 
             if cow:
                 libvirt_utils.create_cow_image(base, target)
+                self.image_cache.add_disk(target, fname)
             else:
                 libvirt_utils.copy_image(base, target)
 
+    def _get_root_image(self, inst_type, image_id, rescue=False):
+        """Returns the base file name and size of an instance's root disk."""
+        small = inst_type['name'] == 'm1.tiny' or rescue
+        size = None if small else FLAGS.minimum_root_size
+        return imagecache.get_root_fname(image_id, small), size
+
+    def prefetch_image(self, context, instance, image_meta):
+        """Fetches the base images of an instance into the image cache.
+
+        spawn() takes the same per-file locks, so it waits for a fetch
+        still in progress rather than starting another one.
+        """
+        images = []
+        if instance['kernel_id']:
+            images.append((instance['kernel_id'], instance['kernel_id'],
+                           None))
+            if instance['ramdisk_id']:
+                images.append((instance['ramdisk_id'],
+                               instance['ramdisk_id'], None))
+        if instance['image_ref']:
+            inst_type = instance_types.get_instance_type(
+                    instance['instance_type_id'])
+            root_fname, size = self._get_root_image(inst_type,
+                                                    instance['image_ref'])
+            images.append((instance['image_ref'], root_fname, size))
+        for image_id, fname, size in images:
+            self.image_cache.fetch(fname, libvirt_utils.fetch_image,
+                                   context=context,
+                                   image_id=image_id,
+                                   user_id=instance['user_id'],
+                                   project_id=instance['project_id'],
+                                   size=size)
+
+    def manage_image_cache(self, context):
+        """Prewarms popular images and evicts stale base images."""
+        self.image_cache.prewarm(context)
+        self.image_cache.evict()
+        LOG.debug(_('Base image cache: %s'), self.image_cache.stats())
+
+    def get_image_cache_stats(self):
+        """Returns the hit, miss and eviction counts of the image cache."""
+        return self.image_cache.stats()
+
     def _fetch_image(self, context, target, image_id, user_id, project_id,
                      size=None):
         """Grab image and optionally attempt to resize it"""
@@ -879,14 +1052,11 @@ class LibvirtConnection(driver.ComputeDriver):
                                   user_id=inst['user_id'],
                                   project_id=inst['project_id'])
 
-        root_fname = hashlib.sha1(str(disk_images['image_id'])).hexdigest()
-        size = FLAGS.minimum_root_size
-
         inst_type_id = inst['instance_type_id']
         inst_type = instance_types.get_instance_type(inst_type_id)
-        if inst_type['name'] == 'm1.tiny' or suffix == '.rescue':
-            size = None
-            root_fname += "_sm"
+        root_fname, size = self._get_root_image(inst_type,
+                                                disk_images['image_id'],
+                                                rescue=suffix == '.rescue')
 
         if not self._volume_in_mapping(self.default_root_device,
                                        block_device_info):
@@ -973,7 +1143,6 @@ class LibvirtConnection(driver.ComputeDriver):
         net = None
 
         nets = []
-        ifc_template = open(FLAGS.injected_network_template).read()
         ifc_num = -1
         have_injected_networks = False
         admin_context = nova_context.get_admin_context()
@@ -1005,9 +1174,9 @@ class LibvirtConnection(driver.ComputeDriver):
             nets.append(net_info)
 
         if have_injected_networks:
-            net = str(Template(ifc_template,
-                               searchList=[{'interfaces': nets,
-                                            'use_ipv6': FLAGS.use_ipv6}]))
+            net = templates.render(FLAGS.injected_network_template,
+                                   [{'interfaces': nets,
+                                     'use_ipv6': FLAGS.use_ipv6}])
 
         metadata = inst.get('metadata')
         if any((key, net, metadata)):
@@ -1173,11 +1342,10 @@ class LibvirtConnection(driver.ComputeDriver):
 
     def to_xml(self, instance, network_info, rescue=False,
                block_device_info=None):
-        # TODO(termie): cache?
         LOG.debug(_('instance %s: starting toXML method'), instance['name'])
         xml_info = self._prepare_xml_info(instance, network_info, rescue,
                                           block_device_info)
-        xml = str(Template(self.libvirt_xml, searchList=[xml_info]))
+        xml = templates.render(FLAGS.libvirt_xml_template, [xml_info])
         LOG.debug(_('instance %s: finished toXML method'), instance['name'])
         return xml
 
@@ -1194,6 +1362,7 @@ class LibvirtConnection(driver.ComputeDriver):
             error_code = ex.get_error_code()
             if error_code == libvirt.VIR_ERR_NO_DOMAIN:
                 raise exception.InstanceNotFound(instance_id=instance_name)
+            self._is_connection_error(ex)
 
             msg = _("Error from libvirt while looking up %(instance_name)s: "
                     "[Error Code %(error_code)s] %(ex)s") % locals()
@@ -1222,6 +1391,7 @@ class LibvirtConnection(driver.ComputeDriver):
         # * a permanent domain is not automatically deleted
         # NOTE(justinsb): Even for ephemeral instances, transient seems risky
 
+        self._domain_snapshot = None
         if persistent:
             # To create a persistent domain, first define it, then launch it.
             domain = self._conn.defineXML(xml)
@@ -1325,10 +1495,12 @@ class LibvirtConnection(driver.ComputeDriver):
         if sys.platform.upper() != 'LINUX2':
             return 0
 
-        meminfo = open('/proc/meminfo').read().split()
-        idx = meminfo.index('MemTotal:')
-        # transforming kb to mb.
-        return int(meminfo[idx + 1]) / 1024
+        if 'memory_mb' not in self._host_info:
+            meminfo = open('/proc/meminfo').read().split()
+            idx = meminfo.index('MemTotal:')
+            # transforming kb to mb.
+            self._host_info['memory_mb'] = int(meminfo[idx + 1]) / 1024
+        return self._host_info['memory_mb']
 
     def get_local_gb_total(self):
         """Get the total hdd size(GB) of physical computer.
@@ -1350,11 +1522,8 @@ class LibvirtConnection(driver.ComputeDriver):
 
         """
 
-        total = 0
-        for dom_id in self._conn.listDomainsID():
-            dom = self._conn.lookupByID(dom_id)
-            total += len(dom.vcpus()[1])
-        return total
+        return sum(domain['num_cpu']
+                   for domain in self._get_shared_domain_snapshot())
 
     def get_memory_mb_used(self):
         """Get the free memory size(MB) of physical computer.
@@ -1393,7 +1562,9 @@ class LibvirtConnection(driver.ComputeDriver):
 
         """
 
-        return self._conn.getType()
+        if 'hypervisor_type' not in self._host_info:
+            self._host_info['hypervisor_type'] = self._conn.getType()
+        return self._host_info['hypervisor_type']
 
     def get_hypervisor_version(self):
         """Get hypervisor version.
@@ -1405,6 +1576,9 @@ class LibvirtConnection(driver.ComputeDriver):
         # NOTE(justinsb): getVersion moved between libvirt versions
         # Trying to do be compatible with older versions is a lost cause
         # But ... we can at least give the user a nice message
+        if 'hypervisor_version' in self._host_info:
+            return self._host_info['hypervisor_version']
+
         method = getattr(self._conn, 'getVersion', None)
         if method is None:
             raise exception.Error(_("libvirt version is too old"
@@ -1413,7 +1587,8 @@ class LibvirtConnection(driver.ComputeDriver):
             # method = getattr(libvirt, 'getVersion', None)
             # NOTE(justinsb): This would then rely on a proper version check
 
-        return method()
+        self._host_info['hypervisor_version'] = method()
+        return self._host_info['hypervisor_version']
 
     def get_cpu_info(self):
         """Get cpuinfo information.
@@ -1425,6 +1600,11 @@ class LibvirtConnection(driver.ComputeDriver):
 
         """
 
+        if 'cpu_info' not in self._host_info:
+            self._host_info['cpu_info'] = self._parse_cpu_info()
+        return self._host_info['cpu_info']
+
+    def _parse_cpu_info(self):
         xml = self._conn.getCapabilities()
         xml = ElementTree.fromstring(xml)
         nodes = xml.findall('.//host/cpu')
@@ -1518,15 +1698,7 @@ class LibvirtConnection(driver.ComputeDriver):
             raise exception.ComputeServiceUnavailable(host=host)
 
         # Updating host information
-        dic = {'vcpus': self.get_vcpu_total(),
-               'memory_mb': self.get_memory_mb_total(),
-               'local_gb': self.get_local_gb_total(),
-               'vcpus_used': self.get_vcpu_used(),
-               'memory_mb_used': self.get_memory_mb_used(),
-               'local_gb_used': self.get_local_gb_used(),
-               'hypervisor_type': self.get_hypervisor_type(),
-               'hypervisor_version': self.get_hypervisor_version(),
-               'cpu_info': self.get_cpu_info()}
+        dic = self.get_host_inventory()
 
         compute_node_ref = service_ref['compute_node']
         if not compute_node_ref:
@@ -1537,6 +1709,25 @@ class LibvirtConnection(driver.ComputeDriver):
             LOG.info(_('Compute_service record updated for %s ') % host)
             db.compute_node_update(ctxt, compute_node_ref[0]['id'], dic)
 
+    def get_host_inventory(self):
+        """Returns the resources of the host and how much of them is used.
+
+        The domains are only walked once, and shared with the power state
+        sync for libvirt_domain_snapshot_ttl seconds.  The facts about the
+        host that cannot change while connected are only asked for once.
+        """
+        domains = self._get_shared_domain_snapshot()
+        fs_info = libvirt_utils.get_fs_info(FLAGS.instances_path)
+        return {'vcpus': self.get_vcpu_total(),
+                'memory_mb': self.get_memory_mb_total(),
+                'local_gb': fs_info['total'] / (1024 ** 3),
+                'vcpus_used': sum(domain['num_cpu'] for domain in domains),
+                'memory_mb_used': self.get_memory_mb_used(),
+                'local_gb_used': fs_info['used'] / (1024 ** 3),
+                'hypervisor_type': self.get_hypervisor_type(),
+                'hypervisor_version': self.get_hypervisor_version(),
+                'cpu_info': self.get_cpu_info()}
+
     def compare_cpu(self, cpu_info):
         """Checks the host cpu is compatible to a cpu given by xml.
 
@@ -1554,7 +1745,7 @@ class LibvirtConnection(driver.ComputeDriver):
 
         LOG.info(_('Instance launched has CPU info:\n%s') % cpu_info)
         dic = utils.loads(cpu_info)
-        xml = str(Template(self.cpuinfo_xml, searchList=dic))
+        xml = templates.render(FLAGS.cpuinfo_xml_template, [dic])
         LOG.info(_('to xml...\n:%s ' % xml))
 
         u = "http://libvirt.org/html/libvirt-libvirt.html#virCPUCompareResult"
@@ -1892,11 +2083,11 @@ class LibvirtConnection(driver.ComputeDriver):
 
 class HostState(object):
     """Manages information about the compute node through libvirt"""
-    def __init__(self, read_only):
+    def __init__(self, read_only, connection=None):
         super(HostState, self).__init__()
         self.read_only = read_only
         self._stats = {}
-        self.connection = None
+        self.connection = connection
         self.update_status()
 
     def get_host_stats(self, refresh=False):
@@ -1912,18 +2103,19 @@ class HostState(object):
         LOG.debug(_("Updating host stats"))
         if self.connection is None:
             self.connection = get_connection(self.read_only)
+        inventory = self.connection.get_host_inventory()
         data = {}
-        data["vcpus"] = self.connection.get_vcpu_total()
-        data["vcpus_used"] = self.connection.get_vcpu_used()
-        data["cpu_info"] = utils.loads(self.connection.get_cpu_info())
-        data["disk_total"] = self.connection.get_local_gb_total()
-        data["disk_used"] = self.connection.get_local_gb_used()
+        data["vcpus"] = inventory['vcpus']
+        data["vcpus_used"] = inventory['vcpus_used']
+        data["cpu_info"] = utils.loads(inventory['cpu_info'])
+        data["disk_total"] = inventory['local_gb']
+        data["disk_used"] = inventory['local_gb_used']
         data["disk_available"] = data["disk_total"] - data["disk_used"]
-        data["host_memory_total"] = self.connection.get_memory_mb_total()
+        data["host_memory_total"] = inventory['memory_mb']
         data["host_memory_free"] = data["host_memory_total"] - \
-            self.connection.get_memory_mb_used()
-        data["hypervisor_type"] = self.connection.get_hypervisor_type()
-        data["hypervisor_version"] = self.connection.get_hypervisor_version()
+            inventory['memory_mb_used']
+        data["hypervisor_type"] = inventory['hypervisor_type']
+        data["hypervisor_version"] = inventory['hypervisor_version']
 
         self._stats = data
 
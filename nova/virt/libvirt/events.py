@@ -0,0 +1,141 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Delivery of libvirt domain lifecycle events to greenthreads.
+
+libvirt runs event callbacks from its event loop, which needs a native
+thread of its own.  The callbacks only queue the event and write a byte to
+a pipe; a greenthread reading the other end of the pipe wakes up whatever
+is waiting on the domain and passes the event on to the listeners.
+"""
+
+import os
+
+import eventlet
+from eventlet import event
+from eventlet import greenio
+from eventlet import greenthread
+from eventlet import patcher
+
+from nova import log as logging
+
+
+LOG = logging.getLogger('nova.virt.libvirt.events')
+
+native_threading = patcher.original('threading')
+native_Queue = patcher.original('Queue')
+
+_event_loop = None
+
+
+def start_event_loop(libvirt):
+    """Registers libvirt's default event loop and runs it in a thread.
+
+    This has to be done before opening the connections events are wanted
+    for, and only once per process.
+    """
+    global _event_loop
+    if _event_loop is not None:
+        return
+    libvirt.virEventRegisterDefaultImpl()
+    _event_loop = native_threading.Thread(target=_run_event_loop,
+                                          args=(libvirt,),
+                                          name='libvirt-events')
+    _event_loop.setDaemon(True)
+    _event_loop.start()
+
+
+def _run_event_loop(libvirt):
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
+
+class DomainEventMonitor(object):
+    """Hands the power state changes of domains over to greenthreads."""
+
+    def __init__(self):
+        self._queue = native_Queue.Queue()
+        rpipe, self._wpipe = os.pipe()
+        self._rpipe = greenio.GreenPipe(rpipe, 'rb', 0)
+        self._waiters = {}
+        self._listeners = []
+        self._dispatcher = None
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = greenthread.spawn(self._dispatch_events)
+
+    def add_listener(self, callback):
+        """Calls callback(domain_name, power_state) on every event."""
+        self._listeners.append(callback)
+
+    def queue_event(self, domain_name, state):
+        """Queues an event.  Safe to call from a native thread."""
+        self._queue.put((domain_name, state))
+        os.write(self._wpipe, ' ')
+
+    def _dispatch_events(self):
+        while True:
+            self._rpipe.read(1)
+            while True:
+                try:
+                    domain_name, state = self._queue.get(block=False)
+                except native_Queue.Empty:
+                    break
+                self._dispatch(domain_name, state)
+
+    def _dispatch(self, domain_name, state):
+        for waiter in self._waiters.pop(domain_name, []):
+            waiter.send(state)
+        for listener in self._listeners:
+            greenthread.spawn_n(self._notify, listener, domain_name, state)
+
+    def _notify(self, listener, domain_name, state):
+        try:
+            listener(domain_name, state)
+        except Exception:
+            LOG.exception(_('Error handling the event of domain %s'),
+                          domain_name)
+
+    def watch(self, domain_name):
+        """Returns an event sent the new state on the next domain event.
+
+        Start watching before checking the state of the domain, so an
+        event coming in between is not missed.
+        """
+        waiter = event.Event()
+        self._waiters.setdefault(domain_name, []).append(waiter)
+        return waiter
+
+    def wait(self, domain_name, waiter, timeout):
+        """Waits up to timeout seconds for the event being watched.
+
+        Returns the new power state, or None if there was no event.
+        """
+        with eventlet.Timeout(timeout, False):
+            return waiter.wait()
+        self.unwatch(domain_name, waiter)
+        return None
+
+    def unwatch(self, domain_name, waiter):
+        """Stops watching the domain."""
+        waiters = self._waiters.get(domain_name, [])
+        if waiter in waiters:
+            waiters.remove(waiter)
+        if not waiters:
+            self._waiters.pop(domain_name, None)
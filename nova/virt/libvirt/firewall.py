@@ -18,10 +18,13 @@
 #    under the License.
 
 
+import re
+
 from eventlet import tpool
 
 from nova import context
 from nova import db
+from nova import exception
 from nova import flags
 from nova import log as logging
 from nova import utils
@@ -147,6 +150,9 @@ class NWFilterFirewall(FirewallDriver):
         self._libvirt_get_connection = get_connection
         self.static_filters_configured = False
         self.handle_security_groups = False
+        # NOTE: the XML last defined for each filter, so filters that
+        #       did not change are not defined again on every spawn.
+        self._defined_filters = {}
 
     def apply_instance_filter(self, instance, network_info):
         """No-op. Everything is done in prepare_instance_filter"""
@@ -292,8 +298,21 @@ class NWFilterFirewall(FirewallDriver):
     def _define_filter(self, xml):
         if callable(xml):
             xml = xml()
-        # execute in a native thread and block current greenthread until done
-        tpool.execute(self._conn.nwfilterDefineXML, xml)
+        match = re.match("\\s*<filter name='([^']+)'", xml)
+        name = match and match.group(1)
+        if name and self._defined_filters.get(name) == xml:
+            return
+        conn = self._conn
+        if isinstance(conn, tpool.Proxy):
+            # NOTE: the proxy already makes the call in a native thread,
+            #       going through tpool.execute again deadlocks.
+            conn.nwfilterDefineXML(xml)
+        else:
+            # execute in a native thread and block current greenthread
+            # until done
+            tpool.execute(conn.nwfilterDefineXML, xml)
+        if name:
+            self._defined_filters[name] = xml
 
     def unfilter_instance(self, instance, network_info):
         """Clear out the nwfilter rules."""
@@ -301,6 +320,7 @@ class NWFilterFirewall(FirewallDriver):
         for (network, mapping) in network_info:
             nic_id = mapping['mac'].replace(':', '')
             instance_filter_name = self._instance_filter_name(instance, nic_id)
+            self._defined_filters.pop(instance_filter_name, None)
 
             try:
                 self._conn.nwfilterLookupByName(instance_filter_name).\
@@ -311,6 +331,7 @@ class NWFilterFirewall(FirewallDriver):
 
         instance_secgroup_filter_name =\
             '%s-secgroup' % (self._instance_filter_name(instance))
+        self._defined_filters.pop(instance_secgroup_filter_name, None)
 
         try:
             self._conn.nwfilterLookupByName(instance_secgroup_filter_name)\
@@ -509,6 +530,8 @@ class IptablesFirewallDriver(FirewallDriver):
         self.iptables = linux_net.iptables_manager
         self.instances = {}
         self.network_infos = {}
+        # instance id -> ids of the security groups its chain was built from
+        self.instance_group_ids = {}
         self.nwfilter = NWFilterFirewall(kwargs['get_connection'])
         self.basicly_filtered = False
 
@@ -533,6 +556,7 @@ class IptablesFirewallDriver(FirewallDriver):
         if self.instances.pop(instance['id'], None):
             # NOTE(vish): use the passed info instead of the stored info
             self.network_infos.pop(instance['id'])
+            self.instance_group_ids.pop(instance['id'], None)
             self.remove_filters_for_instance(instance)
             self.iptables.apply()
             self.nwfilter.unfilter_instance(instance, network_info)
@@ -591,6 +615,8 @@ class IptablesFirewallDriver(FirewallDriver):
 
     def instance_rules(self, instance, network_info):
         ctxt = context.get_admin_context()
+        instance_id = instance['id']
+        group_ids = set()
 
         ipv4_rules = []
         ipv6_rules = []
@@ -643,6 +669,7 @@ class IptablesFirewallDriver(FirewallDriver):
 
         # then, security group chains and rules
         for security_group in security_groups:
+            group_ids.add(security_group['id'])
             rules = db.security_group_rule_get_by_security_group(ctxt,
                                                           security_group['id'])
 
@@ -699,6 +726,7 @@ class IptablesFirewallDriver(FirewallDriver):
                     fw_rules += [' '.join(args)]
                 else:
                     if rule['grantee_group']:
+                        group_ids.add(rule['grantee_group']['id'])
                         for instance in rule['grantee_group']['instances']:
                             LOG.info('instance: %r', instance)
                             ips = db.instance_get_fixed_addresses(ctxt,
@@ -712,6 +740,7 @@ class IptablesFirewallDriver(FirewallDriver):
         ipv4_rules += ['-j $sg-fallback']
         ipv6_rules += ['-j $sg-fallback']
 
+        self.instance_group_ids[instance_id] = group_ids
         return ipv4_rules, ipv6_rules
 
     def instance_filter_exists(self, instance, network_info):
@@ -728,9 +757,52 @@ class IptablesFirewallDriver(FirewallDriver):
 
     @utils.synchronized('iptables', external=True)
     def do_refresh_security_group_rules(self, security_group):
-        for instance in self.instances.values():
-            self.remove_filters_for_instance(instance)
-            self.add_filters_for_instance(instance)
+        for instance in self._instances_for_security_group(security_group):
+            self.refresh_instance_chain(instance)
+
+    def _instances_for_security_group(self, security_group_id):
+        """Return the filtered instances whose rules depend on a group.
+
+        These are the members of the group and the members of the groups
+        with rules granting access to it.  Instances whose chains were
+        built from the group are included too, so an instance that just
+        left the group loses its rules.
+
+        """
+        ctxt = context.get_admin_context()
+        rules = db.security_group_rule_get_by_security_group_grantee(
+                ctxt, security_group_id)
+        group_ids = set([security_group_id])
+        group_ids.update([rule['parent_group_id'] for rule in rules])
+
+        instance_ids = set()
+        for group_id in group_ids:
+            try:
+                group = db.security_group_get(ctxt, group_id)
+            except exception.NotFound:
+                # The group is gone, so we can't tell who was in it
+                return self.instances.values()
+            instance_ids.update([i['id'] for i in group['instances']])
+
+        return [instance for instance_id, instance in self.instances.items()
+                if instance_id in instance_ids or
+                security_group_id in self.instance_group_ids.get(instance_id,
+                                                                 ())]
+
+    def refresh_instance_chain(self, instance):
+        """Rebuild the rules of an instance's chain in place.
+
+        The jumps to the chain from the local chain only depend on the
+        instance's addresses, so they are left alone.
+
+        """
+        network_info = self.network_infos[instance['id']]
+        chain_name = self._instance_chain_name(instance)
+        ipv4_rules, ipv6_rules = self.instance_rules(instance, network_info)
+        self.iptables.ipv4['filter'].empty_chain(chain_name)
+        if FLAGS.use_ipv6:
+            self.iptables.ipv6['filter'].empty_chain(chain_name)
+        self._add_filters(chain_name, ipv4_rules, ipv6_rules)
 
     def refresh_provider_fw_rules(self):
         """See class:FirewallDriver: docs."""
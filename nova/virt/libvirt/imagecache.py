@@ -0,0 +1,253 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Management of the base images cached in instances_path/_base.
+
+Base files are only ever removed when they are not the backing file of
+any instance disk in instances_path, have not been used for at least
+image_cache_min_age seconds and the cache is over image_cache_size_gb.
+The least recently used ones go first.  The images listed in
+image_cache_prewarm are fetched ahead of the first boot that needs them
+and are never evicted.
+"""
+
+import hashlib
+import os
+import time
+
+from eventlet import greenthread
+
+from nova import flags
+from nova import log as logging
+from nova import utils
+from nova.virt.libvirt import utils as libvirt_utils
+
+
+LOG = logging.getLogger('nova.virt.libvirt.imagecache')
+FLAGS = flags.FLAGS
+flags.DECLARE('minimum_root_size', 'nova.virt.disk')
+flags.DEFINE_integer('image_cache_size_gb', 0,
+                     'Size in GB that base images cached in '
+                     'instances_path/_base are evicted down to, 0 to keep '
+                     'them forever')
+flags.DEFINE_integer('image_cache_min_age', 3600,
+                     'Seconds a base image has to go unused before it can '
+                     'be evicted')
+flags.DEFINE_list('image_cache_prewarm', [],
+                  'Images to fetch into the base image cache before any '
+                  'instance needs them')
+
+# NOTE: files being written by images.fetch_to_raw.
+_PARTIAL_SUFFIXES = ('.part', '.converted')
+
+
+def get_base_dir():
+    return os.path.join(FLAGS.instances_path, '_base')
+
+
+def get_root_fname(image_id, small=False):
+    """Returns the name of the base file of a root disk image."""
+    fname = hashlib.sha1(str(image_id)).hexdigest()
+    if small:
+        fname += '_sm'
+    return fname
+
+
+class ImageCacheManager(object):
+    """Tracks the use of the base images and evicts stale ones."""
+
+    def __init__(self):
+        self.counters = {'hits': 0,
+                         'misses': 0,
+                         'evictions': 0,
+                         'evicted_bytes': 0,
+                         'prewarmed': 0}
+        self.cached_files = 0
+        self.cached_bytes = 0
+        self.last_used = {}
+        # NOTE: maps instance disk paths to the base file backing them,
+        #       or None if they have no backing file.
+        self.disks = {}
+        self._prewarming = set()
+
+    def fetch(self, fname, fn, *args, **kwargs):
+        """Creates the base file fname with fn unless it is cached already.
+
+        Returns the path to the base file.
+        """
+        base_dir = get_base_dir()
+        if not os.path.exists(base_dir):
+            libvirt_utils.ensure_tree(base_dir)
+        base = os.path.join(base_dir, fname)
+
+        @utils.synchronized(fname)
+        def call_if_not_exists(base, fn, *args, **kwargs):
+            if os.path.exists(base):
+                self.counters['hits'] += 1
+            else:
+                self.counters['misses'] += 1
+                try:
+                    fn(target=base, *args, **kwargs)
+                except:
+                    # NOTE: a partial file would look cached, this also
+                    #       covers a prefetch killed by a failed spawn.
+                    with utils.save_and_reraise_exception():
+                        if os.path.exists(base):
+                            os.unlink(base)
+            self.last_used[fname] = time.time()
+
+        call_if_not_exists(base, fn, *args, **kwargs)
+        return base
+
+    def add_disk(self, path, fname):
+        """Records that the instance disk at path is backed by fname."""
+        self.disks[path] = fname
+
+    def _scan_disks(self):
+        """Finds the backing files of the disks not seen before."""
+        seen = set()
+        for entry in os.listdir(FLAGS.instances_path):
+            instance_dir = os.path.join(FLAGS.instances_path, entry)
+            if entry == '_base' or not os.path.isdir(instance_dir):
+                continue
+            for name in os.listdir(instance_dir):
+                if not name.startswith('disk'):
+                    continue
+                path = os.path.join(instance_dir, name)
+                seen.add(path)
+                if path in self.disks:
+                    continue
+                try:
+                    backing_file = libvirt_utils.get_disk_backing_file(path)
+                except Exception:
+                    backing_file = None
+                self.disks[path] = backing_file or None
+        for path in set(self.disks) - seen:
+            del self.disks[path]
+
+    def _list_base_files(self):
+        """Returns a list of (fname, size in bytes, last used) tuples."""
+        base_dir = get_base_dir()
+        files = []
+        for fname in os.listdir(base_dir):
+            try:
+                st = os.stat(os.path.join(base_dir, fname))
+            except OSError:
+                continue
+            last_used = max(self.last_used.get(fname, 0), st.st_mtime)
+            files.append((fname, st.st_blocks * 512, last_used))
+        return files
+
+    def _evict(self, fname, size):
+        base = os.path.join(get_base_dir(), fname)
+
+        @utils.synchronized(fname)
+        def remove_if_unused():
+            last_used = self.last_used.get(fname, 0)
+            if time.time() - last_used < FLAGS.image_cache_min_age:
+                return False
+            os.unlink(base)
+            return True
+
+        if not remove_if_unused():
+            return False
+        self.last_used.pop(fname, None)
+        self.counters['evictions'] += 1
+        self.counters['evicted_bytes'] += size
+        LOG.info(_('Evicted base image %(fname)s (%(mb)d MB)') %
+                 {'fname': fname, 'mb': size / (1024 * 1024)})
+        return True
+
+    def _pinned(self):
+        pinned = set()
+        for image_id in FLAGS.image_cache_prewarm:
+            pinned.add(get_root_fname(image_id))
+            pinned.add(get_root_fname(image_id, small=True))
+        return pinned
+
+    def evict(self):
+        """Evicts unused base files until the cache fits its budget."""
+        if not os.path.exists(get_base_dir()):
+            return
+        self._scan_disks()
+        files = self._list_base_files()
+        self.cached_files = len(files)
+        self.cached_bytes = sum(size for _fname, size, _used in files)
+
+        budget = FLAGS.image_cache_size_gb * 1024 * 1024 * 1024
+        if not budget or self.cached_bytes <= budget:
+            return
+
+        keep = set(self.disks.itervalues()) | self._pinned()
+        now = time.time()
+        candidates = [(last_used, fname, size)
+                      for fname, size, last_used in files
+                      if (fname not in keep and
+                          not fname.endswith(_PARTIAL_SUFFIXES) and
+                          now - last_used >= FLAGS.image_cache_min_age)]
+        for _last_used, fname, size in sorted(candidates):
+            if self.cached_bytes <= budget:
+                break
+            try:
+                if self._evict(fname, size):
+                    self.cached_files -= 1
+                    self.cached_bytes -= size
+            except OSError:
+                LOG.exception(_('Failed to evict base image %s'), fname)
+        if self.cached_bytes > budget:
+            LOG.warning(_('Base images use %(gb).1f GB, over the '
+                          'image_cache_size_gb of %(budget)d, but all of '
+                          'them are in use') %
+                        {'gb': float(self.cached_bytes) / (1024 ** 3),
+                         'budget': FLAGS.image_cache_size_gb})
+
+    def prewarm(self, context):
+        """Starts fetching the prewarm images that are not cached yet."""
+        for image_id in FLAGS.image_cache_prewarm:
+            fname = get_root_fname(image_id)
+            base = os.path.join(get_base_dir(), fname)
+            if fname in self._prewarming or os.path.exists(base):
+                continue
+            self._prewarming.add(fname)
+            greenthread.spawn(self._prewarm, context, image_id, fname)
+
+    def _prewarm(self, context, image_id, fname):
+        try:
+            LOG.info(_('Prewarming base image of %s'), image_id)
+            self.fetch(fname, libvirt_utils.fetch_image,
+                       context=context,
+                       image_id=image_id,
+                       user_id=context.user_id,
+                       project_id=context.project_id,
+                       size=FLAGS.minimum_root_size)
+            self.counters['prewarmed'] += 1
+        except Exception:
+            LOG.exception(_('Failed to prewarm base image of %s'), image_id)
+        finally:
+            self._prewarming.discard(fname)
+
+    def stats(self):
+        """Returns the hit, miss and eviction counts and the cache size."""
+        stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = lookups and float(stats['hits']) / lookups
+        stats['cached_files'] = self.cached_files
+        stats['cached_bytes'] = self.cached_bytes
+        stats['referenced'] = len(set(self.disks.itervalues()) - set([None]))
+        stats['prewarming'] = len(self._prewarming)
+        return stats
@@ -0,0 +1,72 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cheetah templates compiled once per template file.
+
+Building a Cheetah Template from source compiles the source to Python
+every time.  The template classes compiled here are kept until the file
+they came from is modified, so rendering only fills in the values.
+"""
+
+import os
+
+from nova import log as logging
+
+
+LOG = logging.getLogger('nova.virt.libvirt.templates')
+
+# NOTE: Cheetah is loaded late so it is only needed when rendering.
+Template = None
+
+# Maps template paths to ((mtime, size), compiled template class).
+_templates = {}
+
+
+def load_cheetah():
+    global Template
+    if Template is None:
+        t = __import__('Cheetah.Template', globals(), locals(),
+                       ['Template'], -1)
+        Template = t.Template
+
+
+def get_template(path):
+    """Returns the compiled template class for the file at path."""
+    st = os.stat(path)
+    version = (st.st_mtime, st.st_size)
+    cached = _templates.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    load_cheetah()
+    LOG.debug(_('Compiling template %s'), path)
+    with open(path) as template_file:
+        source = template_file.read()
+    template_class = Template.compile(source=source)
+    _templates[path] = (version, template_class)
+    return template_class
+
+
+def render(path, search_list):
+    """Renders the template file at path with the given search list."""
+    return str(get_template(path)(searchList=search_list))
+
+
+def clear():
+    """Forgets all compiled templates."""
+    _templates.clear()
@@ -21,6 +21,7 @@ Exception classes and SOAP response error checking module.
 
 FAULT_NOT_AUTHENTICATED = "NotAuthenticated"
 FAULT_ALREADY_EXISTS = "AlreadyExists"
+FAULT_INVALID_COLLECTOR_VERSION = "InvalidCollectorVersion"
 
 
 class VimException(Exception):
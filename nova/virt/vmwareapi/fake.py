@@ -34,6 +34,13 @@ _CLASSES = ['Datacenter', 'Datastore', 'ResourcePool', 'VirtualMachine',
 _FAKE_FILE_SIZE = 1024
 
 _db_content = {}
+_call_counts = {}
+
+# Changes to the managed objects, as (version, type, reference), for the
+# property collector to report to WaitForUpdatesEx callers
+_update_log = []
+_update_version = 0
+_oldest_update_version = 0
 
 LOG = logging.getLogger("nova.virt.vmwareapi.fake")
 
@@ -54,6 +61,8 @@ def reset():
             _db_content[c] = []
         else:
             _db_content[c] = {}
+    reset_call_counts()
+    _reset_updates()
     create_network()
     create_host_network_system()
     create_host()
@@ -68,9 +77,49 @@ def cleanup():
         _db_content[c] = {}
 
 
+def reset_call_counts():
+    """Resets the count of API calls made."""
+    _call_counts.clear()
+
+
+def call_count(methodname=None):
+    """Return the number of calls made to methodname, or of all calls."""
+    if methodname is None:
+        return sum(_call_counts.itervalues())
+    return _call_counts.get(methodname, 0)
+
+
+def _reset_updates():
+    """Clears the log of changes to the managed objects."""
+    global _update_version, _oldest_update_version
+    del _update_log[:]
+    _update_version = 0
+    _oldest_update_version = 0
+
+
+def _record_update(table, obj_ref):
+    """Records a change to a managed object."""
+    global _update_version
+    _update_version += 1
+    _update_log.append((_update_version, table, obj_ref))
+
+
+def expire_updates():
+    """
+    Forgets the changes recorded so far, as the property collector does
+    when it can no longer compute the changes since a version. Callers
+    waiting on an older version get InvalidCollectorVersion.
+    """
+    global _update_version, _oldest_update_version
+    del _update_log[:]
+    _update_version += 1
+    _oldest_update_version = _update_version
+
+
 def _create_object(table, table_obj):
     """Create an object in the db."""
     _db_content[table][table_obj.obj] = table_obj
+    _record_update(table, table_obj.obj)
 
 
 def _get_objects(obj_type):
@@ -459,6 +508,7 @@ class FakeVim(object):
         contents and the cookies for the session.
         """
         self._session = None
+        self._filters = {}
         self.client = DataObject()
         self.client.factory = FakeFactory()
 
@@ -583,6 +633,7 @@ class FakeVim(object):
         vm_ref = args[0]
         _get_vm_mdo(vm_ref)
         del _db_content["VirtualMachine"][vm_ref]
+        _record_update("VirtualMachine", vm_ref)
 
     def _search_ds(self, method, *args, **kwargs):
         """Searches the datastore for a file."""
@@ -613,6 +664,7 @@ class FakeVim(object):
                                        "there") % vm_ref)
         vm_mdo = _db_content.get("VirtualMachine").get(vm_ref)
         vm_mdo.set("runtime.powerState", pwr_state)
+        _record_update("VirtualMachine", vm_ref)
         task_mdo = create_task(method, "success")
         return task_mdo.obj
 
@@ -651,6 +703,74 @@ class FakeVim(object):
                 continue
         return lst_ret_objs
 
+    def _create_filter(self, method, *args, **kwargs):
+        """Creates a property collector filter for this session."""
+        filter_ref = str(uuid.uuid4())
+        self._filters[filter_ref] = kwargs.get("spec")
+        return filter_ref
+
+    def _destroy_filter(self, method, *args, **kwargs):
+        """Destroys a property collector filter."""
+        self._filters.pop(args[0], None)
+
+    def _wait_for_updates(self, method, *args, **kwargs):
+        """
+        Returns the changes to the objects selected by the filters of this
+        session since the version given, without waiting for any.
+        """
+        version = kwargs.get("version")
+        if version:
+            try:
+                version = int(version)
+            except ValueError:
+                version = -1
+            if version < _oldest_update_version:
+                raise error_util.VimFaultException(
+                        [error_util.FAULT_INVALID_COLLECTOR_VERSION],
+                        _("Invalid collector version"))
+            if version == _update_version:
+                return None
+            changed = [(table, obj_ref)
+                       for (obj_version, table, obj_ref) in _update_log
+                       if obj_version > version]
+        else:
+            changed = None
+        filter_set = []
+        for filter_ref, spec in self._filters.iteritems():
+            type = spec.propSet[0].type
+            properties = spec.propSet[0].pathSet
+            if changed is None:
+                obj_refs = _db_content[type].keys()
+            else:
+                obj_refs = set([obj_ref for (table, obj_ref) in changed
+                                if table == type])
+            object_set = []
+            for obj_ref in obj_refs:
+                object_update = DataObject()
+                object_update.obj = obj_ref
+                object_update.changeSet = []
+                mdo = _db_content[type].get(obj_ref)
+                if mdo is None:
+                    object_update.kind = "leave"
+                else:
+                    object_update.kind = "modify"
+                    for prop in properties:
+                        change = DataObject()
+                        change.name = prop
+                        change.op = "assign"
+                        change.val = mdo.get(prop)
+                        object_update.changeSet.append(change)
+                object_set.append(object_update)
+            filter_update = DataObject()
+            filter_update.filter = filter_ref
+            filter_update.objectSet = object_set
+            filter_set.append(filter_update)
+        update_set = DataObject()
+        update_set.version = str(_update_version)
+        update_set.filterSet = filter_set
+        update_set.truncated = False
+        return update_set
+
     def _add_port_group(self, method, *args, **kwargs):
         """Adds a port group to the host system."""
         host_mdo = \
@@ -658,6 +778,8 @@ class FakeVim(object):
         host_mdo._add_port_group(kwargs.get("portgrp"))
 
     def __getattr__(self, attr_name):
+        if not attr_name.startswith("_"):
+            _call_counts[attr_name] = _call_counts.get(attr_name, 0) + 1
         if attr_name != "Login":
             self._check_session()
         if attr_name == "Login":
@@ -713,6 +835,15 @@ class FakeVim(object):
         elif attr_name == "RetrieveProperties":
             return lambda *args, **kwargs: self._retrieve_properties(
                                                 attr_name, *args, **kwargs)
+        elif attr_name == "CreateFilter":
+            return lambda *args, **kwargs: self._create_filter(attr_name,
+                                                *args, **kwargs)
+        elif attr_name == "DestroyPropertyFilter":
+            return lambda *args, **kwargs: self._destroy_filter(attr_name,
+                                                *args, **kwargs)
+        elif attr_name == "WaitForUpdatesEx":
+            return lambda *args, **kwargs: self._wait_for_updates(attr_name,
+                                                *args, **kwargs)
         elif attr_name == "AcquireCloneTicket":
             return lambda *args, **kwargs: self._just_return()
         elif attr_name == "AddPortGroup":
@@ -0,0 +1,140 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache of the Virtual Machines registered with the ESX host.
+
+A PropertyCollector filter on the properties below is created once per
+session. Every lookup asks the collector for the changes made since the
+version last seen, which is normally an empty reply, instead of fetching
+the name of every VM on the host. The cache is rebuilt from scratch when
+the collector no longer knows that version or the session is re-created.
+"""
+
+from nova import log as logging
+from nova.virt.vmwareapi import error_util
+from nova.virt.vmwareapi import vim_util
+
+LOG = logging.getLogger("nova.virt.vmwareapi.inventory")
+
+VM_PROPERTIES = ["name",
+                 "runtime.powerState",
+                 "runtime.connectionState",
+                 "summary.config.numCpu",
+                 "summary.config.memorySizeMB"]
+
+
+class VMInventory(object):
+    """Name to VM reference and property cache for a session."""
+
+    def __init__(self, session):
+        self._session = session
+        self._vim = None
+        self._filter = None
+        self._version = ""
+        self._vms = {}
+        self._names = {}
+
+    def _reset(self):
+        """Forgets the cached VMs so the next update gets all of them."""
+        self._version = ""
+        self._vms = {}
+        self._names = {}
+
+    def _create_filter(self):
+        """Creates the property filter for the current session."""
+        vim = self._session._get_vim()
+        spec = vim_util.build_inventory_filter_spec(vim, "VirtualMachine",
+                                                    VM_PROPERTIES)
+        self._reset()
+        self._filter = self._session._call_method(vim_util, "create_filter",
+                                                  spec)
+        self._vim = self._session.vim
+
+    def _session_changed(self):
+        """Filters go away with the session they were created in."""
+        return self._filter is None or self._session.vim is not self._vim
+
+    def _update(self):
+        """Applies the changes made since the version last seen."""
+        if self._session_changed():
+            self._create_filter()
+        while True:
+            try:
+                update_set = self._session._call_method(vim_util,
+                                    "wait_for_updates", self._version)
+            except error_util.VimFaultException, excep:
+                if (error_util.FAULT_INVALID_COLLECTOR_VERSION not in
+                        excep.fault_list):
+                    raise
+                LOG.debug(_("Version %s of the VM inventory expired, "
+                            "refreshing it") % self._version)
+                self._reset()
+                continue
+            if self._session_changed():
+                self._create_filter()
+                continue
+            if not update_set:
+                return
+            for filter_update in update_set.filterSet:
+                for object_update in filter_update.objectSet:
+                    self._apply(object_update)
+            self._version = update_set.version
+            if not getattr(update_set, "truncated", False):
+                return
+
+    def _apply(self, object_update):
+        """Applies the changes to a single VM."""
+        vm_ref = object_update.obj
+        props = self._vms.get(vm_ref, {})
+        old_name = props.get("name")
+        if object_update.kind == "leave":
+            self._vms.pop(vm_ref, None)
+            if self._names.get(old_name) == vm_ref:
+                del self._names[old_name]
+            return
+        for change in getattr(object_update, "changeSet", None) or []:
+            if change.op in ("remove", "indirectRemove"):
+                props.pop(change.name, None)
+            else:
+                props[change.name] = getattr(change, "val", None)
+        self._vms[vm_ref] = props
+        name = props.get("name")
+        if name != old_name and self._names.get(old_name) == vm_ref:
+            del self._names[old_name]
+        if name is not None:
+            self._names[name] = vm_ref
+
+    def get_vm(self, vm_name):
+        """
+        Returns the reference to the VM with the name specified and a
+        dict of its properties, or (None, None) if there is no such VM.
+        """
+        self._update()
+        vm_ref = self._names.get(vm_name)
+        if vm_ref is None:
+            return None, None
+        return vm_ref, dict(self._vms[vm_ref])
+
+    def get_vm_ref(self, vm_name):
+        """Returns the reference to the VM with the name specified."""
+        return self.get_vm(vm_name)[0]
+
+    def list_vms(self):
+        """Returns a list of (reference, properties) for every VM."""
+        self._update()
+        return [(vm_ref, dict(props))
+                for vm_ref, props in self._vms.iteritems()]
@@ -158,8 +158,12 @@ def get_dynamic_property(vim, mobj, type, property_name):
     return property_value
 
 
-def get_objects(vim, type, properties_to_collect=None, all=False):
-    """Gets the list of objects of the type specified."""
+def build_inventory_filter_spec(vim, type, properties_to_collect=None,
+                                all=False):
+    """
+    Builds the Property Filter Spec selecting the objects of the type
+    specified anywhere in the inventory.
+    """
     if not properties_to_collect:
         properties_to_collect = ["name"]
 
@@ -170,13 +174,47 @@ def get_objects(vim, type, properties_to_collect=None, all=False):
     property_spec = build_property_spec(client_factory, type=type,
                                 properties_to_collect=properties_to_collect,
                                 all_properties=all)
-    property_filter_spec = build_property_filter_spec(client_factory,
+    return build_property_filter_spec(client_factory,
                                 [property_spec],
                                 [object_spec])
+
+
+def get_objects(vim, type, properties_to_collect=None, all=False):
+    """Gets the list of objects of the type specified."""
+    property_filter_spec = build_inventory_filter_spec(vim, type,
+                                properties_to_collect, all)
     return vim.RetrieveProperties(vim.get_service_content().propertyCollector,
                                 specSet=[property_filter_spec])
 
 
+def create_filter(vim, property_filter_spec):
+    """
+    Creates a filter on the property collector of the session. The
+    filter lives as long as the session does.
+    """
+    return vim.CreateFilter(vim.get_service_content().propertyCollector,
+                            spec=property_filter_spec,
+                            partialUpdates=False)
+
+
+def destroy_filter(vim, filter_ref):
+    """Destroys a filter created with create_filter."""
+    return vim.DestroyPropertyFilter(filter_ref)
+
+
+def wait_for_updates(vim, version, max_wait_seconds=0):
+    """
+    Gets the changes to the properties selected by the filters of the
+    session since the version specified. An empty version gets the
+    current value of every property. Returns None when nothing changed
+    within max_wait_seconds.
+    """
+    options = vim.client.factory.create('ns0:WaitOptions')
+    options.maxWaitSeconds = max_wait_seconds
+    return vim.WaitForUpdatesEx(vim.get_service_content().propertyCollector,
+                                version=version, options=options)
+
+
 def get_prop_spec(client_factory, spec_type, properties):
     """Builds the Property Spec Object."""
     prop_spec = client_factory.create('ns0:PropertySpec')
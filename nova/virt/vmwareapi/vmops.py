@@ -32,6 +32,8 @@ from nova import flags
 from nova import log as logging
 from nova import utils
 from nova.compute import power_state
+from nova.virt import driver
+from nova.virt.vmwareapi import inventory
 from nova.virt.vmwareapi import vim_util
 from nova.virt.vmwareapi import vm_util
 from nova.virt.vmwareapi import vmware_images
@@ -56,29 +58,34 @@ class VMWareVMOps(object):
     def __init__(self, session):
         """Initializer."""
         self._session = session
+        self._inventory = inventory.VMInventory(session)
         self._vif_driver = utils.import_object(FLAGS.vmware_vif_driver)
 
+    def _list_vm_props(self):
+        """Lists the properties of the VMs registered with the ESX host."""
+        lst_vm_props = []
+        for vm_ref, props in self._inventory.list_vms():
+            # Ignoring the oprhaned or inaccessible VMs
+            if props.get("runtime.connectionState") not in ["orphaned",
+                                                            "inaccessible"]:
+                lst_vm_props.append(props)
+        return lst_vm_props
+
     def list_instances(self):
         """Lists the VM instances that are registered with the ESX host."""
         LOG.debug(_("Getting list of instances"))
-        vms = self._session._call_method(vim_util, "get_objects",
-                     "VirtualMachine",
-                     ["name", "runtime.connectionState"])
-        lst_vm_names = []
-        for vm in vms:
-            vm_name = None
-            conn_state = None
-            for prop in vm.propSet:
-                if prop.name == "name":
-                    vm_name = prop.val
-                elif prop.name == "runtime.connectionState":
-                    conn_state = prop.val
-            # Ignoring the oprhaned or inaccessible VMs
-            if conn_state not in ["orphaned", "inaccessible"]:
-                lst_vm_names.append(vm_name)
+        lst_vm_names = [props["name"] for props in self._list_vm_props()]
         LOG.debug(_("Got total of %s instances") % str(len(lst_vm_names)))
         return lst_vm_names
 
+    def list_instances_detail(self):
+        """List VM instances, returning InstanceInfo objects."""
+        instance_infos = []
+        for props in self._list_vm_props():
+            state = VMWARE_POWER_STATES[props["runtime.powerState"]]
+            instance_infos.append(driver.InstanceInfo(props["name"], state))
+        return instance_infos
+
     def spawn(self, context, instance, image_meta, network_info):
         """
         Creates a VM instance.
@@ -616,13 +623,11 @@ class VMWareVMOps(object):
 
     def suspend(self, instance):
         """Suspend the specified instance."""
-        vm_ref = self._get_vm_ref_from_the_name(instance.name)
+        vm_ref, props = self._inventory.get_vm(instance.name)
         if vm_ref is None:
             raise exception.InstanceNotFound(instance_id=instance.id)
 
-        pwr_state = self._session._call_method(vim_util,
-                    "get_dynamic_property", vm_ref,
-                    "VirtualMachine", "runtime.powerState")
+        pwr_state = props["runtime.powerState"]
         # Only PoweredOn VMs can be suspended.
         if pwr_state == "poweredOn":
             LOG.debug(_("Suspending the VM %s ") % instance.name)
@@ -640,13 +645,11 @@ class VMWareVMOps(object):
 
     def resume(self, instance):
         """Resume the specified instance."""
-        vm_ref = self._get_vm_ref_from_the_name(instance.name)
+        vm_ref, props = self._inventory.get_vm(instance.name)
         if vm_ref is None:
             raise exception.InstanceNotFound(instance_id=instance.id)
 
-        pwr_state = self._session._call_method(vim_util,
-                                     "get_dynamic_property", vm_ref,
-                                     "VirtualMachine", "runtime.powerState")
+        pwr_state = props["runtime.powerState"]
         if pwr_state.lower() == "suspended":
             LOG.debug(_("Resuming the VM %s") % instance.name)
             suspend_task = self._session._call_method(
@@ -660,28 +663,14 @@ class VMWareVMOps(object):
 
     def get_info(self, instance_name):
         """Return data about the VM instance."""
-        vm_ref = self._get_vm_ref_from_the_name(instance_name)
+        vm_ref, props = self._inventory.get_vm(instance_name)
         if vm_ref is None:
             raise exception.InstanceNotFound(instance_id=instance_name)
 
-        lst_properties = ["summary.config.numCpu",
-                    "summary.config.memorySizeMB",
-                    "runtime.powerState"]
-        vm_props = self._session._call_method(vim_util,
-                    "get_object_properties", None, vm_ref, "VirtualMachine",
-                    lst_properties)
-        max_mem = None
-        pwr_state = None
-        num_cpu = None
-        for elem in vm_props:
-            for prop in elem.propSet:
-                if prop.name == "summary.config.numCpu":
-                    num_cpu = int(prop.val)
-                elif prop.name == "summary.config.memorySizeMB":
-                    # In MB, but we want in KB
-                    max_mem = int(prop.val) * 1024
-                elif prop.name == "runtime.powerState":
-                    pwr_state = VMWARE_POWER_STATES[prop.val]
+        num_cpu = int(props["summary.config.numCpu"])
+        # In MB, but we want in KB
+        max_mem = int(props["summary.config.memorySizeMB"]) * 1024
+        pwr_state = VMWARE_POWER_STATES[props["runtime.powerState"]]
 
         return {'state': pwr_state,
                 'max_mem': max_mem,
@@ -807,12 +796,7 @@ class VMWareVMOps(object):
 
     def _get_vm_ref_from_the_name(self, vm_name):
         """Get reference to the VM with the name specified."""
-        vms = self._session._call_method(vim_util, "get_objects",
-                    "VirtualMachine", ["name"])
-        for vm in vms:
-            if vm.propSet[0].val == vm_name:
-                return vm.obj
-        return None
+        return self._inventory.get_vm_ref(vm_name)
 
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
@@ -124,6 +124,10 @@ class VMWareESXConnection(driver.ComputeDriver):
         """List VM instances."""
         return self._vmops.list_instances()
 
+    def list_instances_detail(self):
+        """List VM instances, returning InstanceInfo objects."""
+        return self._vmops.list_instances_detail()
+
     def spawn(self, context, instance, image_meta, network_info,
               block_device_mapping=None):
         """Create VM instance."""
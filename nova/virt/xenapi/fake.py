@@ -65,6 +65,8 @@ _CLASSES = ['host', 'network', 'session', 'SR', 'VBD',
             'PBD', 'VDI', 'VIF', 'PIF', 'VM', 'VLAN', 'task']
 
 _db_content = {}
+_call_counts = {}
+_events = {}
 
 LOG = logging.getLogger("nova.virt.xenapi.fake")
 
@@ -78,6 +80,8 @@ def log_db_contents(msg=None):
 def reset():
     for c in _CLASSES:
         _db_content[c] = {}
+    reset_call_counts()
+    _events.clear()
     create_host('fake')
     create_vm('fake',
               'Running',
@@ -85,6 +89,25 @@ def reset():
               is_control_domain=True)
 
 
+def reset_call_counts():
+    _call_counts.clear()
+
+
+def call_count(methodname=None):
+    """Return the number of calls made to methodname, or of all calls."""
+    if methodname is None:
+        return sum(_call_counts.itervalues())
+    return _call_counts.get(methodname, 0)
+
+
+def send_event(cls, ref, operation='mod'):
+    """Queue an event for the sessions registered for cls."""
+    for session, (classes, events) in _events.iteritems():
+        if cls in classes:
+            events.append({'class': cls, 'operation': operation,
+                           'ref': ref})
+
+
 def reset_table(table):
     if not table in _CLASSES:
         return
@@ -446,6 +469,23 @@ class SessionBase(object):
     def VM_clean_reboot(self, *args):
         return 'burp'
 
+    def event_register(self, session, classes):
+        _events[session] = (classes, [])
+
+    def event_unregister(self, session, classes):
+        _events.pop(session, None)
+
+    def event_next(self, session):
+        """Return the queued events.
+
+        Unlike XenAPI this doesn't block when there are no events.
+        """
+        if session not in _events:
+            raise Failure(['SESSION_NOT_REGISTERED', session])
+        events = _events[session][1]
+        _events[session] = (_events[session][0], [])
+        return events
+
     def network_get_all_records_where(self, _1, filter):
         return self.xenapi.network.get_all_records()
 
@@ -457,6 +497,7 @@ class SessionBase(object):
             self._logout()
             return None
         else:
+            _call_counts[methodname] = _call_counts.get(methodname, 0) + 1
             full_params = (self._session,) + params
             meth = getattr(self, methodname, None)
             if meth is None:
@@ -480,6 +521,7 @@ class SessionBase(object):
                 "Logging out a session that is invalid or already logged "
                 "out: %s" % s)
         del _db_content['session'][s]
+        _events.pop(s, None)
 
     def __getattr__(self, name):
         if name == 'handle':
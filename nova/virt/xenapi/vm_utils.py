@@ -20,19 +20,20 @@ Helper methods for operations related to the management of VM records and
 their attributes like VDIs, VIFs, as well as their lookup functions.
 """
 
+import base64
 import contextlib
+import httplib
 import json
 import math
 import os
 import pickle
 import re
+import socket
 import sys
 import tempfile
 import time
-import urllib
 import uuid
-from decimal import Decimal
-from xml.dom import minidom
+from xml.etree import cElementTree as ElementTree
 
 from nova import db
 from nova import exception
@@ -888,17 +889,13 @@ w
 
         try:
             diags = {}
-            xml = get_rrd(host_ip, record["uuid"])
-            if xml:
-                rrd = minidom.parseString(xml)
-                for i, node in enumerate(rrd.firstChild.childNodes):
-                    # We don't want all of the extra garbage
-                    if i >= 3 and i <= 11:
-                        ref = node.childNodes
-                        # Name and Value
-                        if len(ref) > 6:
-                            diags[ref[0].firstChild.data] = \
-                                ref[6].firstChild.data
+            rrd = get_rrd(host_ip, record["uuid"])
+            if rrd is not None:
+                # We don't want all of the extra garbage
+                for ds in rrd.findall('ds')[:9]:
+                    # Name and Value
+                    if len(ds) > 6:
+                        diags[ds[0].text] = ds[6].text
             return diags
         except cls.XenAPI.Failure as e:
             return {"Unable to retrieve diagnostics": e}
@@ -914,10 +911,9 @@ w
         except (cls.XenAPI.Failure, KeyError) as e:
             raise exception.CouldNotFetchMetrics()
 
-        xml = get_rrd_updates(host_ip, start_time)
-        if xml:
-            doc = minidom.parseString(xml)
-            return parse_rrd_update(doc, start_time, stop_time)
+        metrics = get_rrd_updates(host_ip, start_time, stop_time)
+        if metrics is not None:
+            return metrics
 
         raise exception.CouldNotFetchMetrics()
 
@@ -936,101 +932,122 @@ w
         session.call_xenapi('SR.scan', sr_ref)
 
 
-def get_rrd(host, vm_uuid):
-    """Return the VM RRD XML as a string"""
-    try:
-        xml = urllib.urlopen("http://%s:%s@%s/vm_rrd?uuid=%s" % (
-            FLAGS.xenapi_connection_username,
-            FLAGS.xenapi_connection_password,
-            host,
-            vm_uuid))
-        return xml.read()
-    except IOError:
-        return None
+# Idle connections to the dom0 web server by host
+_RRD_CONNECTIONS = {}
+_RRD_MAX_IDLE_CONNECTIONS = 4
 
 
-def get_rrd_updates(host, start_time):
-    """Return the RRD updates XML as a string"""
-    try:
-        xml = urllib.urlopen("http://%s:%s@%s/rrd_updates?start=%s" % (
-            FLAGS.xenapi_connection_username,
-            FLAGS.xenapi_connection_password,
-            host,
-            start_time))
-        return xml.read()
-    except IOError:
-        return None
+def _fetch_rrd(host, path, parse):
+    """GET path from the dom0 web server and return parse(response).
+
+    Keeps a few connections per host open between calls, each call takes
+    one for itself while it runs.  Returns None if the request fails.
+    """
+    auth = base64.b64encode('%s:%s' % (FLAGS.xenapi_connection_username,
+                                       FLAGS.xenapi_connection_password))
+    headers = {'Authorization': 'Basic %s' % auth}
+    # A kept alive connection may have been closed by dom0, retry once
+    for attempt in xrange(2):
+        idle = _RRD_CONNECTIONS.get(host)
+        if idle:
+            conn = idle.pop()
+        else:
+            conn = httplib.HTTPConnection(host)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            if response.status != httplib.OK:
+                response.read()
+                result = None
+            else:
+                result = parse(response)
+        except (httplib.HTTPException, socket.error, SyntaxError):
+            conn.close()
+            # dom0 has most likely closed the other idle connections too
+            for idle_conn in _RRD_CONNECTIONS.pop(host, []):
+                idle_conn.close()
+            continue
+        idle = _RRD_CONNECTIONS.setdefault(host, [])
+        if len(idle) < _RRD_MAX_IDLE_CONNECTIONS:
+            idle.append(conn)
+        else:
+            conn.close()
+        return result
+    return None
+
+
+def get_rrd(host, vm_uuid):
+    """Return the root element of the VM RRD"""
+    return _fetch_rrd(host, '/vm_rrd?uuid=%s' % vm_uuid,
+                      lambda response: ElementTree.parse(response).getroot())
 
 
-def parse_rrd_meta(doc):
-    data = {}
-    meta = doc.getElementsByTagName('meta')[0]
-    for tag in ('start', 'end', 'step'):
-        data[tag] = int(meta.getElementsByTagName(tag)[0].firstChild.data)
-    legend = meta.getElementsByTagName('legend')[0]
-    data['legend'] = [child.firstChild.data for child in legend.childNodes]
-    return data
+def get_rrd_updates(host, start_time, until=None):
+    """Return the metrics of all VMs since start_time, see
+    parse_rrd_update"""
+    return _fetch_rrd(host, '/rrd_updates?start=%s' % start_time,
+                      lambda response: parse_rrd_update(response, start_time,
+                                                        until))
 
 
-def parse_rrd_data(doc):
-    dnode = doc.getElementsByTagName('data')[0]
-    return [dict(
-            time=int(child.getElementsByTagName('t')[0].firstChild.data),
-            values=[Decimal(valnode.firstChild.data)
-                  for valnode in child.getElementsByTagName('v')])
-            for child in dnode.childNodes]
+def parse_rrd_update(source, start, until=None):
+    """Parse an rrd_updates document into {vm_uuid: {name: value}}.
 
+    VIF series are integrated over time using the trapezoidal rule, the
+    others are averaged, ignoring NaNs.  The document is read as it
+    arrives and reduced to running totals per column; rows after until
+    are skipped.
+    """
+    legend = []
+    sums = counts = integrals = None
+    newer_time = newer_vals = None
+    for _event, elem in ElementTree.iterparse(source):
+        if elem.tag == 'entry':
+            legend.append(elem.text)
+        elif elem.tag == 'row':
+            row_time = int(elem.findtext('t'))
+            if not until or row_time <= until:
+                vals = [float(v.text) for v in elem.findall('v')]
+                if sums is None:
+                    sums = [0.0] * len(vals)
+                    counts = [0] * len(vals)
+                    integrals = [0.0] * len(vals)
+                for col, val in enumerate(vals):
+                    if val != val:
+                        # NaN, counts as 0 in integrals
+                        vals[col] = 0.0
+                    else:
+                        sums[col] += val
+                        counts[col] += 1
+                # Rows come newest first
+                if newer_vals is not None:
+                    interval = newer_time - row_time
+                    for col, val in enumerate(vals):
+                        integrals[col] += (0.5 * (val + newer_vals[col]) *
+                                           interval)
+                newer_time = row_time
+                newer_vals = vals
+            elem.clear()
+
+    if newer_vals is not None:
+        # The oldest value holds from start
+        for col, val in enumerate(newer_vals):
+            integrals[col] += val * (newer_time - int(start))
 
-def parse_rrd_update(doc, start, until=None):
     sum_data = {}
-    meta = parse_rrd_meta(doc)
-    data = parse_rrd_data(doc)
-    for col, collabel in enumerate(meta['legend']):
+    for col, collabel in enumerate(legend):
         datatype, objtype, uuid, name = collabel.split(':')
-        vm_data = sum_data.get(uuid, dict())
+        vm_data = sum_data.setdefault(uuid, {})
         if name.startswith('vif'):
-            vm_data[name] = integrate_series(data, col, start, until)
+            value = integrals and integrals[col] or 0.0
+        elif counts and counts[col]:
+            value = sums[col] / counts[col]
         else:
-            vm_data[name] = average_series(data, col, start, until)
-        sum_data[uuid] = vm_data
+            value = 0.0
+        vm_data[name] = round(value, 4)
     return sum_data
 
 
-def average_series(data, col, start, until=None):
-    vals = [row['values'][col] for row in data
-            if (not until or (row['time'] <= until)) and
-                not row['values'][col].is_nan()]
-    if vals:
-        return (sum(vals) / len(vals)).quantize(Decimal('1.0000'))
-    else:
-        return Decimal('0.0000')
-
-
-def integrate_series(data, col, start, until=None):
-    total = Decimal('0.0000')
-    prev_time = int(start)
-    prev_val = None
-    for row in reversed(data):
-        if not until or (row['time'] <= until):
-            time = row['time']
-            val = row['values'][col]
-            if val.is_nan():
-                val = Decimal('0.0000')
-            if prev_val is None:
-                prev_val = val
-            if prev_val >= val:
-                total += ((val * (time - prev_time)) +
-                          (Decimal('0.5000') * (prev_val - val) *
-                          (time - prev_time)))
-            else:
-                total += ((prev_val * (time - prev_time)) +
-                          (Decimal('0.5000') * (val - prev_val) *
-                          (time - prev_time)))
-            prev_time = time
-            prev_val = val
-    return total.quantize(Decimal('1.0000'))
-
-
 #TODO(sirp): This code comes from XS5.6 pluginlib.py, we should refactor to
 # use that implmenetation
 def get_vhd_parent(session, vdi_rec):
@@ -94,31 +94,29 @@ class VMOps(object):
         self.vif_driver = utils.import_object(FLAGS.xenapi_vif_driver)
         self._product_version = product_version
 
+    def _list_vm_records(self):
+        """Return the records of the VMs that aren't templates or dom0."""
+        return [vm_rec for vm_rec
+                in self._session.get_all_records("VM").itervalues()
+                if not vm_rec["is_a_template"] and
+                   not vm_rec["is_control_domain"]]
+
     def list_instances(self):
         """List VM instances."""
-        # TODO(justinsb): Should we just always use the details method?
-        #  Seems to be the same number of API calls..
-        vm_refs = []
-        for vm_ref in self._session.call_xenapi("VM.get_all"):
-            vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
-            if not vm_rec["is_a_template"] and not vm_rec["is_control_domain"]:
-                vm_refs.append(vm_rec["name_label"])
-        return vm_refs
+        return [vm_rec["name_label"] for vm_rec in self._list_vm_records()]
 
     def list_instances_detail(self):
         """List VM instances, returning InstanceInfo objects."""
         instance_infos = []
-        for vm_ref in self._session.call_xenapi("VM.get_all"):
-            vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
-            if not vm_rec["is_a_template"] and not vm_rec["is_control_domain"]:
-                name = vm_rec["name_label"]
+        for vm_rec in self._list_vm_records():
+            name = vm_rec["name_label"]
 
-                # TODO(justinsb): This a roundabout way to map the state
-                openstack_format = VMHelper.compile_info(vm_rec)
-                state = openstack_format['state']
+            # TODO(justinsb): This a roundabout way to map the state
+            openstack_format = VMHelper.compile_info(vm_rec)
+            state = openstack_format['state']
 
-                instance_info = driver.InstanceInfo(name, state)
-                instance_infos.append(instance_info)
+            instance_info = driver.InstanceInfo(name, state)
+            instance_infos.append(instance_info)
         return instance_infos
 
     def confirm_migration(self, migration, instance, network_info):
@@ -1271,12 +1269,15 @@ class VMOps(object):
             LOG.exception(_("Could not get bandwidth info."),
                           exc_info=sys.exc_info())
         bw = {}
+        vm_recs = dict((vm_rec['uuid'], vm_rec) for vm_rec
+                       in self._session.get_all_records("VM").itervalues())
+        vif_recs = self._session.get_all_records("VIF")
         for uuid, data in metrics.iteritems():
-            vm_ref = self._session.call_xenapi("VM.get_by_uuid", uuid)
-            vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
+            vm_rec = vm_recs.get(uuid)
+            if vm_rec is None:
+                continue
             vif_map = {}
-            for vif in [self._session.call_xenapi("VIF.get_record", vrec)
-                        for vrec in vm_rec['VIFs']]:
+            for vif in [vif_recs[vif_ref] for vif_ref in vm_rec['VIFs']]:
                 vif_map[vif['device']] = vif['MAC']
             name = vm_rec['name_label']
             if name.startswith('Control domain'):
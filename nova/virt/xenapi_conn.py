@@ -42,9 +42,8 @@ reactor thread if the VM.get_by_name_label or VM.get_record calls block.
                               Platform (default: root).
 :xenapi_connection_password:  Password for connection to XenServer/Xen Cloud
                               Platform.
-:xenapi_task_poll_interval:  The interval (seconds) used for polling of
-                             remote tasks (Async.VM.start, etc)
-                             (default: 0.5).
+:xenapi_record_cache_ttl:    How long (seconds) records fetched in bulk are
+                             reused (default: 2.0).
 :target_host:                the iSCSI Target Host IP address, i.e. the IP
                              address for the nova-volume host
 :target_port:                iSCSI Target Port, 3260 Default
@@ -65,6 +64,7 @@ import time
 import urlparse
 import xmlrpclib
 
+import eventlet
 from eventlet import event
 from eventlet import queue
 from eventlet import tpool
@@ -73,7 +73,6 @@ from eventlet import timeout
 from nova import context
 from nova import db
 from nova import exception
-from nova import utils
 from nova import flags
 from nova import log as logging
 from nova.virt import driver
@@ -103,11 +102,17 @@ flags.DEFINE_integer('xenapi_connection_concurrent',
                      5,
                      'Maximum number of concurrent XenAPI connections.'
                      ' Used only if connection_type=xenapi.')
-flags.DEFINE_float('xenapi_task_poll_interval',
-                   0.5,
-                   'The interval used for polling of remote tasks '
-                   '(Async.VM.start, etc). Used only if '
+flags.DEFINE_float('xenapi_record_cache_ttl',
+                   2.0,
+                   'Seconds the records of all VMs, VIFs, etc fetched with '
+                   'one get_all_records call are reused. Any call that is '
+                   'not a getter empties the cache. Used only if '
                    'connection_type=xenapi.')
+flags.DEFINE_float('xenapi_task_recheck_interval',
+                   60.0,
+                   'Seconds to wait for the XenAPI event of a finished task '
+                   'before checking the task again.'
+                   '  Used only if connection_type=xenapi.')
 flags.DEFINE_float('xenapi_vhd_coalesce_poll_interval',
                    5.0,
                    'The interval used for polling of coalescing vhds.'
@@ -448,13 +453,22 @@ class XenAPISession(object):
     def __init__(self, url, user, pw):
         self.XenAPI = self.get_imported_xenapi()
         self._sessions = queue.Queue()
+        self._url = url
+        self._user = user
+        self._pw = pw
+        self._record_cache = {}
+        self._task_waiters = {}
+        self._event_loop = None
+        for i in xrange(FLAGS.xenapi_connection_concurrent):
+            self._sessions.put(self._login())
+
+    def _login(self):
+        session = self._create_session(self._url)
         exception = self.XenAPI.Failure(_("Unable to log in to XenAPI "
                             "(is the Dom0 disk full?)"))
-        for i in xrange(FLAGS.xenapi_connection_concurrent):
-            session = self._create_session(url)
-            with timeout.Timeout(FLAGS.xenapi_login_timeout, exception):
-                session.login_with_password(user, pw)
-            self._sessions.put(session)
+        with timeout.Timeout(FLAGS.xenapi_login_timeout, exception):
+            session.login_with_password(self._user, self._pw)
+        return session
 
     def get_product_version(self):
         """Return a tuple of (major, minor, rev) for the host version"""
@@ -484,11 +498,30 @@ class XenAPISession(object):
 
     def call_xenapi(self, method, *args):
         """Call the specified XenAPI method on a background thread."""
+        if '.get_' not in method:
+            self._record_cache.clear()
         with self._get_session() as session:
-            f = session.xenapi
-            for m in method.split('.'):
-                f = getattr(f, m)
-            return tpool.execute(f, *args)
+            return self._call_session(session, method, *args)
+
+    def _call_session(self, session, method, *args):
+        f = session.xenapi
+        for m in method.split('.'):
+            f = getattr(f, m)
+        return tpool.execute(f, *args)
+
+    def get_all_records(self, cls):
+        """Return the records of every object of a XenAPI class by ref.
+
+        The records are fetched with one call and reused for
+        xenapi_record_cache_ttl seconds, callers must not modify them.
+        """
+        now = time.time()
+        cached = self._record_cache.get(cls)
+        if cached and now - cached[0] < FLAGS.xenapi_record_cache_ttl:
+            return cached[1]
+        records = self.call_xenapi('%s.get_all_records' % cls)
+        self._record_cache[cls] = (now, records)
+        return records
 
     def call_xenapi_request(self, method, *args):
         """Some interactions with dom0, such as interacting with xenstore's
@@ -501,61 +534,112 @@ class XenAPISession(object):
 
     def async_call_plugin(self, plugin, fn, args):
         """Call Async.host.call_plugin on a background thread."""
+        self._record_cache.clear()
         with self._get_session() as session:
             return tpool.execute(self._unwrap_plugin_exceptions,
                                  session.xenapi.Async.host.call_plugin,
                                  self.get_xenapi_host(), plugin, fn, args)
 
     def wait_for_task(self, task, id=None):
-        """Return the result of the given task. The task is polled
-        until it completes."""
-        done = event.Event()
-        loop = utils.LoopingCall(f=None)
-
-        def _poll_task():
-            """Poll the given XenAPI task, and return the result if the
-            action was completed successfully or not.
-            """
+        """Return the result of the given task.
+
+        If the task is still pending, waits for the event loop of the
+        session to see it finish.  The task is checked again every
+        xenapi_task_recheck_interval seconds in case its event is missed.
+        """
+        task_rec = self.call_xenapi("task.get_record", task)
+        while task_rec["status"] == "pending":
+            done = self._task_waiters.setdefault(task, event.Event())
+            if self._event_loop is None:
+                self._event_loop = eventlet.spawn(self._watch_tasks)
+            # The task may have finished before the event loop saw us
+            task_rec = self.call_xenapi("task.get_record", task)
+            if task_rec["status"] != "pending":
+                if self._task_waiters.get(task) is done:
+                    self._task_waiters.pop(task).send(task_rec)
+                break
+            timeout = eventlet.Timeout(FLAGS.xenapi_task_recheck_interval)
             try:
-                ctxt = context.get_admin_context()
-                name = self.call_xenapi("task.get_name_label", task)
-                status = self.call_xenapi("task.get_status", task)
-
-                # Ensure action is never > 255
-                action = dict(action=name[:255], error=None)
-                log_instance_actions = FLAGS.xenapi_log_instance_actions and id
-                if log_instance_actions:
-                    action["instance_id"] = int(id)
-
-                if status == "pending":
-                    return
-                elif status == "success":
-                    result = self.call_xenapi("task.get_result", task)
-                    LOG.info(_("Task [%(name)s] %(task)s status:"
-                            " success    %(result)s") % locals())
-
-                    if log_instance_actions:
-                        db.instance_action_create(ctxt, action)
-
-                    done.send(_parse_xmlrpc_value(result))
-                else:
-                    error_info = self.call_xenapi("task.get_error_info", task)
-                    LOG.warn(_("Task [%(name)s] %(task)s status:"
-                            " %(status)s    %(error_info)s") % locals())
-
-                    if log_instance_actions:
-                        action["error"] = str(error_info)
-                        db.instance_action_create(ctxt, action)
-
-                    done.send_exception(self.XenAPI.Failure(error_info))
-            except self.XenAPI.Failure, exc:
-                LOG.warn(exc)
-                done.send_exception(*sys.exc_info())
-            loop.stop()
+                task_rec = done.wait()
+            except eventlet.Timeout, exc:
+                if exc is not timeout:
+                    raise
+                LOG.warn(_("No event for XenAPI task %s, checking it again"),
+                         task)
+            finally:
+                timeout.cancel()
+
+        name = task_rec["name_label"]
+        status = task_rec["status"]
+        ctxt = context.get_admin_context()
+        # Ensure action is never > 255
+        action = dict(action=name[:255], error=None)
+        log_instance_actions = FLAGS.xenapi_log_instance_actions and id
+        if log_instance_actions:
+            action["instance_id"] = int(id)
+
+        if status == "success":
+            result = task_rec["result"]
+            LOG.info(_("Task [%(name)s] %(task)s status:"
+                    " success    %(result)s") % locals())
+
+            if log_instance_actions:
+                db.instance_action_create(ctxt, action)
+
+            return _parse_xmlrpc_value(result)
+        else:
+            error_info = task_rec["error_info"]
+            LOG.warn(_("Task [%(name)s] %(task)s status:"
+                    " %(status)s    %(error_info)s") % locals())
+
+            if log_instance_actions:
+                action["error"] = str(error_info)
+                db.instance_action_create(ctxt, action)
 
-        loop.f = _poll_task
-        loop.start(FLAGS.xenapi_task_poll_interval, now=True)
-        return done.wait()
+            raise self.XenAPI.Failure(error_info)
+
+    def _watch_tasks(self):
+        """Wake the greenthreads in wait_for_task as their tasks finish.
+
+        Runs while there are waiters, on a session of its own since
+        event.next blocks until XenAPI has events for it.
+        """
+        session = self._login()
+        try:
+            while self._task_waiters:
+                try:
+                    self._call_session(session, 'event.register', ['task'])
+                    # The tasks may have finished before we registered
+                    self._check_tasks(session, self._task_waiters.keys())
+                    while self._task_waiters:
+                        events = self._call_session(session, 'event.next')
+                        self._check_tasks(session,
+                                          [ev['ref'] for ev in events
+                                           if ev['class'] == 'task'])
+                except self.XenAPI.Failure, exc:
+                    if exc.details[:1] != ['EVENTS_LOST']:
+                        raise
+                    LOG.warn(_("Lost XenAPI events, checking all tasks"))
+        except Exception:
+            LOG.exception(_("Failed to wait for XenAPI task events"))
+            waiters = self._task_waiters
+            self._task_waiters = {}
+            for done in waiters.values():
+                done.send_exception(*sys.exc_info())
+        finally:
+            self._event_loop = None
+            try:
+                self._call_session(session, 'session.logout')
+            except self.XenAPI.Failure:
+                pass
+
+    def _check_tasks(self, session, tasks):
+        for task in tasks:
+            if task not in self._task_waiters:
+                continue
+            task_rec = self._call_session(session, 'task.get_record', task)
+            if task_rec["status"] != "pending":
+                self._task_waiters.pop(task).send(task_rec)
 
     def _create_session(self, url):
         """Stubout point. This can be replaced with a mock session."""
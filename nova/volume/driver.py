@@ -29,6 +29,7 @@ from nova import flags
 from nova import log as logging
 from nova import utils
 from nova.volume import iscsi
+from nova.volume import reclaim
 from nova.volume import volume_types
 
 
@@ -57,6 +58,7 @@ class VolumeDriver(object):
         # NOTE(vish): db is set by Manager
         self.db = None
         self.set_execute(execute)
+        self.reclaimer = reclaim.VolumeReclaimer(self)
 
     def set_execute(self, execute):
         self._execute = execute
@@ -86,6 +88,8 @@ class VolumeDriver(object):
         if not FLAGS.volume_group in volume_groups:
             raise exception.Error(_("volume group %s doesn't exist")
                                   % FLAGS.volume_group)
+        if FLAGS.volume_reclaim_in_background:
+            self.reclaimer.start()
 
     def _create_volume(self, volume_name, sizestr):
         self._try_execute('lvcreate', '-L', sizestr, '-n',
@@ -108,7 +112,6 @@ class VolumeDriver(object):
     def _delete_volume(self, volume, size_in_g):
         """Deletes a logical volume."""
         # zero out old volumes to prevent data leaking between users
-        # TODO(ja): reclaiming space should be done lazy and low priority
         self._copy_volume('/dev/zero', self.local_path(volume), size_in_g)
         self._try_execute('lvremove', '-f', "%s/%s" %
                           (FLAGS.volume_group,
@@ -157,7 +160,10 @@ class VolumeDriver(object):
             if (out[0] == 'o') or (out[0] == 'O'):
                 raise exception.VolumeIsBusy(volume_name=volume['name'])
 
-        self._delete_volume(volume, volume['size'])
+        if FLAGS.volume_reclaim_in_background:
+            self.reclaimer.reclaim(volume['name'], volume['size'])
+        else:
+            self._delete_volume(volume, volume['size'])
 
     def create_snapshot(self, snapshot):
         """Creates a snapshot."""
@@ -217,6 +223,10 @@ class VolumeDriver(object):
         """Any initialization the volume driver does while starting"""
         pass
 
+    def get_reclaim_stats(self):
+        """Return the queue depth and progress of deleted volume wipes."""
+        return self.reclaimer.stats()
+
 
 class ISCSIDriver(VolumeDriver):
     """Executes commands relating to ISCSI volumes.
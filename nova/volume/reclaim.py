@@ -0,0 +1,203 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Background reclaim of deleted logical volumes.
+
+Deleted volumes are renamed with the volume_reclaim_prefix and keep their
+extents until they have been wiped, so a new volume can never be given
+extents still holding another user's data.  A single greenthread wipes
+the pending volumes one at a time, throttled to the configured bandwidth
+and write rate, and then removes them.  Volumes left pending when the
+service stops are picked up again when it starts.
+"""
+
+import collections
+import time
+
+import eventlet
+
+from nova import flags
+from nova import log as logging
+
+
+LOG = logging.getLogger("nova.volume.reclaim")
+FLAGS = flags.FLAGS
+flags.DEFINE_boolean('volume_reclaim_in_background', True,
+                     'Wipe and remove deleted volumes in the background')
+flags.DEFINE_string('volume_reclaim_prefix', 'reclaim-',
+                    'Prefix of deleted volumes waiting to be wiped')
+flags.DEFINE_string('volume_clear', 'zero',
+                    'How to wipe deleted volumes: zero, discard or none.  '
+                    'Only use discard if discarded blocks read back as '
+                    'zeroes on the volume group\'s devices')
+flags.DEFINE_integer('volume_clear_bandwidth', 0,
+                     'MB/s to write when zeroing a deleted volume, 0 for '
+                     'no limit')
+flags.DEFINE_integer('volume_clear_iops', 0,
+                     'Writes per second when zeroing a deleted volume, 0 '
+                     'for no limit')
+flags.DEFINE_integer('volume_clear_block_size', 1024,
+                     'Size in KB of the writes used to zero deleted volumes')
+flags.DEFINE_integer('volume_clear_chunk_size', 64,
+                     'MB zeroed by each dd run, between which the wipe '
+                     'is throttled')
+flags.DEFINE_string('volume_clear_ionice', '-c3',
+                    'ionice options used to zero deleted volumes, empty '
+                    'to run at normal I/O priority')
+
+# NOTE: the throttle sleeps through this so tests can replace it without
+#       touching eventlet.sleep for everyone else.
+_sleep = eventlet.sleep
+
+
+class VolumeReclaimer(object):
+    """Wipes and removes the deleted volumes of a driver."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.queue = collections.deque()
+        self.current = None
+        self.counters = {'reclaimed': 0, 'reclaimed_mb': 0, 'failed': 0}
+        self._worker = None
+
+    def _path(self, lv_name):
+        return '/dev/%s/%s' % (FLAGS.volume_group, lv_name)
+
+    def _size_mb(self, size_in_g):
+        if int(size_in_g) == 0:
+            return 100
+        return int(size_in_g) * 1024
+
+    def start(self):
+        """Queues the volumes a previous run left pending."""
+        out, _err = self.driver._execute('lvs', '--noheadings', '--nosuffix',
+                                         '--units', 'm',
+                                         '-o', 'lv_name,lv_size',
+                                         FLAGS.volume_group,
+                                         run_as_root=True)
+        queued = set(item['name'] for item in self.queue)
+        for line in (out or '').splitlines():
+            fields = line.split()
+            if len(fields) != 2:
+                continue
+            lv_name, size_mb = fields
+            if (lv_name.startswith(FLAGS.volume_reclaim_prefix) and
+                    lv_name not in queued):
+                LOG.info(_("Resuming reclaim of %s"), lv_name)
+                self._enqueue(lv_name, int(float(size_mb)))
+
+    def reclaim(self, lv_name, size_in_g):
+        """Takes over a deleted volume and queues it to be wiped."""
+        pending_name = FLAGS.volume_reclaim_prefix + lv_name
+        self.driver._try_execute('lvrename', FLAGS.volume_group, lv_name,
+                                 pending_name, run_as_root=True)
+        self._enqueue(pending_name, self._size_mb(size_in_g))
+
+    def _enqueue(self, lv_name, size_mb):
+        self.queue.append({'name': lv_name,
+                           'size_mb': size_mb,
+                           'wiped_mb': 0})
+        if self._worker is None:
+            self._worker = eventlet.spawn(self._run)
+
+    def _run(self):
+        try:
+            while self.queue:
+                self.current = self.queue.popleft()
+                try:
+                    self._reclaim(self.current)
+                except Exception:
+                    # NOTE: the volume keeps its pending name, so it is
+                    #       retried when the service next starts.
+                    LOG.exception(_("Failed to reclaim %s"),
+                                  self.current['name'])
+                    self.counters['failed'] += 1
+                finally:
+                    self.current = None
+        finally:
+            self._worker = None
+
+    def _is_thin(self, lv_name):
+        out, _err = self.driver._execute('lvs', '--noheadings',
+                                         '-o', 'lv_attr',
+                                         '%s/%s' % (FLAGS.volume_group,
+                                                    lv_name),
+                                         run_as_root=True)
+        return bool(out) and out.strip().startswith('V')
+
+    def _reclaim(self, item):
+        lv_name = item['name']
+        start = time.time()
+        # NOTE: a thin pool zeroes blocks before handing them out again,
+        #       so removing a thin volume is enough.
+        if self._is_thin(lv_name) or FLAGS.volume_clear == 'none':
+            pass
+        elif FLAGS.volume_clear == 'discard':
+            self.driver._execute('blkdiscard', self._path(lv_name),
+                                 run_as_root=True)
+        else:
+            self._zero(item)
+        item['wiped_mb'] = item['size_mb']
+        self.driver._try_execute('lvremove', '-f',
+                                 '%s/%s' % (FLAGS.volume_group, lv_name),
+                                 run_as_root=True)
+        self.counters['reclaimed'] += 1
+        self.counters['reclaimed_mb'] += item['size_mb']
+        LOG.info(_("Reclaimed %(lv_name)s in %(secs).1fs") %
+                 {'lv_name': lv_name, 'secs': time.time() - start})
+
+    def _zero(self, item):
+        """Zeroes a volume a chunk at a time, at the configured rate."""
+        block_kb = FLAGS.volume_clear_block_size
+        blocks_per_mb = 1024.0 / block_kb
+        chunk_mb = max(FLAGS.volume_clear_chunk_size, 1)
+        ionice = []
+        if FLAGS.volume_clear_ionice:
+            ionice = ['ionice'] + FLAGS.volume_clear_ionice.split()
+        while item['wiped_mb'] < item['size_mb']:
+            count_mb = min(chunk_mb, item['size_mb'] - item['wiped_mb'])
+            blocks = int(count_mb * blocks_per_mb)
+            start = time.time()
+            command = ionice + ['dd', 'if=/dev/zero',
+                                'of=%s' % self._path(item['name']),
+                                'bs=%dK' % block_kb,
+                                'seek=%d' % int(item['wiped_mb'] *
+                                                blocks_per_mb),
+                                'count=%d' % blocks,
+                                'oflag=direct']
+            self.driver._execute(*command, run_as_root=True)
+            item['wiped_mb'] += count_mb
+
+            min_secs = 0
+            if FLAGS.volume_clear_bandwidth:
+                min_secs = float(count_mb) / FLAGS.volume_clear_bandwidth
+            if FLAGS.volume_clear_iops:
+                min_secs = max(min_secs,
+                               float(blocks) / FLAGS.volume_clear_iops)
+            _sleep(max(min_secs - (time.time() - start), 0))
+
+    def stats(self):
+        """Returns the queue depth and the progress of the current wipe."""
+        pending = list(self.queue)
+        if self.current:
+            pending.insert(0, self.current)
+        stats = dict(self.counters)
+        stats['queue_depth'] = len(pending)
+        stats['pending_mb'] = sum(item['size_mb'] - item['wiped_mb']
+                                  for item in pending)
+        stats['current'] = self.current and dict(self.current)
+        return stats
@@ -23,7 +23,11 @@ controller on the SAN hardware.  We expect to access it over SSH or some API.
 
 import os
 import paramiko
+import socket
+import time
 
+from eventlet import greenpool
+from eventlet import semaphore
 from xml.etree import ElementTree
 
 from nova import exception
@@ -48,6 +52,157 @@ flags.DEFINE_string('san_clustername', '',
                     'Cluster name to use for creating volumes')
 flags.DEFINE_integer('san_ssh_port', 22,
                     'SSH port to use with SAN')
+flags.DEFINE_integer('san_ssh_pool_size', 4,
+                     'Maximum number of SSH connections open to a SAN')
+flags.DEFINE_integer('san_ssh_keepalive', 30,
+                     'Seconds between keepalives on SSH connections to a '
+                     'SAN, 0 to disable')
+flags.DEFINE_integer('san_ssh_idle_timeout', 300,
+                     'Close SSH connections to a SAN idle for this long')
+flags.DEFINE_integer('san_ssh_retries', 1,
+                     'Times to retry a SAN command on a new connection '
+                     'when the SSH channel breaks')
+
+
+class SSHPool(object):
+    """A bounded pool of SSH connections to one SAN controller.
+
+    Connections are checked when they are taken from the pool: ones whose
+    transport has died or that have been idle for longer than idle_timeout
+    are closed and replaced by new ones.
+    """
+
+    def __init__(self, connect, max_size, idle_timeout=None, keepalive=None,
+                 retries=0):
+        self.connect = connect
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.retries = retries
+        self._free = []
+        self._last_used = {}
+        self._in_use = 0
+        self._slots = semaphore.Semaphore(max_size)
+        self.counters = {'requests': 0,
+                         'created': 0,
+                         'evicted': 0,
+                         'broken': 0,
+                         'retries': 0}
+
+    def _create(self):
+        ssh = self.connect()
+        if self.keepalive:
+            ssh.get_transport().set_keepalive(self.keepalive)
+        self.counters['created'] += 1
+        return ssh
+
+    def _is_usable(self, ssh, now):
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if not self.idle_timeout:
+            return True
+        return now - self._last_used.get(ssh, now) < self.idle_timeout
+
+    def _close(self, ssh):
+        self._last_used.pop(ssh, None)
+        try:
+            ssh.close()
+        except Exception:
+            pass
+
+    def get(self):
+        """Returns a connection, blocking while all of them are in use."""
+        self._slots.acquire()
+        self.counters['requests'] += 1
+        now = time.time()
+        # The most recently used connections are at the end
+        while self._free:
+            ssh = self._free.pop()
+            if self._is_usable(ssh, now):
+                self._in_use += 1
+                return ssh
+            self.counters['evicted'] += 1
+            self._close(ssh)
+        try:
+            ssh = self._create()
+        except Exception:
+            self._slots.release()
+            raise
+        self._in_use += 1
+        return ssh
+
+    def put(self, ssh):
+        """Returns a connection obtained with get() to the pool."""
+        self._last_used[ssh] = time.time()
+        self._free.append(ssh)
+        self._in_use -= 1
+        self._slots.release()
+
+    def discard(self, ssh):
+        """Closes a connection obtained with get() instead of returning it."""
+        self._close(ssh)
+        self._in_use -= 1
+        self._slots.release()
+
+    def execute(self, command, check_exit_code=True):
+        """Runs a command on a pooled connection.
+
+        The command is retried on a new connection when the SSH channel
+        breaks, up to retries times.
+        """
+        attempt = 0
+        while True:
+            ssh = self.get()
+            try:
+                result = ssh_execute(ssh, command,
+                                     check_exit_code=check_exit_code)
+            except (paramiko.SSHException, socket.error, EOFError), exc:
+                self.discard(ssh)
+                self.counters['broken'] += 1
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.counters['retries'] += 1
+                LOG.warn(_("SSH channel broke running %(command)s, "
+                           "retrying: %(exc)s") % locals())
+                continue
+            except Exception:
+                self.put(ssh)
+                raise
+            self.put(ssh)
+            return result
+
+    def stats(self):
+        """Returns the pool size and hit-rate counters."""
+        stats = dict(self.counters)
+        stats['free'] = len(self._free)
+        stats['in_use'] = self._in_use
+        requests = stats['requests']
+        hits = requests - stats['created']
+        stats['hit_rate'] = float(hits) / requests if requests else 0.0
+        return stats
+
+
+_SSH_POOLS = {}
+
+
+def _get_ssh_pool(connect):
+    """Returns the SSH pool for the configured SAN, creating it if needed."""
+    endpoint = (FLAGS.san_ip, FLAGS.san_ssh_port, FLAGS.san_login)
+    pool = _SSH_POOLS.get(endpoint)
+    if pool is None:
+        pool = SSHPool(connect, FLAGS.san_ssh_pool_size,
+                       idle_timeout=FLAGS.san_ssh_idle_timeout,
+                       keepalive=FLAGS.san_ssh_keepalive,
+                       retries=FLAGS.san_ssh_retries)
+        _SSH_POOLS[endpoint] = pool
+    return pool
+
+
+def ssh_pool_stats():
+    """Returns the stats of the SSH pool of each SAN, by endpoint."""
+    return dict(('%s@%s:%s' % (login, ip, port), pool.stats())
+                for (ip, port, login), pool in _SSH_POOLS.iteritems())
 
 
 class SanISCSIDriver(ISCSIDriver):
@@ -83,15 +238,16 @@ class SanISCSIDriver(ISCSIDriver):
         return ssh
 
     def _run_ssh(self, command, check_exit_code=True):
-        #TODO(justinsb): SSH connection caching (?)
-        ssh = self._connect_to_ssh()
-
-        #TODO(justinsb): Reintroduce the retry hack
-        ret = ssh_execute(ssh, command, check_exit_code=check_exit_code)
+        pool = _get_ssh_pool(self._connect_to_ssh)
+        return pool.execute(command, check_exit_code=check_exit_code)
 
-        ssh.close()
+    def _run_concurrently(self, *calls):
+        """Runs (function, arg, ...) calls at once and returns their results.
 
-        return ret
+        Each call that runs SSH commands gets its own pooled connection.
+        """
+        pool = greenpool.GreenPool(FLAGS.san_ssh_pool_size)
+        return list(pool.imap(lambda call: call[0](*call[1:]), calls))
 
     def ensure_export(self, context, volume):
         """Synchronously recreates an export for a logical volume."""
@@ -282,21 +438,31 @@ class SolarisISCSIDriver(SanISCSIDriver):
         iscsi_name = self._build_iscsi_target_name(volume)
         target_group_name = 'tg-%s' % volume['name']
 
+        if force_create:
+            tg_exists = is_member = target_exists = view_exists = False
+        else:
+            (tg_exists, is_member, target_exists, view_exists) = \
+                self._run_concurrently(
+                    (self._target_group_exists, target_group_name),
+                    (self._is_target_group_member, target_group_name,
+                     iscsi_name),
+                    (self._iscsi_target_exists, iscsi_name),
+                    (self._view_exists, luid))
+
         # Create a iSCSI target, mapped to just this volume
-        if force_create or not self._target_group_exists(target_group_name):
+        if not tg_exists:
             self._run_ssh("pfexec /usr/sbin/stmfadm create-tg %s" %
                           (target_group_name))
 
         # Yes, we add the initiatior before we create it!
         # Otherwise, it complains that the target is already active
-        if force_create or not self._is_target_group_member(target_group_name,
-                                                            iscsi_name):
+        if not is_member:
             self._run_ssh("pfexec /usr/sbin/stmfadm add-tg-member -g %s %s" %
                           (target_group_name, iscsi_name))
-        if force_create or not self._iscsi_target_exists(iscsi_name):
+        if not target_exists:
             self._run_ssh("pfexec /usr/sbin/itadm create-target -n %s" %
                           (iscsi_name))
-        if force_create or not self._view_exists(luid):
+        if not view_exists:
             self._run_ssh("pfexec /usr/sbin/stmfadm add-view -t %s %s" %
                           (target_group_name, luid))
 
@@ -319,11 +485,18 @@ class SolarisISCSIDriver(SanISCSIDriver):
         iscsi_name = self._build_iscsi_target_name(volume)
         target_group_name = 'tg-%s' % volume['name']
 
-        if self._view_exists(luid):
+        (view_exists, target_exists, tg_exists, lu_created) = \
+            self._run_concurrently(
+                (self._view_exists, luid),
+                (self._iscsi_target_exists, iscsi_name),
+                (self._target_group_exists, target_group_name),
+                (self._is_lu_created, volume))
+
+        if view_exists:
             self._run_ssh("pfexec /usr/sbin/stmfadm remove-view -l %s -a" %
                           (luid))
 
-        if self._iscsi_target_exists(iscsi_name):
+        if target_exists:
             self._run_ssh("pfexec /usr/sbin/stmfadm offline-target %s" %
                           (iscsi_name))
             self._run_ssh("pfexec /usr/sbin/itadm delete-target %s" %
@@ -331,11 +504,11 @@ class SolarisISCSIDriver(SanISCSIDriver):
 
         # We don't delete the tg-member; we delete the whole tg!
 
-        if self._target_group_exists(target_group_name):
+        if tg_exists:
             self._run_ssh("pfexec /usr/sbin/stmfadm delete-tg %s" %
                           (target_group_name))
 
-        if self._is_lu_created(volume):
+        if lu_created:
             self._run_ssh("pfexec /usr/sbin/sbdadm delete-lu %s" %
                           (luid))
 
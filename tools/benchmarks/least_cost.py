@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark least_cost.weighted_sum() on a large synthetic fleet.
+
+Compares the old list-of-lists weighted sum and full sort with the
+column based scoring engine, both with and without NumPy, and with
+plain (scalar) cost functions versus vectorized ones.
+"""
+
+import gettext
+import optparse
+import os
+import random
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova.scheduler import least_cost
+from nova.scheduler import zone_manager
+
+
+def legacy_weighted_sum(weighted_fns, host_list, options):
+    """weighted_sum() as it was before the column based engine."""
+    scores = []
+    for weight, fn in weighted_fns:
+        scores.append([fn(host_info, options) for hostname, host_info
+                                                                in host_list])
+    adjusted_scores = []
+    for (weight, fn), row in zip(weighted_fns, scores):
+        adjusted_scores.append([weight * score for score in row])
+    final_scores = [0.0] * len(host_list)
+    for row in adjusted_scores:
+        for idx, col in enumerate(row):
+            final_scores[idx] += col
+    final_scores = [(final_scores[idx], host_tuple)
+                    for idx, host_tuple in enumerate(host_list)]
+    final_scores = sorted(final_scores)
+    weight, (host, hostinfo) = final_scores[0]
+    return least_cost.WeightedHost(weight, host=host, hostinfo=hostinfo)
+
+
+def scalar_fill_first(host_info, options=None):
+    return host_info.free_ram_mb
+
+
+def scalar_noop(host_info, options=None):
+    return 1
+
+
+def timed(fn, weighted_fns, host_list, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        weighted_host = fn(weighted_fns, host_list, {})
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, (weighted_host.host, weighted_host.weight)
+
+
+def main():
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("--hosts", type="int", default=10000,
+                      help="fleet size (default: %default)")
+    parser.add_option("--repeat", type="int", default=5,
+                      help="best of N runs (default: %default)")
+    parser.add_option("--seed", type="int", default=42)
+    options, args = parser.parse_args()
+
+    rand = random.Random(options.seed)
+    host_list = [('host%05d' % i, zone_manager.HostInfo('host%05d' % i,
+                      free_ram_mb=rand.randint(0, 65536),
+                      free_disk_gb=rand.randint(0, 2000)))
+                 for i in xrange(options.hosts)]
+
+    vectorized_fns = [(1.0, least_cost.compute_fill_first_cost_fn),
+                      (1.0, least_cost.noop_cost_fn)]
+    scalar_fns = [(1.0, scalar_fill_first), (1.0, scalar_noop)]
+
+    numpy = least_cost.numpy
+    runs = [("legacy", legacy_weighted_sum, scalar_fns, numpy),
+            ("columns, scalar fns", least_cost.weighted_sum, scalar_fns,
+             numpy),
+            ("columns, vectorized fns", least_cost.weighted_sum,
+             vectorized_fns, numpy),
+            ("columns, no numpy", least_cost.weighted_sum, vectorized_fns,
+             None)]
+
+    print "%d hosts, best of %d" % (options.hosts, options.repeat)
+    if not numpy:
+        print "NumPy is not installed, all column runs are scalar"
+    baseline = None
+    expected = None
+    for name, fn, weighted_fns, numpy_module in runs:
+        least_cost.numpy = numpy_module
+        try:
+            elapsed, result = timed(fn, weighted_fns, host_list,
+                                    options.repeat)
+        finally:
+            least_cost.numpy = numpy
+        if expected is None:
+            expected = result
+        elif result != expected:
+            print "%s picked %s, expected %s!" % (name, result, expected)
+            sys.exit(1)
+        if baseline is None:
+            baseline = elapsed
+        print "%-26s %10.2f ms %7.1fx" % (name, elapsed * 1000,
+                                          baseline / elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark rendering of the libvirt Cheetah templates.
+
+Renders the domain XML, injected network and CPU info templates for a
+typical instance, compiling the template source for every instance the
+way the libvirt driver used to, and with the compiled templates cached by
+nova.virt.libvirt.templates.
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova import flags
+from nova.virt import disk
+from nova.virt.libvirt import connection
+from nova.virt.libvirt import templates
+
+FLAGS = flags.FLAGS
+
+
+def _nic(i):
+    return {'id': '02163e0000%02x' % i,
+            'bridge_name': 'br100',
+            'mac_address': '02:16:3e:00:00:%02x' % i,
+            'ip_address': '10.0.0.%d' % (i + 2),
+            'dhcp_server': '10.0.0.1',
+            'extra_params': '<parameter name="PROJNET" value="10.0.0.0" />\n'
+                            '<parameter name="PROJMASK" '
+                            'value="255.255.255.0" />\n'}
+
+
+def domain_xml_info():
+    basepath = os.path.join(FLAGS.instances_path, 'instance-00000001')
+    return {'type': 'kvm',
+            'name': 'instance-00000001',
+            'basepath': basepath,
+            'memory_kb': 2048 * 1024,
+            'vcpus': 2,
+            'rescue': False,
+            'disk_prefix': 'vd',
+            'driver_type': 'qcow2',
+            'vif_type': 'bridge',
+            'nics': [_nic(i) for i in xrange(2)],
+            'ebs_root': False,
+            'local_device': 'vdb',
+            'volumes': [],
+            'use_virtio_for_bridges': True,
+            'ephemerals': [],
+            'root_device': 'vda',
+            'root_device_name': '/dev/vda',
+            'swap_device': 'vdc',
+            'kernel': basepath + '/kernel',
+            'ramdisk': basepath + '/ramdisk',
+            'disk': basepath + '/disk',
+            'vncserver_host': '127.0.0.1',
+            'vnc_keymap': 'en-us'}
+
+
+def network_info():
+    return {'interfaces': [{'name': 'eth%d' % i,
+                            'address': '10.0.0.%d' % (i + 2),
+                            'netmask': '255.255.255.0',
+                            'gateway': '10.0.0.1',
+                            'broadcast': '10.0.0.255',
+                            'dns': '8.8.8.8 8.8.4.4',
+                            'address_v6': None,
+                            'gateway_v6': None,
+                            'netmask_v6': None} for i in xrange(2)],
+            'use_ipv6': False}
+
+
+def cpu_info():
+    return {'arch': 'x86_64',
+            'model': 'Nehalem',
+            'vendor': 'Intel',
+            'topology': {'cores': '4', 'threads': '2', 'sockets': '2'},
+            'features': ['ssse3', 'sse4.1', 'sse4.2', 'popcnt']}
+
+
+def timed(fn, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("--repeat", type="int", default=200,
+                      help="best of N runs (default: %default)")
+    options, args = parser.parse_args()
+
+    # NOTE(sirp): Nova futzs with the sys.argv in order to provide default
+    # flagfile. To isolate this awful practice, we're supplying a dummy
+    # argument list.
+    FLAGS(["fakearg"])
+    templates.load_cheetah()
+
+    cases = [('libvirt.xml', FLAGS.libvirt_xml_template, domain_xml_info()),
+             ('interfaces', FLAGS.injected_network_template, network_info()),
+             ('cpuinfo.xml', FLAGS.cpuinfo_xml_template, cpu_info())]
+
+    print "%-14s %16s %16s %8s" % ("template", "compiled (us)",
+                                   "cached (us)", "speedup")
+    for name, path, search_list in cases:
+        source = open(path).read()
+        compiled, expected = timed(
+                lambda: str(templates.Template(source,
+                                               searchList=[search_list])),
+                options.repeat)
+        templates.render(path, [search_list])
+        cached, result = timed(
+                lambda: templates.render(path, [search_list]),
+                options.repeat)
+        if result != expected:
+            print "Rendering of %s differs!" % name
+            sys.exit(1)
+        print "%-14s %16.1f %16.1f %7.1fx" % (name, compiled * 1e6,
+                                              cached * 1e6,
+                                              compiled / cached)
+
+
+if __name__ == "__main__":
+    main()
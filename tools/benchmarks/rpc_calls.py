@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark rpc.call() throughput with the kombu driver.
+
+Compares declaring a reply queue per call with receiving all replies on
+the shared per-process reply queue.  Runs against kombu's in-memory
+transport unless --rabbit is given.
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from eventlet import greenpool
+
+from nova import context
+from nova import flags
+from nova.rpc import impl_kombu
+
+FLAGS = flags.FLAGS
+
+
+class Echo(object):
+    @staticmethod
+    def echo(context, value):
+        return value
+
+
+def run(ctxt, calls, concurrency):
+    def _call(value):
+        return impl_kombu.call(ctxt, 'rpc_benchmark',
+                               {'method': 'echo', 'args': {'value': value}})
+
+    pool = greenpool.GreenPool(concurrency)
+    start = time.time()
+    results = list(pool.imap(_call, xrange(calls)))
+    elapsed = time.time() - start
+    if results != range(calls):
+        print "Wrong replies!"
+        sys.exit(1)
+    return calls / elapsed
+
+
+def main():
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("--calls", type="int", default=2000,
+                      help="calls per run (default: %default)")
+    parser.add_option("--concurrency", type="int", action="append",
+                      help="concurrent callers, may be repeated "
+                           "(default: 1, 20)")
+    parser.add_option("--rabbit", action="store_true", default=False,
+                      help="use the configured rabbit server")
+    options, args = parser.parse_args()
+
+    # NOTE(sirp): Nova futzs with the sys.argv in order to provide default
+    # flagfile. To isolate this awful practice, we're supplying a dummy
+    # argument list.
+    FLAGS(["fakearg"])
+    FLAGS.fake_rabbit = not options.rabbit
+
+    ctxt = context.get_admin_context()
+    conn = impl_kombu.create_connection()
+    conn.create_consumer('rpc_benchmark', Echo())
+    conn.consume_in_thread()
+
+    print "%11s %16s %16s %8s" % ("concurrency", "per call (c/s)",
+                                  "shared (c/s)", "speedup")
+    for concurrency in options.concurrency or [1, 20]:
+        FLAGS.rpc_shared_reply_queue = False
+        per_call = run(ctxt, options.calls, concurrency)
+        FLAGS.rpc_shared_reply_queue = True
+        shared = run(ctxt, options.calls, concurrency)
+        print "%11d %16.1f %16.1f %7.1fx" % (concurrency, per_call, shared,
+                                             shared / per_call)
+
+    impl_kombu.cleanup()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
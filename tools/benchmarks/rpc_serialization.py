@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark encoding and decoding of RPC messages.
+
+Encodes representative scheduler and compute messages with every codec
+registered with kombu that the kombu driver can use, and reports the
+encoded size and the time taken to encode and decode each message.
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+import kombu.serialization
+
+from nova import context
+from nova import flags
+from nova import utils
+from nova.rpc import impl_kombu
+
+FLAGS = flags.FLAGS
+
+CODECS = ['json', 'msgpack']
+
+
+def _instance(i):
+    return {'id': i,
+            'uuid': str(utils.gen_uuid()),
+            'name': 'instance-%08x' % i,
+            'display_name': 'server %d' % i,
+            'hostname': 'server-%d' % i,
+            'project_id': 'project',
+            'user_id': 'user',
+            'image_ref': str(utils.gen_uuid()),
+            'kernel_id': 'aki-00000001',
+            'ramdisk_id': 'ari-00000001',
+            'instance_type_id': 2,
+            'memory_mb': 2048,
+            'vcpus': 1,
+            'local_gb': 20,
+            'vm_state': 'building',
+            'task_state': 'scheduling',
+            'power_state': 0,
+            'launch_index': i,
+            'reservation_id': 'r-abcdef12',
+            'availability_zone': 'nova',
+            'created_at': utils.strtime(),
+            'metadata': {'role': 'webserver', 'tier': 'frontend'}}
+
+
+def _image():
+    properties = dict(('property_%d' % i, 'value %d' % i)
+                      for i in xrange(20))
+    properties.update({'kernel_id': 'aki-00000001',
+                       'ramdisk_id': 'ari-00000001',
+                       'architecture': 'x86_64'})
+    return {'id': str(utils.gen_uuid()),
+            'name': 'ubuntu-11.10-server-amd64',
+            'status': 'active',
+            'container_format': 'ami',
+            'disk_format': 'ami',
+            'size': 1476395008,
+            'checksum': 'f' * 32,
+            'created_at': utils.strtime(),
+            'properties': properties}
+
+
+def messages():
+    """Return (name, message) pairs for typical RPC traffic."""
+    instance_type = {'id': 2, 'name': 'm1.small', 'memory_mb': 2048,
+                     'vcpus': 1, 'local_gb': 20, 'flavorid': 2,
+                     'swap': 0, 'rxtx_quota': 0, 'rxtx_cap': 0}
+    request_spec = {'num_instances': 10,
+                    'image': _image(),
+                    'instance_type': instance_type,
+                    'instance_properties': _instance(0),
+                    'filter': None,
+                    'blob': None}
+    run_instance = {'method': 'run_instance',
+                    'args': {'topic': 'compute',
+                             'request_spec': request_spec,
+                             'admin_password': None,
+                             'injected_files': [],
+                             'requested_networks': None}}
+    capabilities = {'host_memory_total': 68719476736,
+                    'host_memory_free': 34359738368,
+                    'disk_total': 2199023255552,
+                    'disk_used': 549755813888,
+                    'hypervisor_type': 'QEMU',
+                    'hypervisor_version': 13001,
+                    'cpu_info': {'arch': 'x86_64',
+                                 'model': 'Nehalem',
+                                 'vendor': 'Intel',
+                                 'features': ['ssse3', 'sse4.1', 'sse4.2',
+                                              'popcnt'],
+                                 'topology': {'cores': 4,
+                                              'threads': 2,
+                                              'sockets': 2}}}
+    update_service_capabilities = {'method': 'update_service_capabilities',
+                                   'args': {'service_name': 'compute',
+                                            'host': 'compute-042',
+                                            'capabilities': capabilities}}
+    instances = {'result': [_instance(i) for i in xrange(50)],
+                 'failure': None}
+    return [('run_instance', run_instance),
+            ('update_capabilities', update_service_capabilities),
+            ('reply: 50 instances', instances)]
+
+
+def timed(fn, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("--repeat", type="int", default=1000,
+                      help="best of N runs (default: %default)")
+    options, args = parser.parse_args()
+
+    # NOTE(sirp): Nova futzs with the sys.argv in order to provide default
+    # flagfile. To isolate this awful practice, we're supplying a dummy
+    # argument list.
+    FLAGS(["fakearg"])
+
+    registry = kombu.serialization.registry
+    codecs = [codec for codec in CODECS if codec in registry._encoders]
+    missing = set(CODECS) - set(codecs)
+    if missing:
+        print "Not installed: %s" % ', '.join(sorted(missing))
+
+    ctxt = context.get_admin_context()
+    print "%-22s %-8s %8s %12s %12s" % ("message", "codec", "bytes",
+                                        "encode (us)", "decode (us)")
+    for name, msg in messages():
+        for codec in codecs:
+            FLAGS.rpc_serializer = codec
+            packed = dict(msg)
+            impl_kombu._pack_context(packed, ctxt)
+            encode, (content_type, encoding, data) = timed(
+                    lambda: registry.encode(packed, serializer=codec),
+                    options.repeat)
+            decode, result = timed(
+                    lambda: registry.decode(data, content_type, encoding),
+                    options.repeat)
+            print "%-22s %-8s %8d %12.1f %12.1f" % (name, codec, len(data),
+                                                    encode * 1e6,
+                                                    decode * 1e6)
+
+
+if __name__ == "__main__":
+    main()